@@ -1,16 +1,90 @@
-from fastapi import FastAPI, Request, Form, File, UploadFile
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartParser
 import uvicorn
-import json
-import os
-import shutil
-from src.constants import APP_HOST, APP_PORT
-from src.pipline.prediction_pipeline import APSSensorDataFrame
-from src.pipline.prediction_pipeline import APSSensorPredictor
+import time
+import argparse
+from contextlib import asynccontextmanager
+from src.constants import APP_HOST, APP_PORT, APP_WORKERS, APP_WORKER_MAX_REQUESTS
+from src.pipline.prediction_pipeline import APSSensorModelHolder
+from src.pipline.prediction_pipeline import APSSensorModelWatcher, APSSensorPredictor
+from src.pipline.micro_batching import APSSensorMicroBatcher
+from src.pipline.inference_executor import BoundedInferenceExecutor, parse_payload, predict_batch
+from src.pipline.inference_executor import NPY_CONTENT_TYPE, ARROW_STREAM_CONTENT_TYPE
+from src.pipline.prefork_server import PreforkServer
+from src.pipline.degraded_inference import InferenceDepthController
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.pipline.admission_control import AdmissionController, ServiceOverloaded, DeadlineExceeded, RequestDeadline
+from src.metrics import REGISTRY, UPLOAD_READ_SECONDS
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and warm up the production model once, before the app starts accepting requests.
+    # Prefork workers inherit the model from the master and only need the warm-up
+    predictor_config = APSSensorPredictorConfig()
+    if APSSensorModelHolder.resident is None:
+        APSSensorModelHolder.load(predictor_config)
+    else:
+        APSSensorModelHolder.warm_up(APSSensorModelHolder.resident.model, predictor_config)
+    watcher = None
+    # A model served from local disk (APS_LOCAL_MODEL_PATH) has no s3 key to poll. Prefork workers
+    # start none either: the master polls and replaces them with workers holding the new model
+    if predictor_config.hot_reload_enabled and not predictor_config.local_model_path and not PreforkServer.in_worker:
+        watcher = APSSensorModelWatcher(predictor_config)
+        watcher.start()
+    app.state.admission = AdmissionController()
+    app.state.inference_executor = BoundedInferenceExecutor()
+    app.state.micro_batcher = None
+    app.state.depth_controller = InferenceDepthController(inference_queue_depth, predictor_config)
+    if predictor_config.micro_batch_enabled:
+        app.state.micro_batcher = APSSensorMicroBatcher(app.state.inference_executor, predictor_config,
+                                                        depth_controller=app.state.depth_controller)
+        await app.state.micro_batcher.start()
+    yield
+    if app.state.micro_batcher is not None:
+        await app.state.micro_batcher.stop()
+    app.state.inference_executor.shutdown()
+    if watcher is not None:
+        watcher.stop()
+    if APSSensorPredictor.prediction_log is not None:
+        APSSensorPredictor.prediction_log.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def inference_queue_depth() -> int:
+    # Jobs waiting for an inference worker plus requests waiting for the next micro-batch
+    depth = app.state.inference_executor.queue_depth if hasattr(app.state, "inference_executor") else 0
+    return depth + (app.state.micro_batcher.queue_depth if getattr(app.state, "micro_batcher", None) else 0)
+
+
+REGISTRY.gauge("aps_inference_queue_depth", "Jobs waiting for an inference worker",
+               function=lambda: app.state.inference_executor.queue_depth if hasattr(app.state, "inference_executor") else 0)
+REGISTRY.gauge("aps_micro_batch_queue_depth", "Requests waiting for the next micro-batch",
+               function=lambda: app.state.micro_batcher.queue_depth if getattr(app.state, "micro_batcher", None) else 0)
+REGISTRY.gauge("aps_prediction_log_pending_batches", "Scored batches waiting for the prediction log writer",
+               function=lambda: APSSensorPredictor.prediction_log.pending_batches if APSSensorPredictor.prediction_log else 0)
+REGISTRY.gauge("aps_inference_degraded", "1 while predictions are scored with a truncated ensemble",
+               function=lambda: int(app.state.depth_controller.degraded) if hasattr(app.state, "depth_controller") else 0)
+
+
+def prediction_cache_stat(name: str) -> int:
+    return APSSensorPredictor.prediction_cache.stats()[name] if APSSensorPredictor.prediction_cache else 0
+
+
+REGISTRY.gauge("aps_prediction_cache_hits", "Rows served from the prediction cache",
+               function=lambda: prediction_cache_stat("hits"))
+REGISTRY.gauge("aps_prediction_cache_misses", "Rows the prediction cache did not have, scored by the model",
+               function=lambda: prediction_cache_stat("misses"))
+REGISTRY.gauge("aps_prediction_cache_evictions", "Prediction cache entries evicted to stay within its size",
+               function=lambda: prediction_cache_stat("evictions"))
+REGISTRY.gauge("aps_prediction_cache_size", "Rows currently held by the prediction cache",
+               function=lambda: prediction_cache_stat("size"))
 
 # Mount the static directory
 app.mount("/static", StaticFiles(directory="web_app/static"), name="static")
@@ -24,35 +98,155 @@ async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
-@app.post("/predict", response_class=HTMLResponse)
-async def predict(request: Request, file: UploadFile = File(...)):
+def wants_json(request: Request) -> bool:
+    # API clients opt out of the result.html rendering with ?format=json or an Accept: application/json header
+    return request.query_params.get("format") == "json" or "application/json" in request.headers.get("accept", "")
+
+
+def upload_content_type(file: UploadFile) -> str:
+    # Browsers upload .npy/.arrow files as application/octet-stream, so fall back to the extension
+    filename = (file.filename or "").lower()
+    if filename.endswith(".npy"):
+        return NPY_CONTENT_TYPE
+    if filename.endswith((".arrow", ".arrows")):
+        return ARROW_STREAM_CONTENT_TYPE
+    return file.content_type
+
+
+async def drop_if_disconnected(request: Request) -> None:
+    # The client gave up, e.g. hit its own timeout, so nobody would read the prediction
+    if await request.is_disconnected():
+        RequestDeadline.drop("client_disconnected")
+
+
+async def stream_body(request: Request, deadline: RequestDeadline):
+    # Yields the request body as it arrives, giving up as soon as the deadline passes mid-upload
+    async for chunk in request.stream():
+        deadline.check("upload_read")
+        yield chunk
+
+
+async def read_body(request: Request, deadline: RequestDeadline) -> bytes:
+    return b"".join([chunk async for chunk in stream_body(request, deadline)])
+
+
+async def read_upload(request: Request, deadline: RequestDeadline) -> tuple:
+    """
+    Reads the uploaded file of a multipart form, or the raw body of any other request.
+    Called inside admission, so the upload counts against the request's deadline.
+    :return: (contents, content type)
+    """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        return await read_body(request, deadline), content_type
+    form = await MultiPartParser(request.headers, stream_body(request, deadline)).parse()
     try:
-        # Save the uploaded file to a temporary file
-        file_path = f"temp_{file.filename}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise ValueError("No file uploaded")
+        return await file.read(), upload_content_type(file)
+    finally:
+        await form.close()
 
-        # Load the JSON data from the file
-        with open(file_path, "r") as json_file:
-            dictionary = json.load(json_file)
 
-        # Clean up the temporary file
-        os.remove(file_path)
+def overloaded_headers(error: ServiceOverloaded) -> dict:
+    return {"Retry-After": str(error.retry_after_seconds)}
 
-        # Create a DataFrame from the dictionary
-        obj = APSSensorDataFrame(dictionary=dictionary)
-        input_df = obj.final_input_data()
 
-        # Make a prediction
-        obj2 = APSSensorPredictor()
-        prediction_result = obj2.predict(input_df)
-        prediction = "No" if prediction_result == 0 else "Yes"
+@app.post("/predict", response_class=HTMLResponse)
+async def predict(request: Request):
+    request_started = time.perf_counter()
+    try:
+        # The upload is only read once the request is admitted, and its deadline covers the upload
+        async with request.app.state.admission.admit(request.headers) as deadline:
+            # Parse the upload into the feature matrix on the inference pool, off the event loop
+            inference_executor = request.app.state.inference_executor
+            with UPLOAD_READ_SECONDS.time():
+                contents, content_type = await read_upload(request, deadline)
+            deadline.check("upload_read")
+            # Parse and score with the same model, even if a hot swap lands in between
+            resident = APSSensorModelHolder.get_resident()
+            features = await inference_executor.run(parse_payload, contents, content_type, resident,
+                                                    deadline=deadline)
+            await drop_if_disconnected(request)
+
+            # Make a prediction, coalesced with concurrent requests when micro-batching is enabled
+            micro_batcher = request.app.state.micro_batcher
+            depth_controller = request.app.state.depth_controller
+            if micro_batcher is not None:
+                prediction_result = await micro_batcher.predict(features, deadline=deadline, resident=resident)
+            else:
+                prediction_result = await inference_executor.run(predict_batch, features, depth_controller.n_trees(),
+                                                                  resident, deadline=deadline)
+            depth_controller.observe_latency(time.perf_counter() - request_started)
+        prediction = "Yes" if "pos" in prediction_result["class"] else "No"
 
+        if wants_json(request):
+            return JSONResponse({"prediction": prediction, **prediction_result})
         return templates.TemplateResponse("result.html", {"request": request, "prediction": prediction})
 
+    except ServiceOverloaded as e:
+        if wants_json(request):
+            return JSONResponse({"error": str(e)}, status_code=503, headers=overloaded_headers(e))
+        return templates.TemplateResponse("result.html", {"request": request, "error": str(e)},
+                                          status_code=503, headers=overloaded_headers(e))
+
+    except DeadlineExceeded as e:
+        if wants_json(request):
+            return JSONResponse({"error": str(e)}, status_code=504)
+        return templates.TemplateResponse("result.html", {"request": request, "error": str(e)}, status_code=504)
+
     except Exception as e:
+        if wants_json(request):
+            return JSONResponse({"error": str(e)}, status_code=400)
         return templates.TemplateResponse("result.html", {"request": request, "error": str(e)})
 
 
+@app.post("/api/v1/predict/batch")
+async def batch_predict(request: Request):
+    request_started = time.perf_counter()
+    try:
+        async with request.app.state.admission.admit(request.headers) as deadline:
+            # Columnar JSON payload: {"aa_000": [..], "ab_000": [..], ...}, one list entry per truck,
+            # or a binary application/x-npy matrix / application/vnd.apache.arrow.stream table
+            inference_executor = request.app.state.inference_executor
+            with UPLOAD_READ_SECONDS.time():
+                contents = await read_body(request, deadline)
+            deadline.check("upload_read")
+            # Parse and score with the same model, even if a hot swap lands in between
+            resident = APSSensorModelHolder.get_resident()
+            features = await inference_executor.run(parse_payload, contents, request.headers.get("content-type"), resident,
+                                                    deadline=deadline)
+            await drop_if_disconnected(request)
+            depth_controller = request.app.state.depth_controller
+            prediction_result = await inference_executor.run(predict_batch, features, depth_controller.n_trees(),
+                                                              resident, deadline=deadline)
+            depth_controller.observe_latency(time.perf_counter() - request_started)
+            return JSONResponse(prediction_result)
+
+    except ServiceOverloaded as e:
+        return JSONResponse({"error": str(e)}, status_code=503, headers=overloaded_headers(e))
+
+    except DeadlineExceeded as e:
+        return JSONResponse({"error": str(e)}, status_code=504)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+
+@app.get("/metrics")
+async def metrics():
+    # A prefork worker only counts the requests it handled, so it renders the sum over all workers
+    body = PreforkServer.metrics.render() if PreforkServer.in_worker else REGISTRY.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host=APP_HOST, port=APP_PORT)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=APP_WORKERS)
+    parser.add_argument("--max-requests", type=int, default=APP_WORKER_MAX_REQUESTS)
+    args = parser.parse_args()
+    if args.workers > 1:
+        PreforkServer(app, host=APP_HOST, port=APP_PORT, workers=args.workers, max_requests=args.max_requests).run()
+    else:
+        uvicorn.run(app, host=APP_HOST, port=APP_PORT)
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""
+Load test and latency benchmark for the prediction service.
+
+Replays the payloads in "Application test data/Input data", plus synthetic rows generated from
+config/schema.yaml, at every combination of --concurrency and --batch-sizes, checks the replayed
+rows against "Application test data/Output data" and prints throughput and latency percentiles as JSON.
+
+    # app.py started in this process, serving a local model file (no s3 access needed)
+    python benchmark.py --model-file model.pkl --concurrency 1 8 32 --batch-sizes 1 16 128
+
+    # a service that is already running
+    python benchmark.py --url http://localhost:5000 --endpoint predict
+
+The in-process target shares the interpreter with the load generator, so use it to catch
+regressions and --url against a separately deployed service to size instances.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import http.client
+from glob import glob
+from urllib.parse import urlsplit
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUT_DATA_DIR = os.path.join(ROOT_DIR, "Application test data", "Input data")
+OUTPUT_DATA_DIR = os.path.join(ROOT_DIR, "Application test data", "Output data")
+ENDPOINT_PATHS = {"batch": "/api/v1/predict/batch", "predict": "/predict?format=json"}
+MULTIPART_BOUNDARY = "aps-benchmark-boundary"
+
+
+def load_replay_rows() -> list:
+    """
+    :return: (row, expected class) for every row of every file in the Input data folder
+    """
+    from src.utils.main_utils import load_json_payload
+
+    rows = []
+    for input_file in sorted(glob(os.path.join(INPUT_DATA_DIR, "*.json"))):
+        with open(input_file, "rb") as file_obj:
+            payload = load_json_payload(file_obj.read())
+        expected = [None] * len(next(iter(payload.values())))
+        output_file = os.path.join(OUTPUT_DATA_DIR, os.path.basename(input_file))
+        if os.path.exists(output_file):
+            with open(output_file, "rb") as file_obj:
+                expected = load_json_payload(file_obj.read())["class"]
+        for i, label in enumerate(expected):
+            rows.append(({column: values[i] for column, values in payload.items()}, label))
+    return rows
+
+
+def make_synthetic_rows(n_rows: int, seed: int, missing_rate: float = 0.1) -> list:
+    """
+    :return: n_rows random rows over the schema's feature columns, with no expected class
+    """
+    from src.constants import schema_folder_name, schema_file_name
+    from src.entity.schema import load_compiled_schema
+
+    schema = load_compiled_schema(os.path.join(ROOT_DIR, schema_folder_name, schema_file_name))
+    rng = np.random.default_rng(seed)
+    # The APS counters are non-negative and heavy tailed
+    values = np.round(rng.lognormal(mean=4.0, sigma=3.0, size=(n_rows, len(schema.feature_columns))))
+    values[rng.random(values.shape) < missing_rate] = np.nan
+    return [
+        ({column: (None if np.isnan(value) else float(value)) for column, value in zip(schema.feature_columns, row)}, None)
+        for row in values
+    ]
+
+
+def build_payloads(rows: list, batch_size: int, endpoint: str, max_payloads: int) -> list:
+    """
+    Packs the rows, round robin, into dict-of-lists request bodies of batch_size rows each
+    :return: (body, content type, expected classes) per request
+    """
+    n_payloads = max(1, min(max_payloads, len(rows) // batch_size or 1))
+    payloads = []
+    for p in range(n_payloads):
+        batch = [rows[(p * batch_size + i) % len(rows)] for i in range(batch_size)]
+        columns = {}
+        for row, _ in batch:
+            for column, value in row.items():
+                columns.setdefault(column, []).append(value)
+        body = json.dumps(columns).encode()
+        content_type = "application/json"
+        if endpoint == "predict":
+            body = (
+                f"--{MULTIPART_BOUNDARY}\r\n"
+                'Content-Disposition: form-data; name="file"; filename="payload.json"\r\n'
+                "Content-Type: application/json\r\n\r\n"
+            ).encode() + body + f"\r\n--{MULTIPART_BOUNDARY}--\r\n".encode()
+            content_type = f"multipart/form-data; boundary={MULTIPART_BOUNDARY}"
+        payloads.append((body, content_type, [label for _, label in batch]))
+    return payloads
+
+
+def run_scenario(url: str, endpoint: str, payloads: list, concurrency: int, n_requests: int,
+                 n_warmup: int, timeout: float) -> dict:
+    """
+    Sends n_requests (after n_warmup untimed ones) from `concurrency` threads, each on its own keep-alive connection
+    """
+    target = urlsplit(url)
+    path = ENDPOINT_PATHS[endpoint]
+    next_request = iter(range(n_warmup + n_requests))
+    request_lock = threading.Lock()
+    latencies, errors, mismatches, checked_rows, rows = [], [], [0], [0], [0]
+    model_versions = set()
+    results_lock = threading.Lock()
+    started = [None]
+
+    def worker():
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=timeout)
+        while True:
+            with request_lock:
+                i = next(next_request, None)
+                if i == n_warmup and started[0] is None:
+                    started[0] = time.perf_counter()
+            if i is None:
+                break
+            body, content_type, expected = payloads[i % len(payloads)]
+            request_started = time.perf_counter()
+            try:
+                connection.request("POST", path, body=body, headers={"Content-Type": content_type, "Accept": "application/json"})
+                response = connection.getresponse()
+                response_body = response.read()
+                latency = time.perf_counter() - request_started
+                result = json.loads(response_body)
+                if response.status != 200 or "error" in result:
+                    raise RuntimeError(f"HTTP {response.status}: {result.get('error', response_body[:200])}")
+            except Exception as e:
+                connection.close()
+                connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=timeout)
+                if i >= n_warmup:
+                    with results_lock:
+                        errors.append(str(e))
+                continue
+            if i < n_warmup:
+                continue
+            wrong = sum(1 for label, got in zip(expected, result["class"]) if label is not None and label != got)
+            with results_lock:
+                latencies.append(latency)
+                rows[0] += len(expected)
+                checked_rows[0] += sum(1 for label in expected if label is not None)
+                mismatches[0] += wrong
+                if "model_version" in result:
+                    model_versions.add(result["model_version"])
+        connection.close()
+
+    threads = [threading.Thread(target=worker, name=f"benchmark-client-{c}") for c in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - (started[0] or time.perf_counter())
+
+    latencies_ms = np.array(latencies) * 1000.0
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]) if latencies else (None, None, None)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "batch_size": len(payloads[0][2]),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "rows": rows[0],
+        "duration_seconds": round(duration, 4),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else None,
+        "rows_per_second": round(rows[0] / duration, 2) if duration else None,
+        "latency_ms": {
+            "p50": None if p50 is None else round(float(p50), 3),
+            "p95": None if p95 is None else round(float(p95), 3),
+            "p99": None if p99 is None else round(float(p99), 3),
+            "mean": round(float(latencies_ms.mean()), 3) if latencies else None,
+            "max": round(float(latencies_ms.max()), 3) if latencies else None,
+        },
+        "checked_rows": checked_rows[0],
+        "mismatches": mismatches[0],
+        "model_versions": sorted(model_versions),
+    }
+
+
+def start_in_process_server(model_file: str):
+    """
+    Serves app.py from a background thread on a free local port, with the model read from model_file
+    :return: (server url, uvicorn server, server thread)
+    """
+    # Must be set before app.py imports the predictor config, so every inference worker sees it
+    from src.constants import LOCAL_MODEL_PATH_ENV_KEY
+    os.environ[LOCAL_MODEL_PATH_ENV_KEY] = os.path.abspath(model_file)
+    # app.py resolves web_app/ and config/ relative to the project root
+    os.chdir(ROOT_DIR)
+    import uvicorn
+    from app import app
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="benchmark-server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("The in-process prediction service failed to start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server, thread
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test and latency benchmark for the prediction service")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base url of a running prediction service")
+    target.add_argument("--model-file", help="Local model.pkl to serve from an in-process app.py")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINT_PATHS), default="batch")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--requests", type=int, default=500, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per scenario")
+    parser.add_argument("--synthetic-rows", type=int, default=1000, help="Rows generated from config/schema.yaml")
+    parser.add_argument("--max-payloads", type=int, default=64, help="Distinct request bodies per batch size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    server = thread = None
+    url = args.url
+    if args.model_file:
+        url, server, thread = start_in_process_server(args.model_file)
+
+    try:
+        rows = load_replay_rows() + make_synthetic_rows(args.synthetic_rows, args.seed)
+        scenarios = []
+        for batch_size in args.batch_sizes:
+            payloads = build_payloads(rows, batch_size, args.endpoint, args.max_payloads)
+            for concurrency in args.concurrency:
+                scenario = run_scenario(url, args.endpoint, payloads, concurrency, args.requests, args.warmup, args.timeout)
+                scenarios.append(scenario)
+                print(f"batch_size={batch_size} concurrency={concurrency}: {scenario['throughput_rps']} req/s, "
+                      f"p99 {scenario['latency_ms']['p99']} ms", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join()
+
+    report = {
+        "target": args.url or "in-process",
+        "model_file": args.model_file,
+        "replay_rows": sum(1 for _, label in rows if label is not None),
+        "synthetic_rows": args.synthetic_rows,
+        "scenarios": scenarios,
+    }
+    report_json = json.dumps(report, indent=2)
+    print(report_json)
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            file_obj.write(report_json)
+
+    # Non-zero exit when a replayed row no longer gets its expected class, or any request failed
+    failed = any(scenario["mismatches"] or scenario["errors"] for scenario in scenarios)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,10 @@
 import boto3
 from src.configuration.aws_connection import S3Client
 from io import StringIO
-from typing import Union,List
+from typing import Union,List,Tuple
 import os,sys
+import re
+import hashlib
 from src.logger import logging
 from mypy_boto3_s3.service_resource import Bucket
 from src.exception import MyException
@@ -44,6 +46,52 @@ class SimpleStorageService:
         except Exception as e:
             raise MyException(e, sys)
 
+    def get_object_version(self, bucket_name: str, s3_key: str) -> str:
+        """
+        Returns a cheap version tag for the specified S3 object using a HEAD request,
+        without downloading its content.
+
+        Args:
+            bucket_name (str): Name of the S3 bucket.
+            s3_key (str): Key path of the object.
+
+        Returns:
+            str: The object's ETag, or its LastModified timestamp when no ETag is returned.
+        """
+        try:
+            response = self.s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+            etag = response.get("ETag")
+            if etag:
+                return etag.strip('"')
+            return response["LastModified"].isoformat()
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def download_object(self, bucket_name: str, s3_key: str) -> Tuple[bytes, str]:
+        """
+        Downloads the full content of the specified S3 object and checks it against the
+        size and, for single-part uploads, the MD5 ETag reported by S3.
+
+        Args:
+            bucket_name (str): Name of the S3 bucket.
+            s3_key (str): Key path of the object.
+
+        Returns:
+            Tuple[bytes, str]: The object content and its ETag.
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+            content = response["Body"].read()
+            etag = response["ETag"].strip('"')
+            if len(content) != response["ContentLength"]:
+                raise Exception(f"Incomplete download of {s3_key}: {len(content)} of {response['ContentLength']} bytes")
+            # Multipart (and KMS encrypted) uploads do not have a plain MD5 ETag
+            if re.fullmatch(r"[0-9a-f]{32}", etag) and hashlib.md5(content).hexdigest() != etag:
+                raise Exception(f"Checksum mismatch while downloading {s3_key}")
+            return content, etag
+        except Exception as e:
+            raise MyException(e, sys) from e
+
     @staticmethod
     def read_object(object_name: str, decode: bool = True, make_readable: bool = False) -> Union[StringIO, str]:
         """
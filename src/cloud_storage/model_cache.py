@@ -0,0 +1,115 @@
+import os
+import sys
+import hashlib
+import tempfile
+from typing import Optional
+from src.logger import logging
+from src.exception import MyException
+from src.constants import MODEL_CACHE_DIR, MODEL_CACHE_MAX_BYTES
+
+
+class LocalModelCache:
+    """
+    A size-bounded on-disk cache of serialized models downloaded from S3, keyed by
+    bucket/key/ETag so a newly pushed model is never served from a stale entry.
+    """
+
+    def __init__(self, cache_dir: str = MODEL_CACHE_DIR, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+        """
+        Args:
+            cache_dir (str): Directory that holds the cached model files.
+            max_bytes (int): Total size the cache is trimmed to after every write.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def cache_path(self, bucket_name: str, s3_key: str, etag: str) -> str:
+        """
+        Returns the local file path of the cache entry for an S3 object version.
+        """
+        digest = hashlib.sha256(f"{bucket_name}/{s3_key}/{etag}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.model")
+
+    def get(self, bucket_name: str, s3_key: str, etag: str) -> Optional[bytes]:
+        """
+        Reads a cached model and verifies it against the SHA-256 recorded when it was written.
+
+        Returns:
+            Optional[bytes]: The cached content, or None on a miss or a corrupt entry.
+        """
+        try:
+            path = self.cache_path(bucket_name, s3_key, etag)
+            try:
+                with open(path, "rb") as file_obj:
+                    content = file_obj.read()
+                with open(path + ".sha256", "r") as checksum_file:
+                    expected_checksum = checksum_file.read().strip()
+            except FileNotFoundError:
+                return None
+            if hashlib.sha256(content).hexdigest() != expected_checksum:
+                logging.info(f"Discarding corrupt model cache entry {path}")
+                self._remove(path)
+                return None
+            # Refresh the access time used for least-recently-used eviction
+            os.utime(path)
+            logging.info(f"Model cache hit for s3://{bucket_name}/{s3_key} ({etag})")
+            return content
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def put(self, bucket_name: str, s3_key: str, etag: str, content: bytes) -> None:
+        """
+        Atomically writes a downloaded model into the cache and evicts old entries above max_bytes.
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self.cache_path(bucket_name, s3_key, etag)
+            # Checksum first, so a reader never sees a model file without its checksum
+            self._write_atomic(path + ".sha256", hashlib.sha256(content).hexdigest().encode())
+            self._write_atomic(path, content)
+            logging.info(f"Cached s3://{bucket_name}/{s3_key} ({etag}) at {path}")
+            self.evict(keep=path)
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def evict(self, keep: str = None) -> None:
+        """
+        Removes the least recently used entries until the cache fits in max_bytes.
+        """
+        try:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".model"):
+                    path = os.path.join(self.cache_dir, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                self._remove(path)
+                total -= size
+                logging.info(f"Evicted {path} from the model cache")
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def _write_atomic(self, path: str, content: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file_obj:
+                file_obj.write(content)
+                file_obj.flush()
+                os.fsync(file_obj.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        for file_path in (path, path + ".sha256"):
+            if os.path.exists(file_path):
+                os.remove(file_path)
@@ -1,17 +1,52 @@
 from src.exception import MyException
 import sys
 from src.entity.config_entity import DataIngestionConfig
+from src.constants import train_data_artifact_file, test_data_artifact_file
 from src.entity.artifact_entity import DataIngestionArtifact
 from src.logger import logging
 from src.data_access.proj1_data import Proj1Data
+from src.entity.schema import load_compiled_schema
+from src.utils.main_utils import save_dataframe, iter_dataframe, dataframe_parts, dataframe_file_format, DataFrameFileWriter
+from src.utils.artifact_writer import ArtifactWriter
+from src.utils.stage_cache import link_or_copy
 import os
+import itertools
+from datetime import datetime
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 
+# Rows are hashed into this many buckets per class, the first train_test_split_ratio of them go to test
+HASH_SPLIT_BUCKETS = 10000
+# Chunk size when appending to an earlier run's partitions without DATA_INGESTION_CHUNK_ROWS set
+APPEND_CHUNK_ROWS = 100000
+# Part files of a partition directory are named part-<timestamp>; the row keys of each part are kept
+# next to it in _keys-<timestamp>.npy, which dataset readers skip
+PART_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S_%f"
+
 class DataIngestion:
-    def __init__(self, data_ingestion_config: DataIngestionConfig):
+    def __init__(self, data_ingestion_config: DataIngestionConfig, artifact_writer: ArtifactWriter = None):
         try:
             self.data_ingestion_config = data_ingestion_config
+            self.artifact_writer = artifact_writer or ArtifactWriter()
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def input_files(self) -> list:
+        """
+        Files the ingested data is built from: the raw data, the schema and, when included,
+        the completed prediction log files and the recorded outcomes
+        """
+        try:
+            df_obj = Proj1Data()
+            files = [os.path.join(df_obj.raw_data_dir, df_obj.raw_data_file), self.data_ingestion_config.SCHEMA_FILE_PATH]
+            if self.data_ingestion_config.include_prediction_log:
+                for directory, extensions in ((self.data_ingestion_config.prediction_log_dir, (".parquet", ".arrow")),
+                                              (self.data_ingestion_config.prediction_outcome_dir, (".csv", ".parquet"))):
+                    if os.path.isdir(directory):
+                        files += [os.path.join(directory, file_name) for file_name in sorted(os.listdir(directory))
+                                  if file_name.endswith(extensions)]
+            return files
         except Exception as e:
             raise MyException(e,sys)
 
@@ -21,12 +56,20 @@ class DataIngestion:
             #Get data
             df_obj = Proj1Data()
             df = df_obj.get_data()
+            if self.data_ingestion_config.include_prediction_log:
+                log_df = df_obj.get_prediction_log_data(self.data_ingestion_config.prediction_log_dir,
+                                                        self.data_ingestion_config.prediction_outcome_dir)
+                if len(log_df):
+                    logging.info(f"Adding {len(log_df)} labelled rows from the prediction log")
+                    df = pd.concat([df, log_df.reindex(columns=df.columns)], ignore_index=True)
             logging.info("Completed the raw data fetching from local directory")
-            logging.info("Starting saving the raw data")
-            #save data
-            os.makedirs(self.data_ingestion_config.RAW_DATA_ARTIFACT_DIR, exist_ok=True)
-            df.to_csv(self.data_ingestion_config.RAW_DATA_ARTIFACT_FILE, index=False,header=True)
-            logging.info("Completed saving the raw data")
+            #Coerce the text columns once, so every artifact is stored with the schema's types
+            df = self.data_pre_processing(df)
+            if self.data_ingestion_config.persist_artifacts:
+                logging.info("Starting saving the raw data")
+                #save data
+                self.artifact_writer.submit(save_dataframe, self.data_ingestion_config.RAW_DATA_ARTIFACT_FILE, df)
+                logging.info("Completed saving the raw data")
             return df
         except Exception as e:
             raise MyException(e,sys)
@@ -34,17 +77,75 @@ class DataIngestion:
     def data_pre_processing(self, data):
         try:
             logging.info("Starting the data pre-processing")
+            dtypes = load_compiled_schema(self.data_ingestion_config.SCHEMA_FILE_PATH).dtypes
             for column in data.columns:
-                if column != 'class':
+                # Columns already read as numbers (typed artifacts, prediction log rows) are only cast
+                if column != 'class' and not pd.api.types.is_numeric_dtype(data[column]):
                     data[column] = pd.to_numeric(data[column], errors="coerce")
+            data = data.astype({column: dtype for column, dtype in dtypes.items() if column in data.columns})
             logging.info("Completed the data pre-processing")
             return data
         except Exception as e:
             raise MyException(e,sys)
 
+    def row_keys(self, data) -> np.ndarray:
+        """
+        Stable 64-bit hash of every row's key columns and class, the same in every run
+        """
+        try:
+            output_column = self.data_ingestion_config.OUTPUT_FEATURE_FOR_MODEL
+            key_columns = list(self.data_ingestion_config.split_key_columns) or [column for column in data.columns if column != output_column]
+            key = pd.DataFrame({column: self.canonical_key(data[column]) for column in key_columns + [output_column]})
+            return pd.util.hash_pandas_object(key, index=False).to_numpy()
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def hash_split_mask(self, data, keys: np.ndarray = None) -> np.ndarray:
+        """
+        True for the rows assigned to the test set. A row's bucket comes from its row key, which covers
+        its class, so each class is split on its own, and a row lands in the same partition in every
+        run, whichever chunk or process ingests it and whatever other rows arrive with it.
+        keys: row_keys(data), when already computed
+        """
+        try:
+            keys = self.row_keys(data) if keys is None else keys
+            return keys % HASH_SPLIT_BUCKETS < round(self.data_ingestion_config.train_test_split_ratio * HASH_SPLIT_BUCKETS)
+        except Exception as e:
+            raise MyException(e,sys)
+
+    @staticmethod
+    def new_rows(keys: np.ndarray, seen_keys: np.ndarray) -> tuple:
+        """
+        A hash split ingests every row key once, in every mode, so appending to earlier partitions
+        gives what a full re-ingestion would: True for the rows whose key is neither in seen_keys
+        nor on an earlier row.
+        :return: (mask of the new rows, seen_keys with their keys added)
+        """
+        _, first_rows = np.unique(keys, return_index=True)
+        is_new = np.zeros(len(keys), dtype=bool)
+        is_new[first_rows] = True
+        is_new &= ~np.isin(keys, seen_keys)
+        return is_new, np.union1d(seen_keys, keys[is_new])
+
+    @staticmethod
+    def canonical_key(values: pd.Series) -> pd.Series:
+        # float32 and float64 copies of a value, 0.0 and -0.0, and every NaN must hash the same
+        if pd.api.types.is_numeric_dtype(values):
+            return values.astype(np.float64).fillna(np.inf) + 0.0
+        return values.astype(str)
+
     def train_test_split(self, data):
         try:
             logging.info("Starting the train test split")
+            if self.data_ingestion_config.split_mode == "hash":
+                keys = self.row_keys(data)
+                is_new, _ = self.new_rows(keys, np.empty(0, dtype=np.uint64))
+                if not is_new.all():
+                    logging.info(f"Dropping {int((~is_new).sum())} duplicate rows")
+                    data, keys = data[is_new], keys[is_new]
+                is_test = self.hash_split_mask(data, keys)
+                logging.info("Completed the train test split")
+                return data[~is_test], data[is_test]
             train_set, test_set = train_test_split(
                 data, 
                 test_size=self.data_ingestion_config.train_test_split_ratio,
@@ -58,24 +159,229 @@ class DataIngestion:
         
     def store_train_test_data(self, train_set, test_set):
         try:
+            if not self.data_ingestion_config.persist_artifacts:
+                return None, None
             logging.info("Starting saving the train and test data")
-            os.makedirs(self.data_ingestion_config.PROCESSED_DATA_ARTIFACT_DIR, exist_ok=True)
-            train_set.to_csv(self.data_ingestion_config.TRAIN_DATA_ARTIFACT_FILE, index=False, header=True)
-            test_set.to_csv(self.data_ingestion_config.TEST_DATA_ARTIFACT_FILE, index=False, header=True)
+            train_file_path = self.artifact_writer.submit(save_dataframe, self.data_ingestion_config.TRAIN_DATA_ARTIFACT_FILE, train_set)
+            test_file_path = self.artifact_writer.submit(save_dataframe, self.data_ingestion_config.TEST_DATA_ARTIFACT_FILE, test_set)
             logging.info("Completed saving the train and test data")
-            return self.data_ingestion_config.TRAIN_DATA_ARTIFACT_FILE, self.data_ingestion_config.TEST_DATA_ARTIFACT_FILE
+            return train_file_path, test_file_path
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def split_chunk(self, chunk, split_counts: dict, rng, keys: np.ndarray = None):
+        """
+        Splits one chunk into train and test rows, per class, so that the test share of every class
+        stays within one row of train_test_split_ratio over all the chunks seen so far
+        split_counts: class -> (rows seen, rows sent to test), carried from chunk to chunk
+        keys: row_keys(chunk), when already computed for a hash split
+        """
+        try:
+            if self.data_ingestion_config.split_mode == "hash":
+                is_test = self.hash_split_mask(chunk, keys)
+                return chunk[~is_test], chunk[is_test]
+            is_test = np.zeros(len(chunk), dtype=bool)
+            groups = chunk.groupby(self.data_ingestion_config.OUTPUT_FEATURE_FOR_MODEL, observed=True).indices
+            for label, positions in groups.items():
+                seen, n_test = split_counts.get(label, (0, 0))
+                seen += len(positions)
+                take = min(max(round(seen * self.data_ingestion_config.train_test_split_ratio) - n_test, 0), len(positions))
+                is_test[rng.choice(positions, size=take, replace=False)] = True
+                split_counts[label] = (seen, n_test + take)
+            return chunk[~is_test], chunk[is_test]
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def raw_chunks(self, chunk_rows: int, dtypes: dict):
+        """
+        Yields the raw data, then the labelled prediction log rows when included, in DataFrames of at
+        most chunk_rows rows parsed straight into dtypes
+        """
+        try:
+            df_obj = Proj1Data()
+            chunks = df_obj.iter_data(chunk_rows, dtypes)
+            if self.data_ingestion_config.include_prediction_log:
+                log_chunks = df_obj.iter_prediction_log_data(self.data_ingestion_config.prediction_log_dir,
+                                                             self.data_ingestion_config.prediction_outcome_dir,
+                                                             chunk_rows)
+                chunks = itertools.chain(chunks, (log_df.reindex(columns=list(dtypes)).astype(dtypes) for log_df in log_chunks))
+            columns = None
+            for chunk in chunks:
+                # Prediction log rows come with the schema's column order, not the raw file's
+                columns = columns or list(chunk.columns)
+                yield chunk.reindex(columns=columns) if list(chunk.columns) != columns else chunk
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def chunk_dtypes(self) -> dict:
+        dtypes = dict(load_compiled_schema(self.data_ingestion_config.SCHEMA_FILE_PATH).dtypes)
+        dtypes[self.data_ingestion_config.OUTPUT_FEATURE_FOR_MODEL] = pd.CategoricalDtype(list(self.data_ingestion_config.output_classes))
+        return dtypes
+
+    def stream_data_ingestion(self):
+        """
+        Out-of-core ingestion: the raw data is parsed chunk_rows rows at a time, straight into the schema's
+        types with "na" read as missing, and every chunk is split and appended to the train and test files
+        before the next one is read. Peak memory is bounded by the chunk size, not the data size, apart from
+        the 8 byte row keys a hash split keeps to drop duplicate rows.
+        The train and test files are always written, they are the only output of this mode.
+        """
+        try:
+            chunk_rows = self.data_ingestion_config.chunk_rows
+            logging.info(f"Starting the streaming data ingestion, {chunk_rows} rows per chunk")
+            rng = np.random.default_rng(42)     # reproducibility
+            split_counts = {}
+            hash_split = self.data_ingestion_config.split_mode == "hash"
+            seen_keys = np.empty(0, dtype=np.uint64)
+            n_rows, n_skipped = 0, 0
+            raw_writer = DataFrameFileWriter(self.data_ingestion_config.RAW_DATA_ARTIFACT_FILE) if self.data_ingestion_config.persist_artifacts else None
+            try:
+                with DataFrameFileWriter(self.data_ingestion_config.TRAIN_DATA_ARTIFACT_FILE) as train_writer, \
+                        DataFrameFileWriter(self.data_ingestion_config.TEST_DATA_ARTIFACT_FILE) as test_writer:
+                    for chunk in self.raw_chunks(chunk_rows, self.chunk_dtypes()):
+                        if raw_writer is not None:
+                            raw_writer.write(chunk)
+                        keys = None
+                        if hash_split:
+                            keys = self.row_keys(chunk)
+                            is_new, seen_keys = self.new_rows(keys, seen_keys)
+                            n_skipped += int((~is_new).sum())
+                            chunk, keys = chunk[is_new], keys[is_new]
+                        train_chunk, test_chunk = self.split_chunk(chunk, split_counts, rng, keys)
+                        train_writer.write(train_chunk)
+                        test_writer.write(test_chunk)
+                        n_rows += len(chunk)
+            finally:
+                if raw_writer is not None:
+                    raw_writer.close()
+            if n_skipped:
+                logging.info(f"Dropped {n_skipped} duplicate rows")
+            logging.info(f"Completed the streaming data ingestion of {n_rows} rows, (rows, test rows) per class: {split_counts}")
+            return DataIngestionArtifact(
+                trained_file_path=self.data_ingestion_config.TRAIN_DATA_ARTIFACT_FILE,
+                test_file_path=self.data_ingestion_config.TEST_DATA_ARTIFACT_FILE
+                )
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def append_data_ingestion(self, base_artifact: DataIngestionArtifact):
+        """
+        Appends the raw data to the train and test partitions of an earlier run. This run's partitions are
+        directories: the earlier run's part files are hard linked into them, never copied or changed, and
+        only the rows that are not in them yet are hash-split and written, as one new part file each.
+        Rows are matched on their row key, so re-ingesting the same raw data or prediction log adds nothing;
+        exact duplicate rows are ingested once, as in every hash split ingestion (see new_rows).
+        """
+        try:
+            chunk_rows = self.data_ingestion_config.chunk_rows or APPEND_CHUNK_ROWS
+            logging.info(f"Starting the data ingestion appending to {base_artifact.trained_file_path} and {base_artifact.test_file_path}")
+            dtypes = self.chunk_dtypes()
+            train_dir = os.path.splitext(self.data_ingestion_config.TRAIN_DATA_ARTIFACT_FILE)[0]
+            test_dir = os.path.splitext(self.data_ingestion_config.TEST_DATA_ARTIFACT_FILE)[0]
+            extension = os.path.splitext(self.data_ingestion_config.TRAIN_DATA_ARTIFACT_FILE)[1]
+            seen_keys = np.unique(np.concatenate([
+                self.link_partition(base_artifact.trained_file_path, train_dir, chunk_rows, dtypes),
+                self.link_partition(base_artifact.test_file_path, test_dir, chunk_rows, dtypes),
+            ]))
+            logging.info(f"Linked the {len(seen_keys)} distinct rows of the earlier partitions")
+
+            part_name = datetime.now().strftime(PART_TIMESTAMP_FORMAT)
+            new_keys = {train_dir: [], test_dir: []}
+            n_rows, n_skipped = 0, 0
+            raw_writer = DataFrameFileWriter(self.data_ingestion_config.RAW_DATA_ARTIFACT_FILE) if self.data_ingestion_config.persist_artifacts else None
+            try:
+                with DataFrameFileWriter(os.path.join(train_dir, f"part-{part_name}{extension}")) as train_writer, \
+                        DataFrameFileWriter(os.path.join(test_dir, f"part-{part_name}{extension}")) as test_writer:
+                    for chunk in self.raw_chunks(chunk_rows, dtypes):
+                        if raw_writer is not None:
+                            raw_writer.write(chunk)
+                        keys = self.row_keys(chunk)
+                        is_new, seen_keys = self.new_rows(keys, seen_keys)
+                        n_skipped += int((~is_new).sum())
+                        chunk, keys = chunk[is_new], keys[is_new]
+                        is_test = self.hash_split_mask(chunk, keys)
+                        for writer, partition_dir, rows in ((train_writer, train_dir, ~is_test), (test_writer, test_dir, is_test)):
+                            if rows.any():
+                                writer.write(chunk[rows])
+                                new_keys[partition_dir].append(keys[rows])
+                        n_rows += len(chunk)
+            finally:
+                if raw_writer is not None:
+                    raw_writer.close()
+            for partition_dir, keys in new_keys.items():
+                if keys:
+                    np.save(os.path.join(partition_dir, f"_keys-{part_name}.npy"), np.concatenate(keys))
+            logging.info(f"Completed the data ingestion: appended {n_rows} new rows, skipped {n_skipped} rows already ingested or duplicated")
+            return DataIngestionArtifact(trained_file_path=train_dir, test_file_path=test_dir)
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def link_partition(self, base_path: str, partition_dir: str, chunk_rows: int, dtypes: dict) -> np.ndarray:
+        """
+        Hard links the part files of an earlier partition, a directory or a single file, into partition_dir
+        together with their row keys. Keys missing for a part are computed once and stored with the link.
+        :return: row keys of every linked row
+        """
+        try:
+            if dataframe_file_format(base_path) != dataframe_file_format(self.data_ingestion_config.TRAIN_DATA_ARTIFACT_FILE):
+                raise ValueError(f"{base_path} is not stored as {self.data_ingestion_config.TRAIN_DATA_ARTIFACT_FILE}")
+            if os.path.isdir(base_path):
+                parts = dataframe_parts(base_path)
+                part_names = [os.path.splitext(os.path.basename(part))[0][len("part-"):] for part in parts]
+            else:
+                # An earlier run's single file becomes the first part, named after the time it was written
+                parts = [base_path]
+                part_names = [datetime.fromtimestamp(os.path.getmtime(base_path)).strftime(PART_TIMESTAMP_FORMAT)]
+            os.makedirs(partition_dir, exist_ok=True)
+            keys = [np.empty(0, dtype=np.uint64)]
+            for part, part_name in zip(parts, part_names):
+                link_or_copy(part, os.path.join(partition_dir, f"part-{part_name}{os.path.splitext(part)[1]}"))
+                keys_file = os.path.join(partition_dir, f"_keys-{part_name}.npy")
+                base_keys_file = os.path.join(os.path.dirname(part), f"_keys-{part_name}.npy")
+                if os.path.isdir(base_path) and os.path.exists(base_keys_file):
+                    link_or_copy(base_keys_file, keys_file)
+                else:
+                    logging.info(f"Computing the row keys of {part}")
+                    np.save(keys_file, np.concatenate([np.empty(0, dtype=np.uint64)]
+                                                      + [self.row_keys(chunk) for chunk in iter_dataframe(part, chunk_rows, dtypes)]))
+                keys.append(np.load(keys_file))
+            return np.concatenate(keys)
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def base_artifact(self, processed_data_dir: str) -> DataIngestionArtifact:
+        """
+        Train and test partitions, files or directories, of the earlier run in processed_data_dir, which new
+        rows are appended to. Only a hash split puts new rows where a full re-ingestion would have put them.
+        """
+        try:
+            if self.data_ingestion_config.split_mode != "hash":
+                raise ValueError("Appending to existing partitions needs TRAIN_TEST_SPLIT_MODE = \"hash\"")
+            artifact_files = []
+            for file_name in (train_data_artifact_file, test_data_artifact_file):
+                stem = os.path.splitext(file_name)[0]
+                matches = [name for name in sorted(os.listdir(processed_data_dir)) if os.path.splitext(name)[0] == stem]
+                if not matches:
+                    raise FileNotFoundError(f"No {stem} partition in {processed_data_dir}")
+                artifact_files.append(os.path.join(processed_data_dir, matches[0]))
+            return DataIngestionArtifact(trained_file_path=artifact_files[0], test_file_path=artifact_files[1])
         except Exception as e:
             raise MyException(e,sys)
 
     def initiate_data_ingestion(self):
         try:
-            raw_df = self.store_raw_data()
-            processed_data = self.data_pre_processing(raw_df)
+            if self.data_ingestion_config.append_to:
+                return self.append_data_ingestion(self.base_artifact(self.data_ingestion_config.append_to))
+            if self.data_ingestion_config.chunk_rows > 0:
+                return self.stream_data_ingestion()
+            processed_data = self.store_raw_data()
             train_set, test_set = self.train_test_split(processed_data)
             train_file_path, test_file_path = self.store_train_test_data(train_set, test_set)
             data_ingestion_artifact = DataIngestionArtifact(
                 trained_file_path=train_file_path,
-                test_file_path=test_file_path
+                test_file_path=test_file_path,
+                train_df=train_set,
+                test_df=test_set
                 )
             return data_ingestion_artifact
         except Exception as e:
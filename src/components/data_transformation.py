@@ -7,6 +7,8 @@ from src.entity.config_entity import DataTransformationConfig
 from src.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact, DataTransformationArtifact
 import sys
 from src.utils.main_utils import *
+from src.utils.artifact_writer import ArtifactWriter
+from src.entity.schema import load_compiled_schema
 from imblearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 from imblearn.under_sampling import RandomUnderSampler
@@ -18,26 +20,35 @@ class DataTransformation:
     def __init__(self, 
                 data_transformation_config: DataTransformationConfig,
                 data_ingestion_artifact: DataIngestionArtifact,
-                data_validation_artifact: DataValidationArtifact
+                data_validation_artifact: DataValidationArtifact,
+                artifact_writer: ArtifactWriter = None
                 ):
         try:
             self.data_transformation_config = data_transformation_config
+            self.artifact_writer = artifact_writer or ArtifactWriter()
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_artifact = data_validation_artifact
             self.schema_info = read_yaml_file(self.data_transformation_config.SCHEMA_FILE_PATH)
         except Exception as e:
             raise MyException(e, sys)
         
-    def read_file(self, file_path) -> pd.DataFrame:
+    def read_file(self, file_path, df: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        df: the frame already in memory from data ingestion, read from file_path when it is not given
+        """
         try:
-            return pd.read_csv(file_path)
+            # Only the columns the model is trained on are read from the artifact
+            columns = [column for column in self.schema_info["columns"] if column not in self.schema_info["to_delete_columns"]]
+            if df is not None:
+                return df[columns]
+            return read_dataframe(file_path, columns=columns, dtypes=load_compiled_schema(self.data_transformation_config.SCHEMA_FILE_PATH).dtypes)
         except Exception as e:
             raise MyException(e, sys)
         
     def dropping_unwanted_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         try:
             to_delete_columns = self.schema_info["to_delete_columns"]
-            df = df.drop(columns=to_delete_columns, axis=1)
+            df = df.drop(columns=to_delete_columns, axis=1, errors="ignore")
             return df
         except Exception as e:
             raise MyException(e, sys)
@@ -45,7 +56,8 @@ class DataTransformation:
     def mapping_output_column(self, df: pd.DataFrame) -> pd.DataFrame:
         try:
             output_column = self.schema_info["output_column"]
-            df[output_column] = df[output_column].map({"neg":0, "pos":1})
+            # The class column is stored as a category, map it back to plain integer labels
+            df[output_column] = df[output_column].map({"neg":0, "pos":1}).astype(int)
             return df
         except Exception as e:
             raise MyException(e, sys)
@@ -53,7 +65,8 @@ class DataTransformation:
     def splitting_input_output_feature(self, df: pd.DataFrame):
         try:
             output_column = self.schema_info["output_column"]
-            X = df.drop(columns=[output_column], axis=1)
+            # Features are stored as float32, fit and score the pipeline in float64 as before
+            X = df.drop(columns=[output_column], axis=1).astype(np.float64)
             y = df[output_column]
             return X, y
         except Exception as e:
@@ -82,8 +95,8 @@ class DataTransformation:
             
             logging.info("Starting: Reading ingested data train and test file")
             #Reading training and testing file
-            train_df = self.read_file(self.data_ingestion_artifact.trained_file_path)
-            test_df = self.read_file(self.data_ingestion_artifact.test_file_path)
+            train_df = self.read_file(self.data_ingestion_artifact.trained_file_path, self.data_ingestion_artifact.train_df)
+            test_df = self.read_file(self.data_ingestion_artifact.test_file_path, self.data_ingestion_artifact.test_df)
             logging.info("Completed: Reading ingested data train and test file")
 
             logging.info("Starting: Dropping unwanted columns from train and test file")
@@ -123,20 +136,23 @@ class DataTransformation:
             test_arr = np.c_[X_test_transformed, y_test_df]
             logging.info("Completed: Concatinating the input and output columns")
 
-            logging.info("Starting: Saving the Pipeline .pkl, transformed train and test file")
-            #Saving numpy arrays
-            os.makedirs(self.data_transformation_config.TRANSFORMED_DATA_ARTIFACT_DIR, exist_ok=True)
-            os.makedirs(self.data_transformation_config.TRANSFORMED_PIPELINE_ARTIFACT_DIR, exist_ok=True)
-            save_object(self.data_transformation_config.PIPELINE_FILE_PATH, pipeline)
-            save_numpy_array_data(self.data_transformation_config.TRANSFORMED_TRAIN_DATA_FILE_PATH, array=train_arr)
-            save_numpy_array_data(self.data_transformation_config.TRANSFORMED_TEST_DATA_FILE_PATH, array=test_arr)
-            logging.info("Completed: Saving the Pipeline .pkl, transformed train and test file")
+            pipeline_file = transformed_train_file = transformed_test_file = None
+            if self.data_transformation_config.persist_artifacts:
+                logging.info("Starting: Saving the Pipeline .pkl, transformed train and test file")
+                #Saving numpy arrays
+                pipeline_file = self.artifact_writer.submit(save_object, self.data_transformation_config.PIPELINE_FILE_PATH, pipeline)
+                transformed_train_file = self.artifact_writer.submit(save_numpy_array_data, self.data_transformation_config.TRANSFORMED_TRAIN_DATA_FILE_PATH, array=train_arr)
+                transformed_test_file = self.artifact_writer.submit(save_numpy_array_data, self.data_transformation_config.TRANSFORMED_TEST_DATA_FILE_PATH, array=test_arr)
+                logging.info("Completed: Saving the Pipeline .pkl, transformed train and test file")
 
             #data transformation artifact
             data_transformation_artifact = DataTransformationArtifact(
-                transformed_train_file = self.data_transformation_config.TRANSFORMED_TRAIN_DATA_FILE_PATH,
-                transformed_test_file = self.data_transformation_config.TRANSFORMED_TEST_DATA_FILE_PATH,
-                pipeline_transformation_file = self.data_transformation_config.PIPELINE_FILE_PATH
+                transformed_train_file = transformed_train_file,
+                transformed_test_file = transformed_test_file,
+                pipeline_transformation_file = pipeline_file,
+                train_arr = train_arr,
+                test_arr = test_arr,
+                preprocessor = pipeline
             )
 
             return data_transformation_artifact
@@ -6,7 +6,7 @@ import sys
 import os
 from src.entity.config_entity import DataValidationConfig
 from src.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact
-from src.utils.main_utils import read_yaml_file
+from src.utils.main_utils import read_yaml_file, read_dataframe
 import json
 
 class DataValidation:
@@ -19,9 +19,14 @@ class DataValidation:
         except Exception as e:
             raise MyException(e,sys)
         
-    def read_data(self, file_path) -> pd.DataFrame:
+    def read_data(self, file_path, df: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        df: the frame already in memory from data ingestion, read from file_path when it is not given
+        """
         try:
-            df = pd.read_csv(file_path)
+            if df is not None:
+                return df
+            df = read_dataframe(file_path)
             return df
         except Exception as e:
             raise MyException(e,sys)
@@ -69,8 +74,8 @@ class DataValidation:
             
             #Train and test file path
             logging.info("Starting: Read train and test files from data ingestion artifact")
-            train_df = self.read_data(self.data_ingestion_artifact.trained_file_path)
-            test_df = self.read_data(self.data_ingestion_artifact.test_file_path)
+            train_df = self.read_data(self.data_ingestion_artifact.trained_file_path, self.data_ingestion_artifact.train_df)
+            test_df = self.read_data(self.data_ingestion_artifact.test_file_path, self.data_ingestion_artifact.test_df)
             logging.info("Completed: Reading the train and test files from data ingestion artifact")
 
             #Vaidating all columns
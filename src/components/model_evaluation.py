@@ -3,6 +3,7 @@ from src.entity.artifact_entity import DataIngestionArtifact, ModelTrainerArtifa
 from src.logger import logging
 from src.exception import MyException
 from src.utils.main_utils import *
+from src.entity.schema import load_compiled_schema
 import os
 import sys
 from src.entity.s3_estimator import Proj1Estimator
@@ -42,9 +43,16 @@ class ModelEvaluation:
         except Exception as e:
             raise MyException(e, sys)
         
-    def read_data(self, file_path):
+    def read_data(self, file_path, df: pd.DataFrame = None):
+        """
+        df: the frame already in memory from data ingestion, read from file_path when it is not given
+        """
         try:
-            df = pd.read_csv(file_path)
+            # Only the columns the model is scored on are read from the artifact
+            columns = [column for column in self.schema_info["columns"] if column not in self.schema_info["to_delete_columns"]]
+            if df is not None:
+                return df[columns]
+            df = read_dataframe(file_path, columns=columns, dtypes=load_compiled_schema(self.model_eval_config.SCHEMA_FILE_PATH).dtypes)
             return df
         except Exception as e:
             raise MyException(e, sys)
@@ -52,7 +60,7 @@ class ModelEvaluation:
     def dropping_unwanted_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         try:
             to_delete_columns = self.schema_info["to_delete_columns"]
-            df = df.drop(columns=to_delete_columns, axis=1)
+            df = df.drop(columns=to_delete_columns, axis=1, errors="ignore")
             return df
         except Exception as e:
             raise MyException(e, sys)
@@ -60,7 +68,8 @@ class ModelEvaluation:
     def mapping_output_column(self, df: pd.DataFrame) -> pd.DataFrame:
         try:
             output_column = self.schema_info["output_column"]
-            df[output_column] = df[output_column].map({"neg":0, "pos":1})
+            # The class column is stored as a category, map it back to plain integer labels
+            df[output_column] = df[output_column].map({"neg":0, "pos":1}).astype(int)
             return df
         except Exception as e:
             raise MyException(e, sys)
@@ -68,7 +77,8 @@ class ModelEvaluation:
     def splitting_input_output_feature(self, df: pd.DataFrame):
         try:
             output_column = self.schema_info["output_column"]
-            X = df.drop(columns=[output_column], axis=1)
+            # Features are stored as float32, fit and score the pipeline in float64 as before
+            X = df.drop(columns=[output_column], axis=1).astype(np.float64)
             y = df[output_column]
             return X, y
         except Exception as e:
@@ -79,7 +89,7 @@ class ModelEvaluation:
             logging.info("Starting: Fetching the ingested untransformed test data for predicting")
             #Fetching the transformed test data
             test_data_path = self.data_ingestion_Artifact.test_file_path
-            test_data = self.read_data(test_data_path)
+            test_data = self.read_data(test_data_path, self.data_ingestion_Artifact.test_df)
             logging.info("Completed: Fetching the ingested untransformed test data for predicting")
 
             #Performing some pre-processing steps on the test data
@@ -125,7 +135,9 @@ class ModelEvaluation:
             
             logging.info("Starting: Getting trained model from the model trainer artifact")
             # Get the trained model
-            trained_model = load_object(file_path=self.model_trainer_artifact.trained_model_file_path)
+            trained_model = self.model_trainer_artifact.trained_model
+            if trained_model is None:
+                trained_model = load_object(file_path=self.model_trainer_artifact.trained_model_file_path)
             logging.info("Completed: Getting trained model from the model trainer artifact")
 
             logging.info("Starting: Evaluating both the models and finding best one")
@@ -139,7 +151,8 @@ class ModelEvaluation:
                 is_model_accepted=evaluation_response.is_model_accepted,
                 changed_accuracy=evaluation_response.difference,
                 s3_model_path=self.model_eval_config.s3_model_key_path,
-                trained_model_path=self.model_trainer_artifact.trained_model_file_path
+                trained_model_path=self.model_trainer_artifact.trained_model_file_path,
+                trained_model=trained_model
             )
             return model_evaluation_artifact
         except Exception as e:
@@ -21,7 +21,9 @@ class ModelPusher:
         try:
             logging.info("Starting: Loading the new trained model")
             # Get the new trained model
-            new_trainer_model = load_object(file_path=self.model_evaluation_artifact.trained_model_path)
+            new_trainer_model = self.model_evaluation_artifact.trained_model
+            if new_trainer_model is None:
+                new_trainer_model = load_object(file_path=self.model_evaluation_artifact.trained_model_path)
             logging.info("Completed: Loading the new trained model")
 
             logging.info("Starting: Uploading the model on AWS")
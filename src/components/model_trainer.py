@@ -1,21 +1,24 @@
 import pandas as pd
 import numpy as np 
-import os
 import sys
 from src.logger import logging
 from src.exception import MyException
 from src.entity.config_entity import ModelTrainerConfig
 from src.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact, ClassificationMetricArtifact
 from src.utils.main_utils import *
+from src.utils.artifact_writer import ArtifactWriter
 from src.entity.estimator import MyModel
 from xgboost import XGBClassifier
 from sklearn.metrics import f1_score, recall_score, precision_score, confusion_matrix
+from sklearn.model_selection import train_test_split
 
 class ModelTrainer:
 
-    def __init__(self, model_trainer_config: ModelTrainerConfig, data_transformation_artifact: DataTransformationArtifact):
+    def __init__(self, model_trainer_config: ModelTrainerConfig, data_transformation_artifact: DataTransformationArtifact,
+                 artifact_writer: ArtifactWriter = None):
         try:
             self.model_trainer_config = model_trainer_config
+            self.artifact_writer = artifact_writer or ArtifactWriter()
             self.data_transformation_artifact = data_transformation_artifact
         except Exception as e:
             raise MyException(e, sys)
@@ -28,6 +31,83 @@ class ModelTrainer:
         except Exception as e:
             raise MyException(e, sys)
 
+    def truncation_costs(self, model, X_test, y_test) -> dict:
+        """
+        Total cost on the test data when only the first n trees are scored, for every configured
+        truncation point below the full ensemble. This is the accuracy price of each level of
+        the degraded serving mode.
+        """
+        try:
+            logging.info("Starting : Evaluating the truncated ensembles")
+            n_trees = model.get_booster().num_boosted_rounds()
+            truncation_costs = {}
+            for n in sorted(self.model_trainer_config.truncation_points):
+                if n >= n_trees:
+                    continue
+                y_pred = model.predict(X_test, iteration_range=(0, n))
+                truncation_costs[n] = int(self.custom_metric(y_test, y_pred))
+                logging.info(f"Total cost with the first {n} of {n_trees} trees: {truncation_costs[n]}")
+            truncation_costs[n_trees] = int(self.custom_metric(y_test, model.predict(X_test)))
+            logging.info("Completed : Evaluating the truncated ensembles")
+            return truncation_costs
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def first_stage_threshold(self, p_first, y_true) -> float:
+        """
+        Zero-FN first-stage threshold: rows exit early when their first-stage score is strictly
+        below it, so it is set to the lowest score of any real positive in the given rows and no
+        calibration positive is ever cleared. Every row under it is a negative, so the FP savings
+        come on top. The caller scales it down by cascade_threshold_margin for unseen positives.
+        """
+        positives = y_true == 1
+        if not positives.any():
+            return 0.0
+        return float(p_first[positives].min())
+
+    def build_first_stage(self, model, X_train, y_train, X_test, y_test, full_cost: int):
+        """
+        Fits the cascade's first stage: a few shallow trees on the full model's most important
+        features. Its threshold sits below the lowest score of any positive in a held-out part
+        of the training data, scaled down by cascade_threshold_margin. The first stage is only
+        kept when it clears no positive of the test data either and does not raise the total cost.
+        :return: (first stage model, feature positions, threshold, summary), or None
+        """
+        try:
+            logging.info("Starting : Building the cascade first stage")
+            config = self.model_trainer_config
+            features = np.sort(np.argsort(model.feature_importances_)[::-1][:config.cascade_n_features])
+            X_fit, X_calibration, y_fit, y_calibration = train_test_split(
+                X_train, y_train, test_size=config.cascade_calibration_size, stratify=y_train, random_state=42)
+            first_stage = XGBClassifier(random_state=42,
+                                        learning_rate=0.3,
+                                        max_depth=config.cascade_max_depth,
+                                        n_estimators=config.cascade_n_estimators)
+            first_stage.fit(X_fit[:, features], y_fit)
+
+            threshold = self.first_stage_threshold(first_stage.predict_proba(X_calibration[:, features])[:, 1],
+                                                   y_calibration)
+            threshold *= config.cascade_threshold_margin
+
+            early_exit = first_stage.predict_proba(X_test[:, features])[:, 1] < threshold
+            y_pred = np.where(early_exit, 0, model.predict(X_test))
+            summary = {
+                "features": features.tolist(),
+                "threshold": threshold,
+                "early_exit_rate": float(early_exit.mean()),
+                "cleared_positives": int((early_exit & (y_test == 1)).sum()),
+                "total_cost": int(self.custom_metric(y_test, y_pred)),
+                "full_model_total_cost": int(full_cost),
+            }
+            logging.info(f"Cascade on the test data: {summary}")
+            if summary["cleared_positives"] or summary["total_cost"] > full_cost or not early_exit.any():
+                logging.info("Cascade does not pay off on the test data, the full model will score every row")
+                return None
+            logging.info("Completed : Building the cascade first stage")
+            return first_stage, features, threshold, summary
+        except Exception as e:
+            raise MyException(e, sys)
+
     def build_model(self, train_df, test_df):
         try:
             logging.info("Starting : Splitting the input and output columns for both train and test data")
@@ -65,8 +145,14 @@ class ModelTrainer:
                                     precision_score = precision,
                                     recall_score = recall
                                 )
-            
-            return model, metric_artifact
+
+            truncation_costs = self.truncation_costs(model, X_test, y_test)
+
+            first_stage = None
+            if self.model_trainer_config.cascade_enabled:
+                first_stage = self.build_first_stage(model, X_train, y_train, X_test, y_test, total_cost)
+
+            return model, metric_artifact, truncation_costs, first_stage
 
         except Exception as e:
             raise MyException(e, sys)
@@ -75,14 +161,17 @@ class ModelTrainer:
         try:
 
             logging.info("Starting : Loading the train and test data")
-            # Read transformed training and testing data
-            train_df = load_numpy_array_data(self.data_transformation_artifact.transformed_train_file)
-            test_df = load_numpy_array_data(self.data_transformation_artifact.transformed_test_file)
+            # Read transformed training and testing data, unless they are still in memory from data transformation
+            train_df = self.data_transformation_artifact.train_arr
+            test_df = self.data_transformation_artifact.test_arr
+            if train_df is None or test_df is None:
+                train_df = load_numpy_array_data(self.data_transformation_artifact.transformed_train_file)
+                test_df = load_numpy_array_data(self.data_transformation_artifact.transformed_test_file)
             logging.info("Completed : Loading the train and test data")
 
             logging.info("Starting : Model building phase")
             # build_model
-            model, metric_artifact = self.build_model(train_df, test_df)
+            model, metric_artifact, truncation_costs, first_stage = self.build_model(train_df, test_df)
             logging.info("Completed : Model building phase")
 
             # Check if the model's accuracy meets the expected threshold
@@ -92,20 +181,30 @@ class ModelTrainer:
 
             logging.info("Starting : Loading the preprocessor")
             # Load preprocessor object
-            preprocessor = load_object(self.data_transformation_artifact.pipeline_transformation_file)
+            preprocessor = self.data_transformation_artifact.preprocessor
+            if preprocessor is None:
+                preprocessor = load_object(self.data_transformation_artifact.pipeline_transformation_file)
             logging.info("Completed : Loading the preprocessor")
 
             logging.info("Starting : Saving the custom model")
             #Saving into MyModel
-            my_model = MyModel(model, preprocessor)
-            os.makedirs(self.model_trainer_config.model_saving_dir, exist_ok=True)
-            save_object(self.model_trainer_config.model_file_path, my_model)
+            my_model = MyModel(model, preprocessor, truncation_costs=truncation_costs)
+            if first_stage is not None:
+                first_stage_model, first_stage_features, first_stage_threshold, _ = first_stage
+                my_model.set_first_stage(first_stage_model, first_stage_features, first_stage_threshold)
+            # Slim serving bundle: record the features the booster splits on, so serving only parses,
+            # imputes and scales those
+            my_model.prune_features()
+            self.artifact_writer.submit(save_object, self.model_trainer_config.model_file_path, my_model)
             logging.info("Completed : Saving the custom model")
 
             # Prepare ModelTrainerArtifact
             model_trainer_artifact = ModelTrainerArtifact(
                                         trained_model_file_path = self.model_trainer_config.model_file_path,
-                                        metric_artifact = metric_artifact
+                                        metric_artifact = metric_artifact,
+                                        truncation_costs = truncation_costs,
+                                        cascade_summary = first_stage[3] if first_stage is not None else None,
+                                        trained_model = my_model
             )
 
             return model_trainer_artifact
@@ -4,6 +4,10 @@ PIPELINE_NAME: str = ""
 
 ############## Artifact ##############################
 artifact_dir: str = "artifact"
+ARTIFACT_FORMAT: str = "parquet"    # format of the ingested data artifacts: "parquet", "feather" (Arrow IPC) or "csv"
+ARTIFACT_BACKGROUND_PERSIST: bool = True    # write artifacts on a background thread while the next stage runs
+STAGE_CACHE_ENABLED: bool = True    # reuse ingestion/validation/transformation artifacts when their inputs are unchanged
+STAGE_CACHE_DIR: str = f"{artifact_dir}/stage_cache"
 ######################################################
 
 ############## Data Ingestion Constants ##############
@@ -17,6 +21,14 @@ train_data_artifact_file: str = "train_data.csv"
 test_data_artifact_file: str = "test_data.csv"
 train_test_split_ratio:float = 0.2
 OUTPUT_FEATURE_FOR_MODEL: str = "class"
+INCLUDE_PREDICTION_LOG: bool = False    # add the prediction log rows with a recorded outcome to the raw data
+PREDICTION_OUTCOME_DIR: str = "prediction_outcomes"    # csv/parquet files of (prediction_id, class) recorded after inspection
+DATA_INGESTION_PERSIST_ARTIFACTS: bool = True    # keep the raw/train/test data on disk; later stages use the frames in memory
+OUTPUT_CLASSES: tuple = ("neg", "pos")
+DATA_INGESTION_CHUNK_ROWS: int = 0    # > 0 streams the raw data in chunks of this many rows instead of loading it whole
+TRAIN_TEST_SPLIT_MODE: str = "random"    # "random" (stratified shuffle) or "hash" (stable per-row hash, stratified per class)
+SPLIT_KEY_COLUMNS: tuple = ()    # columns identifying a row for the hash split, all the columns but the class when empty
+DATA_INGESTION_APPEND_TO: str = ""    # processed_data dir of an earlier run: hash-split the rows not in its partitions yet and add them as new part files
 ######################################################
 
 ############## Data Validation Constants ##############
@@ -36,6 +48,7 @@ transformed_pipeline_dir: str = "pipeline"
 transformed_train_data_file: str = "train.csv"
 transformed_test_data_file: str = "test.csv"
 pipeline_transformation_file: str = "preprocessing.pkl"
+DATA_TRANSFORMATION_PERSIST_ARTIFACTS: bool = True    # keep the transformed arrays and preprocessor on disk
 ######################################################
 
 ############## Model Trainer Constants ##############
@@ -46,6 +59,13 @@ FN_COST: int = 500
 model_learning_rate: float = 0.05
 model_max_depth: int = 3
 model_n_estimators: int = 300
+MODEL_TRUNCATION_POINTS: tuple = (50, 100, 200)    # tree counts whose test cost is recorded for degraded serving
+CASCADE_ENABLED: bool = True    # fit a small first-stage model that clears obvious negatives before the full model
+CASCADE_N_FEATURES: int = 8
+CASCADE_N_ESTIMATORS: int = 20
+CASCADE_MAX_DEPTH: int = 2
+CASCADE_CALIBRATION_SIZE: float = 0.25    # share of the training data held out to set the first-stage threshold
+CASCADE_THRESHOLD_MARGIN: float = 0.5    # threshold is scaled by this below the lowest calibration positive score
 #####################################################
 
 ############## Model Evaluation Constants ##############
@@ -57,7 +77,52 @@ MODEL_BUCKET_NAME: str = "personal-proj-aps-sensor-project"
 MODEL_PUSHER_S3_KEY: str = "model-registry"
 MODEL_FILE_NAME: str = "model.pkl"
 output_column_name = "class"
+MODEL_CACHE_ENABLED: bool = True
+MODEL_CACHE_DIR: str = "model_cache"
+MODEL_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024  # 1 GB
+#####################################################
+
+############## Prediction Constants ##############
+MODEL_HOT_RELOAD_ENABLED: bool = True
+MODEL_RELOAD_POLL_INTERVAL_SECONDS: int = 60
+MICRO_BATCH_ENABLED: bool = True
+MICRO_BATCH_MAX_SIZE: int = 64
+MICRO_BATCH_MAX_WAIT_MS: float = 2.0
+PREDICTION_CACHE_ENABLED: bool = False
+PREDICTION_CACHE_MAX_SIZE: int = 100000
+PREDICTION_CACHE_TTL_SECONDS: float = 300.0
+LOCAL_MODEL_PATH_ENV_KEY: str = "APS_LOCAL_MODEL_PATH"    # serve a model.pkl from local disk instead of s3
+PREDICTION_LOG_ENABLED: bool = False    # record every prediction (inputs, probability, model version, time)
+PREDICTION_LOG_DIR: str = "prediction_log"
+PREDICTION_ID_COLUMN: str = "prediction_id"    # returned with every logged prediction, outcomes are recorded against it
+PREDICTION_LOG_FORMAT: str = "parquet"    # "parquet" or "arrow" (Arrow IPC / Feather v2)
+PREDICTION_LOG_MAX_PENDING_BATCHES: int = 1024    # batches waiting for the writer before new ones are dropped
+PREDICTION_LOG_FLUSH_INTERVAL_SECONDS: float = 5.0
+PREDICTION_LOG_FLUSH_BATCHES: int = 256    # wake the writer early once this many batches are waiting
+PREDICTION_LOG_ROTATE_ROWS: int = 1000000
+PREDICTION_LOG_ROTATE_SECONDS: float = 3600.0
+MODEL_PREDICT_NTHREAD: int = 0    # xgboost threads per prediction call, 0 keeps the booster's own setting
+MODEL_PREPROCESS_DTYPE: str = "float64"    # matches the training pipeline exactly; "float32" is faster but rounds the inputs and ~1 in 6 transformed values
+SLIM_SERVING_ENABLED: bool = True    # only parse and preprocess the features the model splits on
+DEGRADED_INFERENCE_ENABLED: bool = True
+DEGRADED_INFERENCE_N_TREES: int = 100    # trees scored while the service is under pressure
+DEGRADED_INFERENCE_QUEUE_DEPTH: int = 32    # queued jobs at which scoring is truncated
+DEGRADED_INFERENCE_LATENCY_MS: float = 250.0    # recent request latency at which scoring is truncated
+DEGRADED_INFERENCE_RECOVERY_SECONDS: float = 5.0    # pressure must stay below half the thresholds this long before full depth returns
 #####################################################
 
 APP_HOST = "0.0.0.0"
-APP_PORT = 5000
\ No newline at end of file
+APP_PORT = 5000
+APP_INFERENCE_WORKERS = 4
+APP_INFERENCE_QUEUE_SIZE = 64
+APP_WORKERS = 1
+APP_WORKER_MAX_REQUESTS = 0    # recycle a worker after this many requests, 0 to never recycle
+APP_WORKER_READY_TIMEOUT_SECONDS = 120.0    # a replacement worker must be serving within this during a rolling recycle
+APP_WORKER_RESPAWN_BACKOFF_SECONDS = 0.5    # delay before replacing a failed worker, doubled for every failure in a row
+APP_WORKER_MAX_RESPAWN_BACKOFF_SECONDS = 30.0
+APP_WORKER_MAX_FAILURES = 5    # the master gives up after this many worker failures in a row
+APP_WORKER_METRICS_SNAPSHOT_SECONDS = 1.0    # prefork workers' metrics seen by /metrics are at most this old
+APP_MAX_IN_FLIGHT_REQUESTS = 256    # requests beyond this are shed with a 503
+APP_RETRY_AFTER_SECONDS = 1
+APP_REQUEST_TIMEOUT_SECONDS = 30.0    # default deadline when the client sends none, 0 for no deadline
+APP_REQUEST_TIMEOUT_HEADER = "X-Request-Timeout-Ms"
@@ -4,6 +4,12 @@ import sys
 import os
 import pandas as pd
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
 class Proj1Data:
 
     def __init__(self):
@@ -20,3 +26,83 @@ class Proj1Data:
             return df
         except Exception as e:
             raise MyException(e,sys)
+
+    def iter_data(self, chunk_rows: int, dtypes: dict = None):
+        """
+        Yields the raw data in DataFrames of at most chunk_rows rows, parsed straight
+        into dtypes with "na" read as a missing value
+        """
+        try:
+            data_path = os.path.join(self.raw_data_dir, self.raw_data_file)
+            with pd.read_csv(data_path, chunksize=chunk_rows, dtype=dtypes, na_values="na") as reader:
+                yield from reader
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def get_prediction_log_data(self, log_dir: str, outcome_dir: str, output_column: str = OUTPUT_FEATURE_FOR_MODEL):
+        """
+        Rows of the completed prediction log files in log_dir whose real outcome has been recorded,
+        labelled with it, see iter_prediction_log_data
+        """
+        try:
+            frames = list(self.iter_prediction_log_data(log_dir, outcome_dir, output_column=output_column))
+            return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        except Exception as e:
+            raise MyException(e,sys)
+
+    def iter_prediction_log_data(self, log_dir: str, outcome_dir: str, chunk_rows: int = 65536,
+                                 output_column: str = OUTPUT_FEATURE_FOR_MODEL):
+        """
+        Yields the labelled rows of the completed prediction log files in log_dir, reading the log
+        at most chunk_rows rows at a time and joining every batch with the recorded outcomes, so only
+        the outcome table and one batch are held in memory. Outcomes are rows of
+        (prediction_id, output_column) in the csv or parquet files of outcome_dir; when an id was
+        recorded more than once the last file read wins.
+        """
+        try:
+            outcomes = self.read_files(outcome_dir, {".csv": pd.read_csv, ".parquet": pd.read_parquet})
+            if outcomes.empty:
+                return
+            outcomes = outcomes[[PREDICTION_ID_COLUMN, output_column]].dropna()
+            outcomes = outcomes.drop_duplicates(subset=PREDICTION_ID_COLUMN, keep="last")
+            for batch in self.iter_prediction_log(log_dir, chunk_rows):
+                labelled = batch.merge(outcomes, on=PREDICTION_ID_COLUMN, how="inner")
+                if len(labelled):
+                    yield labelled
+        except Exception as e:
+            raise MyException(e,sys)
+
+    @staticmethod
+    def iter_prediction_log(log_dir: str, chunk_rows: int):
+        """
+        Yields the completed prediction log files in log_dir record batch by record batch,
+        in DataFrames of at most chunk_rows rows
+        """
+        if not os.path.isdir(log_dir):
+            return
+        # Files still being written end in .inprogress and are skipped
+        for file_name in sorted(os.listdir(log_dir)):
+            path = os.path.join(log_dir, file_name)
+            if file_name.endswith(".parquet"):
+                for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+                    yield batch.to_pandas()
+            elif file_name.endswith(".arrow"):
+                with pa.OSFile(path, "rb") as source:
+                    reader = pa.ipc.open_file(source)
+                    for i in range(reader.num_record_batches):
+                        batch = reader.get_batch(i)
+                        for offset in range(0, batch.num_rows, chunk_rows):
+                            yield batch.slice(offset, chunk_rows).to_pandas()
+
+    @staticmethod
+    def read_files(directory: str, readers: dict) -> pd.DataFrame:
+        """
+        Concatenates the files in directory that one of readers, keyed by file extension, can read
+        """
+        frames = []
+        if os.path.isdir(directory):
+            for file_name in sorted(os.listdir(directory)):
+                reader = readers.get(os.path.splitext(file_name)[1])
+                if reader is not None:
+                    frames.append(reader(os.path.join(directory, file_name)))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
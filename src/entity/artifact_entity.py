@@ -1,9 +1,12 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class DataIngestionArtifact:
     trained_file_path:str 
     test_file_path:str
+    # Live objects handed to the next stages in the same run; the file paths are None when they are not persisted
+    train_df:object = field(default=None, repr=False, compare=False)
+    test_df:object = field(default=None, repr=False, compare=False)
 
 @dataclass
 class DataValidationArtifact:
@@ -16,6 +19,9 @@ class DataTransformationArtifact:
     transformed_train_file: str
     transformed_test_file: bool
     pipeline_transformation_file: str
+    train_arr: object = field(default=None, repr=False, compare=False)
+    test_arr: object = field(default=None, repr=False, compare=False)
+    preprocessor: object = field(default=None, repr=False, compare=False)
 
 @dataclass
 class ClassificationMetricArtifact:
@@ -28,6 +34,9 @@ class ClassificationMetricArtifact:
 class ModelTrainerArtifact:
     trained_model_file_path:str 
     metric_artifact:ClassificationMetricArtifact
+    truncation_costs:dict = None
+    cascade_summary:dict = None
+    trained_model:object = field(default=None, repr=False, compare=False)
 
 @dataclass
 class ModelEvaluationArtifact:
@@ -35,6 +44,7 @@ class ModelEvaluationArtifact:
     changed_accuracy:float
     s3_model_path:str 
     trained_model_path:str
+    trained_model:object = field(default=None, repr=False, compare=False)
 
 @dataclass
 class ModelPusherArtifact:
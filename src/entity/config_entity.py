@@ -10,6 +10,9 @@ class TrainingPipelineConfig:
     pipeline_name: str = PIPELINE_NAME
     artifact_dir: str = os.path.join(artifact_dir, TIMESTAMP)
     timestamp: str = TIMESTAMP
+    background_persist: bool = ARTIFACT_BACKGROUND_PERSIST
+    stage_cache_enabled: bool = STAGE_CACHE_ENABLED
+    stage_cache_dir: str = STAGE_CACHE_DIR
 
 training_pipeline_config: TrainingPipelineConfig = TrainingPipelineConfig()
 
@@ -18,11 +21,21 @@ class DataIngestionConfig:
     DATA_INGESTION_ARTIFACT_PATH: str = os.path.join(training_pipeline_config.artifact_dir, data_ingestion_artifact)
     RAW_DATA_ARTIFACT_DIR: str = os.path.join(DATA_INGESTION_ARTIFACT_PATH, raw_data_artifact_dir)
     PROCESSED_DATA_ARTIFACT_DIR: str = os.path.join(DATA_INGESTION_ARTIFACT_PATH, processed_data_artifact_dir)
-    RAW_DATA_ARTIFACT_FILE: str = os.path.join(RAW_DATA_ARTIFACT_DIR, raw_data_artifact_file)
-    TRAIN_DATA_ARTIFACT_FILE: str = os.path.join(PROCESSED_DATA_ARTIFACT_DIR, train_data_artifact_file)
-    TEST_DATA_ARTIFACT_FILE: str = os.path.join(PROCESSED_DATA_ARTIFACT_DIR, test_data_artifact_file)
+    RAW_DATA_ARTIFACT_FILE: str = os.path.join(RAW_DATA_ARTIFACT_DIR, raw_data_artifact_file.replace("csv", ARTIFACT_FORMAT))
+    TRAIN_DATA_ARTIFACT_FILE: str = os.path.join(PROCESSED_DATA_ARTIFACT_DIR, train_data_artifact_file.replace("csv", ARTIFACT_FORMAT))
+    TEST_DATA_ARTIFACT_FILE: str = os.path.join(PROCESSED_DATA_ARTIFACT_DIR, test_data_artifact_file.replace("csv", ARTIFACT_FORMAT))
+    SCHEMA_FILE_PATH: str = os.path.join(schema_folder_name, schema_file_name)
     train_test_split_ratio: float = train_test_split_ratio
     OUTPUT_FEATURE_FOR_MODEL: str = OUTPUT_FEATURE_FOR_MODEL 
+    include_prediction_log: bool = INCLUDE_PREDICTION_LOG
+    prediction_log_dir: str = PREDICTION_LOG_DIR
+    prediction_outcome_dir: str = PREDICTION_OUTCOME_DIR
+    persist_artifacts: bool = DATA_INGESTION_PERSIST_ARTIFACTS
+    output_classes: tuple = OUTPUT_CLASSES
+    chunk_rows: int = DATA_INGESTION_CHUNK_ROWS
+    split_mode: str = TRAIN_TEST_SPLIT_MODE
+    split_key_columns: tuple = SPLIT_KEY_COLUMNS
+    append_to: str = DATA_INGESTION_APPEND_TO
 
 @dataclass
 class DataValidationConfig:
@@ -42,6 +55,7 @@ class DataTransformationConfig:
     TRANSFORMED_TEST_DATA_FILE_PATH: str = os.path.join(TRANSFORMED_DATA_ARTIFACT_DIR, transformed_test_data_file.replace("csv", "npy"))
     PIPELINE_FILE_PATH: str = os.path.join(TRANSFORMED_PIPELINE_ARTIFACT_DIR, pipeline_transformation_file)
     SCHEMA_FILE_PATH: str = os.path.join(schema_folder_name, schema_file_name)
+    persist_artifacts: bool = DATA_TRANSFORMATION_PERSIST_ARTIFACTS
 
 @dataclass
 class ModelTrainerConfig:
@@ -52,6 +66,13 @@ class ModelTrainerConfig:
     model_learning_rate: float = model_learning_rate
     model_max_depth: int = model_max_depth
     model_n_estimators: int = model_n_estimators
+    truncation_points: tuple = MODEL_TRUNCATION_POINTS
+    cascade_enabled: bool = CASCADE_ENABLED
+    cascade_n_features: int = CASCADE_N_FEATURES
+    cascade_n_estimators: int = CASCADE_N_ESTIMATORS
+    cascade_max_depth: int = CASCADE_MAX_DEPTH
+    cascade_calibration_size: float = CASCADE_CALIBRATION_SIZE
+    cascade_threshold_margin: float = CASCADE_THRESHOLD_MARGIN
 
 @dataclass
 class ModelEvaluationConfig:
@@ -70,4 +91,29 @@ class ModelPusherConfig:
 class APSSensorPredictorConfig:
     bucket_name: str = MODEL_BUCKET_NAME
     s3_model_key_path: str = MODEL_FILE_NAME
-    SCHEMA_FILE_PATH: str = os.path.join(schema_folder_name, schema_file_name)
\ No newline at end of file
+    SCHEMA_FILE_PATH: str = os.path.join(schema_folder_name, schema_file_name)
+    hot_reload_enabled: bool = MODEL_HOT_RELOAD_ENABLED
+    reload_poll_interval_seconds: int = MODEL_RELOAD_POLL_INTERVAL_SECONDS
+    micro_batch_enabled: bool = MICRO_BATCH_ENABLED
+    micro_batch_max_size: int = MICRO_BATCH_MAX_SIZE
+    micro_batch_max_wait_ms: float = MICRO_BATCH_MAX_WAIT_MS
+    prediction_cache_enabled: bool = PREDICTION_CACHE_ENABLED
+    prediction_cache_max_size: int = PREDICTION_CACHE_MAX_SIZE
+    prediction_cache_ttl_seconds: float = PREDICTION_CACHE_TTL_SECONDS
+    local_model_path: str = os.getenv(LOCAL_MODEL_PATH_ENV_KEY)
+    slim_serving_enabled: bool = SLIM_SERVING_ENABLED
+    predict_nthread: int = MODEL_PREDICT_NTHREAD
+    prediction_log_enabled: bool = PREDICTION_LOG_ENABLED
+    prediction_log_dir: str = PREDICTION_LOG_DIR
+    prediction_log_format: str = PREDICTION_LOG_FORMAT
+    prediction_log_max_pending_batches: int = PREDICTION_LOG_MAX_PENDING_BATCHES
+    prediction_log_flush_interval_seconds: float = PREDICTION_LOG_FLUSH_INTERVAL_SECONDS
+    prediction_log_flush_batches: int = PREDICTION_LOG_FLUSH_BATCHES
+    prediction_log_rotate_rows: int = PREDICTION_LOG_ROTATE_ROWS
+    prediction_log_rotate_seconds: float = PREDICTION_LOG_ROTATE_SECONDS
+    preprocess_dtype: str = MODEL_PREPROCESS_DTYPE
+    degraded_inference_enabled: bool = DEGRADED_INFERENCE_ENABLED
+    degraded_inference_n_trees: int = DEGRADED_INFERENCE_N_TREES
+    degraded_inference_queue_depth: int = DEGRADED_INFERENCE_QUEUE_DEPTH
+    degraded_inference_latency_ms: float = DEGRADED_INFERENCE_LATENCY_MS
+    degraded_inference_recovery_seconds: float = DEGRADED_INFERENCE_RECOVERY_SECONDS
\ No newline at end of file
@@ -3,26 +3,334 @@ from src.exception import MyException
 import pandas as pd
 import numpy as np
 import os
+import threading
 from src.logger import logging
+from src.metrics import PREPROCESS_SECONDS, BOOSTER_PREDICT_SECONDS, FIRST_STAGE_SECONDS
+from src.metrics import CASCADE_EARLY_EXIT_ROWS, CASCADE_ESCALATED_ROWS
+
+_booster_copies_lock = threading.Lock()
+
 
 class MyModel:
 
-    def __init__(self, model, preprocessor):
+    def __init__(self, model, preprocessor, truncation_costs: dict = None):
+        """
+        :param truncation_costs: test set total cost when scoring with only the first n trees, keyed by n
+        """
         try:
             self.model = model
             self.preprocessor = preprocessor
+            self.truncation_costs = truncation_costs or {}
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def set_first_stage(self, first_stage, feature_index, threshold: float) -> None:
+        """
+        Adds the cascade's first stage: a small classifier over a few transformed features.
+        Rows it scores below threshold are predicted negative without running the full model.
+        :param feature_index: positions of the first stage's features among the preprocessor's output columns
+        """
+        try:
+            self.first_stage = first_stage
+            self.first_stage_features = np.asarray(feature_index, dtype=np.intp)
+            self.first_stage_threshold = float(threshold)
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def prune_features(self) -> np.ndarray:
+        """
+        Finds the preprocessor output columns the booster, and the cascade first stage, actually split on.
+        The other columns never change a prediction, so the slim serving path skips them entirely.
+        :return: sorted positions of the used columns among the preprocessor's output columns
+        """
+        try:
+            booster = self.model.get_booster()
+            position = {name: i for i, name in enumerate(booster.feature_names or [])}
+            used = {position[name] if position else int(name[1:]) for name in booster.get_score(importance_type="weight")}
+            if getattr(self, "first_stage", None) is not None:
+                used.update(int(i) for i in self.first_stage_features)
+            self.used_features = np.array(sorted(used), dtype=np.intp)
+            logging.info(f"Model splits on {len(self.used_features)} of {booster.num_features()} features")
+            return self.used_features
         except Exception as e:
             raise MyException(e, sys)
-        
+
+    def compile(self, input_columns=None, prune: bool = True, preprocess_dtype: str = "float64") -> bool:
+        """
+        Extracts the fitted SimpleImputer medians and RobustScaler centers/scales into contiguous
+        arrays, so predictions can skip the sklearn pipeline and go straight to the booster's
+        in-place predict. Models saved before this existed are compiled when they are loaded.
+        :param input_columns: column order of the feature matrices that will be passed to predict
+                              (the compiled schema order); defaults to the order the model was fitted on
+        :param prune: only read and preprocess the features the model splits on (see prune_features)
+        :param preprocess_dtype: precision of the fill/scale arithmetic, see scale_columns
+        :return: True when the compiled path is available, False when the pipeline is not the
+                 imputer -> scaler pipeline this knows how to fuse
+        """
+        try:
+            self.compiled = False
+            self.booster_copies = {}
+            self.preprocess_dtype = np.dtype(preprocess_dtype)
+            if self.preprocess_dtype not in (np.float32, np.float64):
+                raise ValueError(f"Unsupported preprocess dtype: {preprocess_dtype}")
+            self.feature_names = list(getattr(self.preprocessor, "feature_names_in_", [])) or None
+            self.input_columns = list(input_columns) if input_columns is not None else self.feature_names
+            self.input_order = None
+            if self.input_columns is not None and self.feature_names is not None and self.input_columns != self.feature_names:
+                position = {column: i for i, column in enumerate(self.input_columns)}
+                missing = [column for column in self.feature_names if column not in position]
+                if missing:
+                    raise ValueError(f"Model features missing from the input columns: {missing}")
+                self.input_order = np.array([position[column] for column in self.feature_names])
+
+            steps = getattr(self.preprocessor, "named_steps", {})
+            imputer, scaler = steps.get("imputer"), steps.get("scaler")
+            if (imputer is None or scaler is None or len(steps) != 2
+                    or getattr(imputer, "strategy", None) != "median"
+                    or not (isinstance(imputer.missing_values, float) and np.isnan(imputer.missing_values))):
+                logging.info("Preprocessing pipeline cannot be compiled, using the sklearn pipeline")
+                return False
+
+            statistics = np.asarray(imputer.statistics_, dtype=np.float64)
+            # SimpleImputer drops the features that were entirely missing at fit time
+            if getattr(imputer, "keep_empty_features", False):
+                self.kept_columns = None
+            else:
+                kept = ~np.isnan(statistics)
+                self.kept_columns = None if kept.all() else np.flatnonzero(kept)
+                statistics = statistics[kept]
+            n_features = len(statistics)
+
+            self.fill_values = np.ascontiguousarray(statistics)
+            self.center = np.ascontiguousarray(scaler.center_ if scaler.with_centering else np.zeros(n_features), dtype=np.float64)
+            self.scale = np.ascontiguousarray(scaler.scale_ if scaler.with_scaling else np.ones(n_features), dtype=np.float64)
+            self.booster = self.model.get_booster()
+            try:
+                self.iteration_range = (0, self.model.best_iteration + 1)
+            except AttributeError:
+                self.iteration_range = (0, 0)
+            self.compiled = True
+            logging.info(f"Compiled the preprocessing pipeline for {n_features} features")
+            self.compile_first_stage()
+            self.compile_serving_columns(prune)
+            return True
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def compile_first_stage(self) -> None:
+        """
+        Maps the first stage's features back to input matrix columns, so the first stage
+        only reads and preprocesses its own handful of columns
+        """
+        self.first_stage_booster = None
+        if getattr(self, "first_stage", None) is None:
+            return
+        features = self.first_stage_features
+        # Preprocessor output column -> fitted column -> input matrix column
+        model_columns = self.kept_columns[features] if self.kept_columns is not None else features
+        self.first_stage_model_columns = model_columns
+        self.first_stage_input_index = self.input_order[model_columns] if self.input_order is not None else model_columns
+        self.first_stage_fill = self.fill_values[features]
+        self.first_stage_center = self.center[features]
+        self.first_stage_scale = self.scale[features]
+        self.first_stage_booster = self.first_stage.get_booster()
+        logging.info(f"Compiled the cascade first stage on {len(features)} features, threshold {self.first_stage_threshold:.6f}")
+
+    def compile_serving_columns(self, prune: bool = True) -> None:
+        """
+        Subsets the preprocessing parameters to the features the model uses, and maps them back
+        to input matrix columns (serving_columns) so payload parsing can skip the rest
+        """
+        if prune and getattr(self, "used_features", None) is None:
+            # Models saved before pruning existed are pruned when they are loaded
+            self.prune_features()
+        used = self.used_features if prune else np.arange(len(self.fill_values))
+        model_columns = self.kept_columns[used] if self.kept_columns is not None else used
+        self.serving_features = used
+        self.serving_model_columns = model_columns
+        self.serving_input_index = self.input_order[model_columns] if self.input_order is not None else model_columns
+        self.serving_columns = None
+        if self.input_columns is not None:
+            self.serving_columns = tuple(self.input_columns[i] for i in self.serving_input_index)
+        self.serving_fill = self.fill_values[used]
+        self.serving_center = self.center[used]
+        self.serving_scale = self.scale[used]
+
+    def first_stage_proba(self, X, nthread: int = None) -> np.ndarray:
+        """
+        Positive class probability from the first stage, preprocessing only its columns
+        """
+        X_first = self.scale_columns(X, self.first_stage_input_index, self.first_stage_model_columns,
+                                     self.first_stage_fill, self.first_stage_center, self.first_stage_scale)
+        booster = self.booster_for("first_stage", self.first_stage_booster, nthread)
+        return booster.inplace_predict(X_first, missing=self.first_stage.missing, validate_features=False)
+
+    def booster_for(self, name: str, booster, nthread: int = None):
+        """
+        Copy of booster set to predict with nthread threads. set_param on the shared booster would
+        race with predictions running on other threads, so each thread count gets its own copy,
+        made once; None or 0 uses the booster as it is.
+        """
+        if not nthread:
+            return booster
+        copies = self.booster_copies
+        copy = copies.get((name, nthread))
+        if copy is None:
+            with _booster_copies_lock:
+                copy = copies.get((name, nthread))
+                if copy is None:
+                    copy = booster.copy()
+                    copy.set_param({"nthread": nthread})
+                    copies[(name, nthread)] = copy
+        return copy
+
+    def to_feature_matrix(self, X) -> np.ndarray:
+        """
+        Returns X as a fresh float64 ndarray in the column order the preprocessor was fitted on.
+        ndarray inputs are expected in input_columns order.
+        """
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names is not None and list(X.columns) != self.feature_names:
+                missing = [column for column in self.feature_names if column not in X.columns]
+                unexpected = [column for column in X.columns if column not in set(self.feature_names)]
+                if missing or unexpected:
+                    raise ValueError(f"Input columns do not match the model. Missing: {missing}, unexpected: {unexpected}")
+                X = X[self.feature_names]
+            return X.to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+        X = np.asarray(X)
+        if self.input_order is not None:
+            X = X[:, self.input_order]
+        return np.array(X, dtype=np.float64, order="C")
+
+    def transform(self, X) -> np.ndarray:
+        """
+        Fused equivalent of self.preprocessor.transform: median fill of the missing values
+        followed by (X - center) / scale, done in place on one buffer. The arithmetic is the
+        same float64 sequence sklearn runs, so for the same input values the result is identical.
+        """
+        X = self.to_feature_matrix(X)
+        if self.kept_columns is not None:
+            X = X[:, self.kept_columns]
+        np.copyto(X, self.fill_values, where=np.isnan(X))
+        X -= self.center
+        X /= self.scale
+        return X
+
+    @property
+    def n_trees(self) -> int:
+        """
+        Number of boosting rounds a full-depth prediction evaluates
+        """
+        iteration_range = getattr(self, "iteration_range", (0, 0))
+        return iteration_range[1] or self.model.get_booster().num_boosted_rounds()
+
+    def truncated_iteration_range(self, n_trees: int = None) -> tuple:
+        """
+        iteration_range scoring only the first n_trees boosting rounds, the full range when n_trees is None
+        """
+        if n_trees is None or n_trees >= self.n_trees:
+            return getattr(self, "iteration_range", (0, 0))
+        return (0, max(int(n_trees), 1))
+
+    def scale_columns(self, X, input_index, model_columns, fill, center, scale) -> np.ndarray:
+        """
+        Median fill and (x - center) / scale of the selected columns of X, as a contiguous float32 matrix.
+        With preprocess_dtype float64 and a float64 X (payloads are decoded as float64 for these models)
+        the arithmetic matches the fitted pipeline and every value is rounded to float32 once, at the end,
+        which is what the booster sees for transform(X). float32 works on a float32 X, rounded at decode,
+        about a fifth faster, but large counters lose digits and a value that sits on a split threshold
+        can move to the other branch.
+        """
+        dtype = self.preprocess_dtype
+        if isinstance(X, pd.DataFrame):
+            X_columns = self.to_feature_matrix(X)[:, model_columns].astype(dtype, copy=False)
+        else:
+            X_columns = np.asarray(X).take(input_index, axis=1).astype(dtype, copy=False)
+        np.copyto(X_columns, fill.astype(dtype, copy=False), where=np.isnan(X_columns))
+        X_columns -= center.astype(dtype, copy=False)
+        X_columns /= scale.astype(dtype, copy=False)
+        return X_columns.astype(np.float32, copy=False)
+
+    def transform_used(self, X) -> np.ndarray:
+        """
+        Contiguous float32 booster input with only the used features filled in: the same median fill
+        and scaling as transform on those columns, NaN everywhere else. The booster never splits on
+        the other columns, so its predictions are identical to scoring transform(X).
+        """
+        X_used = self.scale_columns(X, self.serving_input_index, self.serving_model_columns,
+                                    self.serving_fill, self.serving_center, self.serving_scale)
+        if len(self.serving_features) == len(self.fill_values):
+            return X_used
+        X_transformed = np.full((len(X_used), len(self.fill_values)), np.nan, dtype=np.float32)
+        X_transformed[:, self.serving_features] = X_used
+        return X_transformed
+
+    def predict_positive_proba(self, X, n_trees: int = None, nthread: int = None) -> np.ndarray:
+        if getattr(self, "compiled", False) and getattr(self, "first_stage_booster", None) is not None:
+            # Cascade: only the rows the first stage cannot clear reach the full model
+            with FIRST_STAGE_SECONDS.time():
+                probabilities = np.array(self.first_stage_proba(X, nthread), dtype=np.float32)
+            escalated = np.flatnonzero(probabilities >= self.first_stage_threshold)
+            CASCADE_EARLY_EXIT_ROWS.inc(len(probabilities) - len(escalated))
+            CASCADE_ESCALATED_ROWS.inc(len(escalated))
+            if len(escalated):
+                X_escalated = X.iloc[escalated] if isinstance(X, pd.DataFrame) else np.asarray(X)[escalated]
+                probabilities[escalated] = self.full_positive_proba(X_escalated, n_trees, nthread)
+            return probabilities
+        return self.full_positive_proba(X, n_trees, nthread)
+
+    def full_positive_proba(self, X, n_trees: int = None, nthread: int = None) -> np.ndarray:
+        """
+        On the compiled path no DMatrix is built: the float32 matrix goes to the booster's in-place predict
+        """
+        iteration_range = self.truncated_iteration_range(n_trees)
+        if getattr(self, "compiled", False):
+            with PREPROCESS_SECONDS.time():
+                # The booster evaluates float32, same cast XGBClassifier.predict makes internally
+                X_transformed = self.transform_used(X)
+            with BOOSTER_PREDICT_SECONDS.time():
+                booster = self.booster_for("model", self.booster, nthread)
+                return booster.inplace_predict(X_transformed,
+                                               iteration_range=iteration_range,
+                                               missing=self.model.missing,
+                                               validate_features=False)
+        with PREPROCESS_SECONDS.time():
+            X_transformed = self.preprocessor.transform(self.to_frame(X))
+        with BOOSTER_PREDICT_SECONDS.time():
+            return self.model.predict_proba(X_transformed, iteration_range=iteration_range)[:, 1]
+
+    def to_frame(self, X):
+        """
+        Names the columns of a feature matrix for the sklearn pipeline path
+        """
+        if isinstance(X, np.ndarray) and getattr(self, "input_columns", None) is not None:
+            df = pd.DataFrame(X, columns=self.input_columns)
+            return df if self.feature_names is None else df[self.feature_names]
+        return X
+
     def predict(self, X):
         try:
-            X_transformed = self.preprocessor.transform(X)
+            if getattr(self, "compiled", False):
+                # Same 0.5 decision threshold XGBClassifier.predict applies for binary objectives
+                return (self.predict_positive_proba(X) > 0.5).astype(int)
+            X_transformed = self.preprocessor.transform(self.to_frame(X))
             return self.model.predict(X_transformed)
         except Exception as e:
             raise MyException(e, sys)
 
+    def predict_proba(self, X, n_trees: int = None, nthread: int = None):
+        """
+        Returns the probability of the positive (APS failure) class for every row of X
+        :param n_trees: score with only the first n_trees boosting rounds, the cheaper degraded mode
+        :param nthread: xgboost threads for this call on the compiled path, the booster's setting by default
+        """
+        try:
+            return self.predict_positive_proba(X, n_trees=n_trees, nthread=nthread)
+        except Exception as e:
+            raise MyException(e, sys)
+
     def __repr__(self):
         return f"{type(self.trained_model_object).__name__}()"
 
     def __str__(self):
-        return f"{type(self.trained_model_object).__name__}()"
\ No newline at end of file
+        return f"{type(self.trained_model_object).__name__}()"
@@ -1,23 +1,29 @@
 from src.cloud_storage.aws_storage import SimpleStorageService
+from src.cloud_storage.model_cache import LocalModelCache
+from src.constants import MODEL_CACHE_ENABLED
 from src.exception import MyException
 from src.entity.estimator import MyModel
 import sys
+import pickle
 from pandas import DataFrame
+from src.logger import logging
 
 class Proj1Estimator:
     """
     This class is used to save and retrieve our model from s3 bucket and to do prediction
     """
 
-    def __init__(self,bucket_name,model_path):
+    def __init__(self,bucket_name,model_path,use_local_cache:bool=MODEL_CACHE_ENABLED):
         """
         :param bucket_name: Name of your model bucket
         :param model_path: Location of your model in bucket
+        :param use_local_cache: Keep a verified copy of downloaded models on local disk
         """
         self.bucket_name = bucket_name
         self.s3 = SimpleStorageService()
         self.model_path = model_path
         self.loaded_model:MyModel=None
+        self.model_cache = LocalModelCache() if use_local_cache else None
 
 
     def is_model_present(self,model_path):
@@ -27,13 +33,35 @@ class Proj1Estimator:
             print(e)
             return False
 
+    def get_model_version(self) -> str:
+        """
+        Returns the version tag (ETag) of the model currently stored at model_path
+        :return:
+        """
+        try:
+            return self.s3.get_object_version(bucket_name=self.bucket_name, s3_key=self.model_path)
+        except Exception as e:
+            raise MyException(e, sys)
+
     def load_model(self,)->MyModel:
         """
-        Load the model from the model_path
+        Load the model from the model_path, from the local cache when the ETag in s3 is already cached
         :return:
         """
+        try:
+            if self.model_cache is None:
+                return self.s3.load_model(self.model_path,bucket_name=self.bucket_name)
 
-        return self.s3.load_model(self.model_path,bucket_name=self.bucket_name)
+            etag = self.get_model_version()
+            content = self.model_cache.get(self.bucket_name, self.model_path, etag)
+            if content is None:
+                content, etag = self.s3.download_object(bucket_name=self.bucket_name, s3_key=self.model_path)
+                self.model_cache.put(self.bucket_name, self.model_path, etag, content)
+            model = pickle.loads(content)
+            logging.info("Production model loaded.")
+            return model
+        except Exception as e:
+            raise MyException(e, sys)
 
     def save_model(self,from_file,remove:bool=False)->None:
         """
@@ -0,0 +1,89 @@
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Tuple, List
+import numpy as np
+from src.exception import MyException
+from src.utils.main_utils import read_yaml_file
+
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    """
+    Immutable, parsed form of config/schema.yaml for the serving path
+    """
+    feature_columns: Tuple[str, ...]
+    feature_index: Mapping[str, int]
+    drop_columns: frozenset
+    output_column: str
+    dtypes: Mapping[str, str]
+
+    @classmethod
+    def from_schema_info(cls, schema_info: dict) -> "CompiledSchema":
+        output_column = schema_info["output_column"]
+        drop_columns = frozenset(schema_info["to_delete_columns"])
+        numerical_columns = set(schema_info["numerical_columns"])
+        feature_columns = tuple(
+            column for column in schema_info["columns"]
+            if column != output_column and column not in drop_columns
+        )
+        dtypes = {column: "float32" if column in numerical_columns else "category" for column in schema_info["columns"]}
+        return cls(
+            feature_columns=feature_columns,
+            feature_index=MappingProxyType({column: i for i, column in enumerate(feature_columns)}),
+            drop_columns=drop_columns,
+            output_column=output_column,
+            dtypes=MappingProxyType(dtypes),
+        )
+
+    def check_columns(self, payload: dict, required_columns=None) -> Tuple[List[str], List[str]]:
+        """
+        :param required_columns: feature columns the payload must have, all of them by default
+        :return: (missing feature columns, unexpected columns) of a dict-of-lists payload.
+                 Dropped columns and the output column are not reported as unexpected.
+        """
+        required_columns = self.feature_columns if required_columns is None else required_columns
+        missing = [column for column in required_columns if column not in payload]
+        extra = [
+            column for column in payload
+            if column not in self.feature_index and column not in self.drop_columns and column != self.output_column
+        ]
+        return missing, extra
+
+    def to_feature_matrix(self, payload: dict, dtype=np.float32, columns=None) -> np.ndarray:
+        """
+        Writes a dict-of-lists payload straight into a preallocated (rows, features) matrix
+        in feature_columns order. Missing values (None/NaN) become NaN.
+        :param columns: only parse these feature columns (the ones the model uses), the others stay NaN
+        """
+        try:
+            columns = self.feature_columns if columns is None else columns
+            missing, _ = self.check_columns(payload, columns)
+            if missing:
+                raise ValueError(f"Payload is missing feature columns: {missing}")
+            n_rows = len(payload[columns[0]]) if columns else len(next(iter(payload.values()), []))
+            if len(columns) == len(self.feature_columns):
+                matrix = np.empty((n_rows, len(self.feature_columns)), dtype=dtype)
+            else:
+                matrix = np.full((n_rows, len(self.feature_columns)), np.nan, dtype=dtype)
+            for column in columns:
+                i = self.feature_index[column]
+                values = payload[column]
+                if len(values) != n_rows:
+                    raise ValueError(f"Column {column} has {len(values)} values, expected {n_rows}")
+                matrix[:, i] = np.asarray(values, dtype=dtype)
+            return matrix
+        except Exception as e:
+            raise MyException(e, sys)
+
+
+@lru_cache(maxsize=None)
+def load_compiled_schema(schema_file_path: str) -> CompiledSchema:
+    """
+    Parses schema_file_path once per process and returns the cached compiled schema
+    """
+    try:
+        return CompiledSchema.from_schema_info(read_yaml_file(schema_file_path))
+    except Exception as e:
+        raise MyException(e, sys)
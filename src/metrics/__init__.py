@@ -0,0 +1,346 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from 100 microseconds to 10 seconds
+DEFAULT_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+class _Sharded:
+    """
+    Every thread writes to its own shard, so updates need no lock and are never lost;
+    readers add the shards up when the metrics are rendered.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> list:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = [0] * self._size
+            # Taken once per thread, never on the update path
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _totals(self) -> list:
+        totals = [0] * self._size
+        for shard in list(self._shards):
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class Counter(_Sharded):
+
+    def __init__(self, name: str, documentation: str, labels: dict = None):
+        super().__init__(1)
+        self.name, self.documentation, self.labels = name, documentation, labels or {}
+        self.type = "counter"
+
+    def inc(self, amount: float = 1) -> None:
+        self._shard()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._totals()[0]
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge:
+    """
+    A value that goes up and down, either set directly or read from a callback at render time
+    """
+
+    def __init__(self, name: str, documentation: str, labels: dict = None, function=None):
+        self.name, self.documentation, self.labels = name, documentation, labels or {}
+        self.type = "gauge"
+        self.function = function
+        self._value = 0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self.function() if self.function is not None else self._value
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Info:
+    """
+    Constant 1 gauge whose labels carry a piece of state, e.g. the loaded model version
+    """
+
+    def __init__(self, name: str, documentation: str):
+        self.name, self.documentation = name, documentation
+        self.type = "gauge"
+        self.labels = None
+
+    def set(self, **labels) -> None:
+        self.labels = labels
+
+    def samples(self):
+        if self.labels is not None:
+            yield self.name, self.labels, 1
+
+
+class Histogram(_Sharded):
+    """
+    Histogram with fixed, pre-computed bucket bounds; the per-thread shard holds one
+    count per bucket (plus +Inf), the running sum and the observation count
+    """
+
+    def __init__(self, name: str, documentation: str, labels: dict = None, buckets: tuple = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(len(buckets) + 3)
+        self.name, self.documentation, self.labels = name, documentation, labels or {}
+        self.type = "histogram"
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float) -> None:
+        shard = self._shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self):
+        totals = self._totals()
+        cumulative = 0
+        for bound, count in zip(self.buckets, totals):
+            cumulative += count
+            yield self.name + "_bucket", {**self.labels, "le": repr(float(bound))}, cumulative
+        yield self.name + "_bucket", {**self.labels, "le": "+Inf"}, totals[-1]
+        yield self.name + "_sum", self.labels, totals[-2]
+        yield self.name + "_count", self.labels, totals[-1]
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: dict = None) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: dict = None, function=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labels, function))
+
+    def info(self, name: str, documentation: str) -> Info:
+        return self.register(Info(name, documentation))
+
+    def histogram(self, name: str, documentation: str, labels: dict = None, buckets: tuple = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def collect(self) -> list:
+        """
+        :return: (name, documentation, type, samples) of every metric, with the samples as
+                 (sample name, labels, value) tuples
+        """
+        return [(metric.name, metric.documentation, metric.type, list(metric.samples())) for metric in list(self._metrics)]
+
+    def render(self) -> str:
+        """
+        Returns every registered metric in the Prometheus text exposition format
+        """
+        return render_families(self.collect())
+
+
+def render_families(families) -> str:
+    lines = []
+    described = set()
+    for name, documentation, metric_type, samples in families:
+        if name not in described:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            described.add(name)
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MultiprocessMetrics:
+    """
+    Sums the metrics of the prefork server's processes, each of which only counts what it
+    handled itself. Every process writes snapshots of its registry to a shared directory and
+    /metrics, whichever worker answers it, renders the sum of the snapshots. Counters and
+    histograms only count what happened after the fork, the master's own (model loads) come
+    from its snapshot, and those of exited workers are kept in an archive so the totals never
+    go down. Gauges are summed over the live workers, e.g. aps_model_info counts the workers
+    serving each model version.
+    """
+
+    ARCHIVE = "archive"
+
+    def __init__(self, directory: str, registry: MetricsRegistry = None):
+        self.directory = directory
+        self.registry = registry or REGISTRY
+        # Counter and histogram values inherited from the master at fork, not counted again
+        self._baseline = {}
+
+    def _path(self, name) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    @staticmethod
+    def _sample_key(sample_name: str, labels: dict) -> str:
+        return json.dumps([sample_name, labels])
+
+    def forked(self) -> None:
+        """
+        Called in a new worker: starts its counters and histograms from zero
+        """
+        self._baseline = {
+            self._sample_key(sample_name, labels): value
+            for _, _, metric_type, samples in self.registry.collect() if metric_type != "gauge"
+            for sample_name, labels, value in samples
+        }
+
+    def _write(self, name, families: list) -> None:
+        # Written aside and renamed, so a reader never sees half a snapshot
+        path = self._path(name)
+        with open(f"{path}.{os.getpid()}.tmp", "w") as snapshot_file:
+            json.dump(families, snapshot_file)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def _read(self, name) -> list:
+        try:
+            with open(self._path(name)) as snapshot_file:
+                return json.load(snapshot_file)
+        except FileNotFoundError:
+            return []
+
+    def write_snapshot(self, name=None, gauges: bool = True) -> None:
+        """
+        Writes this process' metrics, under its pid unless another name is given
+        """
+        families = []
+        for metric_name, documentation, metric_type, samples in self.registry.collect():
+            if metric_type == "gauge":
+                if not gauges:
+                    continue
+            else:
+                samples = [(sample_name, labels, value - self._baseline.get(self._sample_key(sample_name, labels), 0))
+                           for sample_name, labels, value in samples]
+            families.append((metric_name, documentation, metric_type, samples))
+        self._write(name or os.getpid(), families)
+
+    def write_master_snapshot(self) -> None:
+        # The master serves no requests, only its counters and histograms (model loads) count
+        self.write_snapshot("master", gauges=False)
+
+    def start_snapshots(self, interval_seconds: float) -> None:
+        """
+        Keeps this worker's snapshot at most interval_seconds old from a background thread
+        """
+        def run():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.write_snapshot()
+                except OSError:
+                    # The master removed the directory on shutdown
+                    return
+
+        threading.Thread(target=run, name="metrics-snapshot", daemon=True).start()
+
+    def archive(self, pid: int) -> None:
+        """
+        Called by the master once a worker exited: folds its counters and histograms into the
+        archive and drops its gauges
+        """
+        families = self._read(pid)
+        if families:
+            kept = [family for family in families if family[2] != "gauge"]
+            self._write(self.ARCHIVE, self._sum([self._read(self.ARCHIVE), kept]))
+        try:
+            os.remove(self._path(pid))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _sum(snapshots: list) -> list:
+        families = {}
+        for snapshot in snapshots:
+            for name, documentation, metric_type, samples in snapshot:
+                family = families.setdefault(name, (documentation, metric_type, {}))
+                for sample_name, labels, value in samples:
+                    key = MultiprocessMetrics._sample_key(sample_name, labels)
+                    previous = family[2].get(key, (sample_name, labels, 0))
+                    family[2][key] = (sample_name, labels, previous[2] + value)
+        return [(name, documentation, metric_type, list(samples.values()))
+                for name, (documentation, metric_type, samples) in families.items()]
+
+    def render(self) -> str:
+        """
+        Renders the sum of every process' latest snapshot, this process' own being written first
+        """
+        self.write_snapshot()
+        names = sorted(entry[:-len(".json")] for entry in os.listdir(self.directory) if entry.endswith(".json"))
+        return render_families(self._sum([self._read(name) for name in names]))
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY_NAME = "aps_serving_stage_latency_seconds"
+STAGE_LATENCY_HELP = "Latency of each stage of the prediction serving path"
+UPLOAD_READ_SECONDS = REGISTRY.histogram(STAGE_LATENCY_NAME, STAGE_LATENCY_HELP, {"stage": "upload_read"})
+PAYLOAD_DECODE_SECONDS = REGISTRY.histogram(STAGE_LATENCY_NAME, STAGE_LATENCY_HELP, {"stage": "payload_decode"})
+SCHEMA_BUILD_SECONDS = REGISTRY.histogram(STAGE_LATENCY_NAME, STAGE_LATENCY_HELP, {"stage": "schema_build"})
+PREPROCESS_SECONDS = REGISTRY.histogram(STAGE_LATENCY_NAME, STAGE_LATENCY_HELP, {"stage": "preprocess"})
+FIRST_STAGE_SECONDS = REGISTRY.histogram(STAGE_LATENCY_NAME, STAGE_LATENCY_HELP, {"stage": "first_stage"})
+BOOSTER_PREDICT_SECONDS = REGISTRY.histogram(STAGE_LATENCY_NAME, STAGE_LATENCY_HELP, {"stage": "booster_predict"})
+MODEL_LOAD_SECONDS = REGISTRY.histogram("aps_model_load_seconds", "Time to download, compile and warm up a production model",
+                                        buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0))
+MODEL_INFO = REGISTRY.info("aps_model_info", "Version of the production model currently being served")
+IN_FLIGHT_REQUESTS = REGISTRY.gauge("aps_in_flight_requests", "Prediction requests currently being handled")
+SHED_REQUESTS = REGISTRY.counter("aps_requests_shed_total", "Prediction requests rejected because the service was at capacity")
+DEADLINE_EXCEEDED_NAME = "aps_requests_deadline_exceeded_total"
+DEADLINE_EXCEEDED_HELP = "Prediction requests dropped before inference because their deadline passed or the client left"
+DEADLINE_EXCEEDED = {
+    stage: REGISTRY.counter(DEADLINE_EXCEEDED_NAME, DEADLINE_EXCEEDED_HELP, {"stage": stage})
+    for stage in ("upload_read", "inference_queue", "micro_batch", "client_disconnected")
+}
+DEGRADED_PREDICTIONS = REGISTRY.counter("aps_degraded_predictions_total", "Model calls scored with a truncated ensemble because the service was under pressure")
+CASCADE_ROWS_NAME = "aps_cascade_rows_total"
+CASCADE_ROWS_HELP = "Rows scored by the cascade, by the stage that decided them"
+CASCADE_EARLY_EXIT_ROWS = REGISTRY.counter(CASCADE_ROWS_NAME, CASCADE_ROWS_HELP, {"decided_by": "first_stage"})
+CASCADE_ESCALATED_ROWS = REGISTRY.counter(CASCADE_ROWS_NAME, CASCADE_ROWS_HELP, {"decided_by": "full_model"})
+PREDICTION_LOG_WRITTEN_ROWS = REGISTRY.counter("aps_prediction_log_written_rows_total", "Predictions written to the prediction log")
+PREDICTION_LOG_DROPPED_ROWS = REGISTRY.counter("aps_prediction_log_dropped_rows_total", "Predictions not logged because the writer could not keep up or failed")
@@ -0,0 +1,99 @@
+import time
+from contextlib import asynccontextmanager
+from typing import Mapping
+from src.logger import logging
+from src.constants import APP_MAX_IN_FLIGHT_REQUESTS, APP_RETRY_AFTER_SECONDS
+from src.constants import APP_REQUEST_TIMEOUT_SECONDS, APP_REQUEST_TIMEOUT_HEADER
+from src.metrics import SHED_REQUESTS, DEADLINE_EXCEEDED, IN_FLIGHT_REQUESTS
+
+
+class ServiceOverloaded(Exception):
+    """
+    Raised when a request arrives while the service is already at capacity
+    """
+
+    def __init__(self, retry_after_seconds: int):
+        super().__init__(f"Prediction service is at capacity, retry after {retry_after_seconds} seconds")
+        self.retry_after_seconds = retry_after_seconds
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request's deadline passes, or its client disconnects, before inference
+    """
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded before inference ({stage})")
+        self.stage = stage
+
+
+class RequestDeadline:
+    """
+    Point in time after which nobody is waiting for the request's result any more
+    """
+
+    def __init__(self, timeout_seconds: float = None):
+        self.expires_at = time.monotonic() + timeout_seconds if timeout_seconds else None
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, stage: str) -> None:
+        """
+        Drops the request with DeadlineExceeded when its deadline has passed
+        """
+        if self.expired:
+            self.drop(stage)
+
+    @staticmethod
+    def drop(stage: str) -> None:
+        DEADLINE_EXCEEDED[stage].inc()
+        raise DeadlineExceeded(stage)
+
+
+class AdmissionController:
+    """
+    Bounds the number of prediction requests in flight in this process. Requests over the
+    limit are rejected straight away with ServiceOverloaded instead of queueing behind
+    work they would time out on, and admitted requests carry a deadline that is checked
+    before every queue they wait in.
+    """
+
+    def __init__(self, max_in_flight: int = APP_MAX_IN_FLIGHT_REQUESTS,
+                 retry_after_seconds: int = APP_RETRY_AFTER_SECONDS,
+                 default_timeout_seconds: float = APP_REQUEST_TIMEOUT_SECONDS):
+        self.max_in_flight = max_in_flight
+        self.retry_after_seconds = retry_after_seconds
+        self.default_timeout_seconds = default_timeout_seconds
+        self.in_flight = 0
+        logging.info(f"Admission control: at most {max_in_flight} requests in flight")
+
+    def deadline_for(self, headers: Mapping[str, str]) -> RequestDeadline:
+        """
+        Deadline from the client's X-Request-Timeout-Ms header, or the default request timeout
+        """
+        timeout_ms = headers.get(APP_REQUEST_TIMEOUT_HEADER)
+        if timeout_ms:
+            try:
+                return RequestDeadline(max(float(timeout_ms), 1.0) / 1000)
+            except ValueError:
+                logging.info(f"Ignoring invalid {APP_REQUEST_TIMEOUT_HEADER} header: {timeout_ms}")
+        return RequestDeadline(self.default_timeout_seconds)
+
+    @asynccontextmanager
+    async def admit(self, headers: Mapping[str, str]):
+        """
+        Holds an in-flight slot for the duration of the request and yields its deadline.
+        Only touched from the event loop, so the counter needs no lock.
+        """
+        if self.in_flight >= self.max_in_flight:
+            SHED_REQUESTS.inc()
+            raise ServiceOverloaded(self.retry_after_seconds)
+        self.in_flight += 1
+        IN_FLIGHT_REQUESTS.inc()
+        try:
+            yield self.deadline_for(headers)
+        finally:
+            self.in_flight -= 1
+            IN_FLIGHT_REQUESTS.dec()
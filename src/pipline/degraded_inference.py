@@ -0,0 +1,67 @@
+import sys
+import time
+from src.logger import logging
+from src.exception import MyException
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.metrics import DEGRADED_PREDICTIONS
+
+# Weight of the newest request in the recent latency average
+LATENCY_SMOOTHING = 0.2
+
+
+class InferenceDepthController:
+    """
+    Decides how many trees of the ensemble each prediction scores. While the inference queue
+    or the recent request latency is over its threshold the model is scored with only its
+    first degraded_inference_n_trees trees. Full depth comes back once both have stayed
+    under half their threshold for degraded_inference_recovery_seconds, so the mode does
+    not flap when the cheaper scoring itself brings the latency down.
+    Only used from the event loop, so the state needs no lock.
+    """
+
+    def __init__(self, queue_depth, APSSensor_predictor_config: APSSensorPredictorConfig = APSSensorPredictorConfig()):
+        """
+        :param queue_depth: callable returning the number of jobs currently waiting for inference
+        """
+        try:
+            self.queue_depth = queue_depth
+            self.enabled = APSSensor_predictor_config.degraded_inference_enabled
+            self.degraded_n_trees = APSSensor_predictor_config.degraded_inference_n_trees
+            self.queue_depth_threshold = APSSensor_predictor_config.degraded_inference_queue_depth
+            self.latency_threshold = APSSensor_predictor_config.degraded_inference_latency_ms / 1000
+            self.recovery_seconds = APSSensor_predictor_config.degraded_inference_recovery_seconds
+            self.recent_latency = 0.0
+            self.degraded = False
+            self._calm_since = None
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def observe_latency(self, seconds: float) -> None:
+        self.recent_latency += LATENCY_SMOOTHING * (seconds - self.recent_latency)
+
+    def n_trees(self) -> int:
+        """
+        :return: the number of trees to score with, None for the full ensemble
+        """
+        if not self.enabled:
+            return None
+        queue_depth = self.queue_depth()
+        if queue_depth >= self.queue_depth_threshold or self.recent_latency >= self.latency_threshold:
+            self._calm_since = None
+            if not self.degraded:
+                self.degraded = True
+                logging.info(f"Inference under pressure (queue depth {queue_depth}, recent latency "
+                             f"{self.recent_latency * 1000:.1f} ms), scoring with the first {self.degraded_n_trees} trees")
+        elif self.degraded:
+            if queue_depth >= self.queue_depth_threshold / 2 or self.recent_latency >= self.latency_threshold / 2:
+                self._calm_since = None
+            elif self._calm_since is None:
+                self._calm_since = time.monotonic()
+            elif time.monotonic() - self._calm_since >= self.recovery_seconds:
+                self.degraded = False
+                self._calm_since = None
+                logging.info("Inference pressure subsided, scoring with the full ensemble")
+        if self.degraded:
+            DEGRADED_PREDICTIONS.inc()
+            return self.degraded_n_trees
+        return None
@@ -0,0 +1,166 @@
+import io
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
+from src.logger import logging
+from src.exception import MyException
+from src.constants import APP_INFERENCE_WORKERS, APP_INFERENCE_QUEUE_SIZE
+from src.utils.main_utils import load_json_payload
+from src.metrics import PAYLOAD_DECODE_SECONDS
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.entity.schema import load_compiled_schema
+from src.pipline.prediction_pipeline import APSSensorDataFrame, APSSensorPredictor, APSSensorModelHolder, ResidentModel
+from src.pipline.admission_control import RequestDeadline
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+NPY_CONTENT_TYPE = "application/x-npy"
+ARROW_STREAM_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def payload_dtype(resident: ResidentModel = None):
+    """
+    Feature matrix dtype for payloads scored by resident. Its float64 preprocessing only matches the
+    fitted pipeline when the payload values reach it unrounded, so they are decoded as float64 then.
+    """
+    if resident is not None and getattr(resident.model, "preprocess_dtype", None) == np.float32:
+        return np.float32
+    return np.float64
+
+
+def parse_json_payload(raw: bytes, columns=None, dtype=np.float64) -> np.ndarray:
+    """
+    Decodes an uploaded dict-of-lists JSON payload into the model's feature matrix
+    :param columns: only require and parse these feature columns, all of them when None
+    """
+    with PAYLOAD_DECODE_SECONDS.time():
+        dictionary = load_json_payload(raw)
+    return APSSensorDataFrame(dictionary=dictionary).final_input_matrix(columns, dtype=dtype)
+
+
+def parse_npy_payload(raw: bytes, dtype=np.float64) -> np.ndarray:
+    """
+    Maps a .npy matrix (rows x features, in schema column order) onto the request bytes
+    without copying them; payloads already in dtype go to the model as they are.
+    """
+    buffer = io.BytesIO(raw)
+    version = np.lib.format.read_magic(buffer)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(buffer)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(buffer)
+    if dtype.hasobject:
+        raise ValueError("Object arrays are not accepted")
+    schema = load_compiled_schema(APSSensorPredictorConfig().SCHEMA_FILE_PATH)
+    if len(shape) != 2 or shape[1] != len(schema.feature_columns):
+        raise ValueError(f"Expected a (rows, {len(schema.feature_columns)}) matrix, got shape {shape}")
+    matrix = np.frombuffer(raw, dtype=dtype, count=shape[0] * shape[1], offset=buffer.tell())
+    matrix = matrix.reshape(shape, order="F" if fortran_order else "C")
+    return matrix.astype(dtype, copy=False)
+
+
+def parse_arrow_payload(raw: bytes, columns=None, dtype=np.float64) -> np.ndarray:
+    """
+    Reads an Arrow IPC stream with one named column per feature into the feature matrix.
+    Arrow buffers are read in place and each column is copied once into the matrix.
+    :param columns: only require and read these feature columns, all of them when None
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required for Arrow IPC payloads")
+    table = pa.ipc.open_stream(pa.py_buffer(raw)).read_all()
+    schema = load_compiled_schema(APSSensorPredictorConfig().SCHEMA_FILE_PATH)
+    columns = columns or schema.feature_columns
+    missing, extra = schema.check_columns(dict.fromkeys(table.column_names), columns)
+    if missing:
+        raise ValueError(f"Missing columns in the input data: {missing}")
+    if extra:
+        logging.info(f"Ignoring unexpected columns in the input data: {extra}")
+    # Column-major, so every column lands in one contiguous block; columns the model does not use stay NaN
+    matrix = np.full((table.num_rows, len(schema.feature_columns)), np.nan, dtype=dtype, order="F")
+    for column in columns:
+        matrix[:, schema.feature_index[column]] = table.column(column).to_numpy()
+    return matrix
+
+
+def parse_payload(raw: bytes, content_type: str, resident: ResidentModel = None) -> np.ndarray:
+    """
+    Decodes a request body into the feature matrix according to its content type
+    :param resident: model the features will be scored with; only the columns it reads are parsed.
+                     Every column is parsed when None.
+    """
+    columns = APSSensorModelHolder.serving_columns(resident)
+    dtype = payload_dtype(resident)
+    content_type = (content_type or "").split(";")[0].strip()
+    if content_type == NPY_CONTENT_TYPE:
+        with PAYLOAD_DECODE_SECONDS.time():
+            return parse_npy_payload(raw, dtype)
+    if content_type == ARROW_STREAM_CONTENT_TYPE:
+        with PAYLOAD_DECODE_SECONDS.time():
+            return parse_arrow_payload(raw, columns, dtype)
+    return parse_json_payload(raw, columns, dtype)
+
+
+def predict_batch(features, n_trees: int = None, resident: ResidentModel = None) -> dict:
+    return APSSensorPredictor().predict_batch(features, n_trees=n_trees, resident=resident)
+
+
+class BoundedInferenceExecutor:
+    """
+    Runs the CPU-bound parse/transform/predict work off the event loop on a thread pool.
+    At most max_workers + max_queue_size jobs are admitted at a time, further callers wait on the
+    event loop without blocking it.
+    Jobs run in this process, so they share its resident model, hot swaps, prediction cache,
+    prediction log and metrics; xgboost and numpy release the GIL while scoring. To use more
+    cores than one process can, run several workers with the prefork server instead.
+    """
+
+    def __init__(self, max_workers: int = APP_INFERENCE_WORKERS,
+                 max_queue_size: int = APP_INFERENCE_QUEUE_SIZE):
+        try:
+            self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+            self.max_workers = max_workers
+            self.capacity = max_workers + max_queue_size
+            self.waiting = 0
+            self.admitted = 0
+            self._slots: asyncio.Semaphore = None
+            logging.info(f"Inference executor: thread pool with {max_workers} workers, queue size {max_queue_size}")
+        except Exception as e:
+            raise MyException(e, sys)
+
+    async def run(self, func, *args, deadline: RequestDeadline = None):
+        """
+        Runs func(*args) on the pool once a slot is free and returns its result.
+        A job whose deadline passed while it waited for the slot is dropped instead.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.capacity)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.admitted += 1
+        try:
+            if deadline is not None:
+                deadline.check("inference_queue")
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, partial(func, *args))
+        finally:
+            self.admitted -= 1
+            self._slots.release()
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Jobs admitted but not yet running on a worker, plus callers waiting for admission
+        """
+        return max(self.admitted - self.max_workers, 0) + self.waiting
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=True)
+        logging.info("Inference executor shut down")
@@ -0,0 +1,175 @@
+import sys
+import asyncio
+from dataclasses import dataclass
+import numpy as np
+from src.logger import logging
+from src.exception import MyException
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.pipline.inference_executor import BoundedInferenceExecutor, predict_batch
+from src.pipline.prediction_pipeline import ResidentModel
+from src.pipline.admission_control import RequestDeadline, DeadlineExceeded, ServiceOverloaded
+from src.constants import APP_RETRY_AFTER_SECONDS, PREDICTION_ID_COLUMN
+from src.pipline.degraded_inference import InferenceDepthController
+
+
+@dataclass
+class PendingPrediction:
+    features: np.ndarray
+    future: asyncio.Future
+    deadline: RequestDeadline = None
+    resident: ResidentModel = None
+
+
+class APSSensorMicroBatcher:
+    """
+    Coalesces concurrent prediction requests into one model call. Requests are queued and
+    flushed together once max_batch_size rows are waiting or max_wait_ms has passed since
+    the first one arrived, then each caller gets back the slice of the result for its rows.
+    Every flush runs as its own task, up to one per inference worker, and the scheduler keeps
+    collecting the next batch while earlier ones are being scored.
+    """
+
+    def __init__(self, executor: BoundedInferenceExecutor,
+                 APSSensor_predictor_config: APSSensorPredictorConfig = APSSensorPredictorConfig(),
+                 depth_controller: InferenceDepthController = None):
+        try:
+            self.executor = executor
+            self.depth_controller = depth_controller
+            self.max_batch_size = APSSensor_predictor_config.micro_batch_max_size
+            self.max_wait = APSSensor_predictor_config.micro_batch_max_wait_ms / 1000
+            # Batches scored at the same time; more would only wait in the executor's queue
+            self.max_in_flight = executor.max_workers
+            self._queue: asyncio.Queue = None
+            self._worker: asyncio.Task = None
+            self._flush_slots: asyncio.Semaphore = None
+            self._flushes = set()
+            self._collecting = []
+        except Exception as e:
+            raise MyException(e, sys)
+
+    async def start(self) -> None:
+        """
+        Starts the flushing task on the running event loop
+        """
+        self._queue = asyncio.Queue()
+        self._flush_slots = asyncio.Semaphore(self.max_in_flight)
+        self._worker = asyncio.create_task(self._run())
+        logging.info("Started the micro-batching scheduler")
+
+    async def stop(self) -> None:
+        """
+        Stops collecting, lets the batches already being scored finish and fails every request
+        still waiting for a batch with ServiceOverloaded, so no caller is left hanging
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        waiting = self._collecting
+        self._collecting = []
+        while self._queue is not None and not self._queue.empty():
+            waiting.append(self._queue.get_nowait())
+        for pending in waiting:
+            self._set_exception(pending, ServiceOverloaded(APP_RETRY_AFTER_SECONDS))
+        logging.info(f"Stopped the micro-batching scheduler, {len(waiting)} waiting requests rejected")
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def predict(self, features: np.ndarray, deadline: RequestDeadline = None,
+                      resident: ResidentModel = None) -> dict:
+        """
+        Queues a feature matrix for the next batch and waits for its own per-row results
+        :param resident: model the features were parsed for, they are scored with it
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(PendingPrediction(features=features, future=future, deadline=deadline, resident=resident))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Only collect a batch once it can be scored straight away
+            await self._flush_slots.acquire()
+            batch = self._collecting = [await self._queue.get()]
+            n_rows = len(batch[0].features)
+            flush_at = loop.time() + self.max_wait
+            while n_rows < self.max_batch_size:
+                timeout = flush_at - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(pending)
+                n_rows += len(pending.features)
+            self._collecting = []
+            flush = asyncio.create_task(self._flush(batch))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flush_done)
+
+    def _flush_done(self, flush: asyncio.Task) -> None:
+        self._flushes.discard(flush)
+        self._flush_slots.release()
+
+    async def _flush(self, batch: list) -> None:
+        batch = self._drop_expired(batch)
+        if not batch:
+            return
+        residents = list({id(pending.resident): pending.resident for pending in batch}.values())
+        if len(residents) > 1:
+            # A hot swap landed while the batch was collected: score each request with the model it was parsed for
+            for resident in residents:
+                await self._flush([pending for pending in batch if pending.resident is resident])
+            return
+        try:
+            features = batch[0].features if len(batch) == 1 else np.concatenate([pending.features for pending in batch])
+            # Depth is decided per batch, when it is about to be scored
+            n_trees = self.depth_controller.n_trees() if self.depth_controller is not None else None
+            result = await self.executor.run(predict_batch, features, n_trees, batch[0].resident)
+        except Exception as e:
+            if len(batch) == 1:
+                self._set_exception(batch[0], e)
+                return
+            # Score the requests one by one so a malformed payload only fails its own caller
+            logging.info(f"Micro-batch of {len(batch)} requests failed, scoring them individually")
+            for pending in batch:
+                await self._flush([pending])
+            return
+
+        logging.info(f"Micro-batch flushed: {len(batch)} requests, {len(features)} rows")
+        start = 0
+        for pending in batch:
+            end = start + len(pending.features)
+            if not pending.future.done():
+                pending.future.set_result({
+                    **result,
+                    **{key: result[key][start:end] for key in ("class", "probability", PREDICTION_ID_COLUMN) if key in result},
+                })
+            start = end
+
+    def _drop_expired(self, batch: list) -> list:
+        """
+        Fails the requests whose deadline passed while they waited for the batch, so they are not scored
+        """
+        live = []
+        for pending in batch:
+            try:
+                if pending.deadline is not None:
+                    pending.deadline.check("micro_batch")
+                live.append(pending)
+            except DeadlineExceeded as e:
+                self._set_exception(pending, e)
+        return live
+
+    @staticmethod
+    def _set_exception(pending: PendingPrediction, error: Exception) -> None:
+        if not pending.future.done():
+            pending.future.set_exception(error)
@@ -0,0 +1,97 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of per-row predictions with a time-to-live, keyed by a hash of the
+    canonicalised feature vector. Entries belong to one model version; a lookup or store
+    with a newer model empties the cache, so a model swap never serves stale results, while
+    requests still finishing on an older model bypass the cache instead of emptying it.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.version: str = None
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def row_keys(features: np.ndarray) -> List[bytes]:
+        """
+        Hashes every row of a float feature matrix, in its own dtype so float64 payloads that only
+        differ after float32 rounding get their own keys. NaN payloads and -0.0 are normalised
+        first so equal sensor snapshots always produce the same key.
+        """
+        canonical = np.where(np.isnan(features), np.nan, features).astype(features.dtype, copy=False)
+        canonical += features.dtype.type(0.0)
+        canonical = np.ascontiguousarray(canonical)
+        return [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in canonical]
+
+    def _check_version(self, version: str, generation: int) -> bool:
+        """
+        Moves the cache forward to a newer model
+        :return: False for a model older than the cached entries', which must bypass the cache
+        """
+        if version == self.version:
+            return True
+        if generation < self.generation:
+            return False
+        self._entries.clear()
+        self.version = version
+        self.generation = generation
+        return True
+
+    def lookup(self, version: str, keys: List[bytes], generation: int = 0) -> List[Optional[Tuple[str, float]]]:
+        """
+        :param generation: ResidentModel.generation of the model version, orders the versions
+        :return: the cached (label, probability) for every key, None where it is missing or expired
+        """
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            if not self._check_version(version, generation):
+                self.misses += len(keys)
+                return [None] * len(keys)
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    results.append(entry[1])
+                    self.hits += 1
+                else:
+                    if entry is not None:
+                        del self._entries[key]
+                    results.append(None)
+                    self.misses += 1
+        return results
+
+    def store(self, version: str, keys: List[bytes], values: List[Tuple[str, float]], generation: int = 0) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            if not self._check_version(version, generation):
+                return
+            for key, value in zip(keys, values):
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "model_version": self.version,
+        }
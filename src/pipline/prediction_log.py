@@ -0,0 +1,212 @@
+import os
+import sys
+import time
+import atexit
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from src.logger import logging
+from src.exception import MyException
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.entity.schema import load_compiled_schema
+from src.constants import PREDICTION_ID_COLUMN
+from src.metrics import PREDICTION_LOG_WRITTEN_ROWS, PREDICTION_LOG_DROPPED_ROWS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+PREDICTION_LOG_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+IN_PROGRESS_SUFFIX = ".inprogress"
+
+
+@dataclass
+class LoggedBatch:
+    features: object
+    labels: list
+    probabilities: list
+    model_version: str
+    n_trees: int
+    predicted_at: float
+    prediction_ids: list
+
+
+class PredictionLogWriter:
+    """
+    Append-only log of every production prediction. Request threads only append a reference to
+    the scored batch to a deque (append and popleft are atomic, no lock is taken); a background
+    thread turns the waiting batches into one Arrow table per flush and appends it to the current
+    Parquet or Arrow file, starting a new file every rotate_rows rows or rotate_seconds.
+    At most max_pending_batches batches wait in memory, further ones are dropped and counted.
+    Files are written under a temporary name and only get their final name once complete.
+    """
+
+    def __init__(self, APSSensor_predictor_config: APSSensorPredictorConfig = APSSensorPredictorConfig()):
+        try:
+            if pa is None:
+                raise ImportError("pyarrow is required for the prediction log")
+            config = APSSensor_predictor_config
+            if config.prediction_log_format not in PREDICTION_LOG_EXTENSIONS:
+                raise ValueError(f"Unknown prediction log format: {config.prediction_log_format}")
+            self.log_dir = config.prediction_log_dir
+            self.format = config.prediction_log_format
+            self.max_pending_batches = config.prediction_log_max_pending_batches
+            self.flush_interval = config.prediction_log_flush_interval_seconds
+            self.flush_batches = config.prediction_log_flush_batches
+            self.rotate_rows = config.prediction_log_rotate_rows
+            self.rotate_seconds = config.prediction_log_rotate_seconds
+            self.schema = load_compiled_schema(config.SCHEMA_FILE_PATH)
+            # The truck's real outcome is recorded later against the prediction id, in the outcome
+            # table that data ingestion joins with the log
+            self.arrow_schema = pa.schema(
+                [pa.field(column, pa.float32()) for column in self.schema.feature_columns]
+                + [
+                    pa.field(PREDICTION_ID_COLUMN, pa.string()),
+                    pa.field("predicted_class", pa.string()),
+                    pa.field("probability", pa.float32()),
+                    pa.field("model_version", pa.string()),
+                    pa.field("n_trees", pa.int32()),
+                    pa.field("predicted_at", pa.timestamp("ms", tz="UTC")),
+                ]
+            )
+            self._pending = deque()
+            self._wakeup = threading.Event()
+            self._stop_event = threading.Event()
+            self._thread = None
+            self._writer = None
+            self._file_path = None
+            self._file_rows = 0
+            self._file_opened_at = 0.0
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="prediction-log-writer", daemon=True)
+        self._thread.start()
+        # Batch scoring outside the app has no lifespan shutdown to close the log, so flush on interpreter exit too
+        atexit.register(self.close)
+        logging.info(f"Started the prediction log writer, writing {self.format} files to {self.log_dir}")
+
+    @property
+    def pending_batches(self) -> int:
+        return len(self._pending)
+
+    def log(self, features, labels: list, probabilities: list, model_version: str, n_trees: int = None,
+            prediction_ids: list = None) -> None:
+        """
+        Queues a scored batch for the writer; never blocks and never raises into the request path.
+        features is kept by reference and must not be modified afterwards.
+        """
+        if len(self._pending) >= self.max_pending_batches:
+            PREDICTION_LOG_DROPPED_ROWS.inc(len(labels))
+            return
+        self._pending.append(LoggedBatch(features, labels, probabilities, model_version, n_trees, time.time(),
+                                         prediction_ids))
+        if len(self._pending) >= self.flush_batches:
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+        self.flush()
+        self._close_file()
+
+    def flush(self) -> None:
+        """
+        Writes every waiting batch as one table. Only called from the writer thread, or after it stopped.
+        """
+        batches = []
+        while self._pending:
+            batches.append(self._pending.popleft())
+        if not batches:
+            self._rotate_if_due()
+            return
+        n_rows = sum(len(batch.labels) for batch in batches)
+        try:
+            table = self.to_table(batches)
+            self._rotate_if_due()
+            if self._writer is None:
+                self._open_file()
+            self._writer.write_table(table)
+            self._file_rows += n_rows
+            PREDICTION_LOG_WRITTEN_ROWS.inc(n_rows)
+        except Exception as e:
+            # Disk full or not writable: lose this flush, keep serving
+            PREDICTION_LOG_DROPPED_ROWS.inc(n_rows)
+            logging.error(f"Prediction log flush of {n_rows} rows failed: {e}")
+            self._close_file()
+
+    def to_table(self, batches: list):
+        features = np.concatenate([self.feature_matrix(batch.features) for batch in batches])
+        batch_rows = [len(batch.labels) for batch in batches]
+        columns = {column: features[:, i] for i, column in enumerate(self.schema.feature_columns)}
+        columns[PREDICTION_ID_COLUMN] = [
+            prediction_id for batch in batches for prediction_id in (batch.prediction_ids or [None] * len(batch.labels))
+        ]
+        columns["predicted_class"] = [label for batch in batches for label in batch.labels]
+        columns["probability"] = np.concatenate([np.asarray(batch.probabilities, dtype=np.float32) for batch in batches])
+        columns["model_version"] = np.repeat([batch.model_version for batch in batches], batch_rows)
+        columns["n_trees"] = np.repeat(np.array([batch.n_trees or 0 for batch in batches], dtype=np.int32), batch_rows)
+        columns["predicted_at"] = np.repeat(
+            np.array([int(batch.predicted_at * 1000) for batch in batches], dtype="datetime64[ms]"), batch_rows
+        )
+        return pa.table(columns, schema=self.arrow_schema)
+
+    def feature_matrix(self, features) -> np.ndarray:
+        if isinstance(features, pd.DataFrame):
+            return features.reindex(columns=list(self.schema.feature_columns)).to_numpy(dtype=np.float32, na_value=np.nan)
+        return np.asarray(features, dtype=np.float32)
+
+    def _rotate_if_due(self) -> None:
+        if self._writer is None:
+            return
+        if self._file_rows >= self.rotate_rows or time.monotonic() - self._file_opened_at >= self.rotate_seconds:
+            self._close_file()
+
+    def _open_file(self) -> None:
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
+        file_name = f"predictions_{timestamp}_{os.getpid()}{PREDICTION_LOG_EXTENSIONS[self.format]}"
+        self._file_path = os.path.join(self.log_dir, file_name)
+        in_progress_path = self._file_path + IN_PROGRESS_SUFFIX
+        if self.format == "parquet":
+            self._writer = pq.ParquetWriter(in_progress_path, self.arrow_schema)
+        else:
+            self._writer = pa.ipc.new_file(in_progress_path, self.arrow_schema)
+        self._file_rows = 0
+        self._file_opened_at = time.monotonic()
+
+    def _close_file(self) -> None:
+        if self._writer is None:
+            return
+        try:
+            self._writer.close()
+            os.replace(self._file_path + IN_PROGRESS_SUFFIX, self._file_path)
+            logging.info(f"Prediction log file {self._file_path} completed with {self._file_rows} rows")
+        except Exception as e:
+            logging.error(f"Could not complete prediction log file {self._file_path}: {e}")
+        finally:
+            self._writer = None
+
+    def close(self) -> None:
+        """
+        Stops the writer thread after it has written everything still waiting
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        logging.info("Stopped the prediction log writer")
+
@@ -1,11 +1,24 @@
 from src.entity.config_entity import APSSensorPredictorConfig
 import os
 import sys
+import time
+import uuid
+import hashlib
+import threading
+import itertools
+from dataclasses import dataclass
+import numpy as np
 from src.logger import logging
 from src.exception import MyException
 import pandas as pd
 from src.utils.main_utils import *
+from src.constants import PREDICTION_ID_COLUMN
 from src.entity.s3_estimator import Proj1Estimator
+from src.entity.estimator import MyModel
+from src.entity.schema import load_compiled_schema
+from src.pipline.prediction_cache import PredictionCache
+from src.pipline.prediction_log import PredictionLogWriter
+from src.metrics import SCHEMA_BUILD_SECONDS, MODEL_LOAD_SECONDS, MODEL_INFO
 
 class APSSensorDataFrame:
 
@@ -13,14 +26,14 @@ class APSSensorDataFrame:
         try:
             logging.info("Setting up clean data for the pediction")
             self.APSSensor_predictor_config = APSSensorPredictorConfig()
-            self.schema_info = read_yaml_file(self.APSSensor_predictor_config.SCHEMA_FILE_PATH)
+            self.schema = load_compiled_schema(self.APSSensor_predictor_config.SCHEMA_FILE_PATH)
             self.data_dict = dictionary
         except Exception as e:
             raise MyException(e, sys)
     
     def dropping_unwanted_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         try:
-            to_delete_columns = self.schema_info["to_delete_columns"]
+            to_delete_columns = list(self.schema.drop_columns)
             df = df.drop(columns=to_delete_columns, axis=1)
             return df
         except Exception as e:
@@ -35,31 +48,343 @@ class APSSensorDataFrame:
         
     def final_input_data(self):
         try:
-            df = self.dictionary_to_dataframe(self.data_dict)
-            df = self.dropping_unwanted_columns(df)
+            with SCHEMA_BUILD_SECONDS.time():
+                df = self.dictionary_to_dataframe(self.data_dict)
+                df = self.dropping_unwanted_columns(df)
             logging.info("Cleaned data setted up")
             return df
         except Exception as e:
             raise MyException(e, sys)
-        
+
+    def final_input_matrix(self, columns=None, dtype=np.float32) -> np.ndarray:
+        """
+        Fast path of final_input_data: writes the payload straight into a feature matrix
+        in schema column order without building a DataFrame
+        :param columns: only require and parse these feature columns, the others are left NaN
+        :param dtype: float64 keeps every payload value exact, float32 rounds them at decode
+        """
+        try:
+            with SCHEMA_BUILD_SECONDS.time():
+                missing, extra = self.schema.check_columns(self.data_dict, columns)
+                if missing:
+                    raise ValueError(f"Missing columns in the input data: {missing}")
+                if extra:
+                    logging.info(f"Ignoring unexpected columns in the input data: {extra}")
+                return self.schema.to_feature_matrix(self.data_dict, dtype=dtype, columns=columns)
+        except Exception as e:
+            raise MyException(e, sys)
+
+
+@dataclass(frozen=True)
+class ResidentModel:
+    model: MyModel
+    version: str
+    # Increases with every model this process loads, so a newer model can be told from an older one
+    generation: int = 0
+
+
+class APSSensorModelHolder:
+    """
+    Process-wide holder that keeps the production model resident in memory,
+    so it is fetched from s3 once per process instead of once per request
+    """
+
+    resident: ResidentModel = None
+    _lock = threading.RLock()
+    _generations = itertools.count(1)
+
+    @classmethod
+    def fetch(cls, APSSensor_predictor_config: APSSensorPredictorConfig = APSSensorPredictorConfig(),
+              warm_up: bool = True) -> ResidentModel:
+        """
+        Downloads and warms up the production model without making it the resident model.
+        When local_model_path is set the model is read from that file instead of s3.
+        """
+        try:
+            logging.info("Starting: Loading the production model from s3 bucket")
+            load_started = time.perf_counter()
+            if APSSensor_predictor_config.local_model_path:
+                version, model = cls.read_local_model(APSSensor_predictor_config.local_model_path)
+            else:
+                estimator = Proj1Estimator(
+                    bucket_name=APSSensor_predictor_config.bucket_name,
+                    model_path=APSSensor_predictor_config.s3_model_key_path,
+                )
+                # Version is read before the download, so a model pushed in between is picked up on the next poll
+                version = estimator.get_model_version()
+                model = estimator.load_model()
+            schema = load_compiled_schema(APSSensor_predictor_config.SCHEMA_FILE_PATH)
+            model.compile(input_columns=schema.feature_columns,
+                          prune=APSSensor_predictor_config.slim_serving_enabled,
+                          preprocess_dtype=APSSensor_predictor_config.preprocess_dtype)
+            if getattr(model, "truncation_costs", None):
+                logging.info(f"Test set total cost by number of trees scored: {model.truncation_costs}")
+            if warm_up:
+                cls.warm_up(model, APSSensor_predictor_config)
+            MODEL_LOAD_SECONDS.observe(time.perf_counter() - load_started)
+            logging.info(f"Completed: Loading the production model from s3 bucket, version {version}")
+            return ResidentModel(model=model, version=version, generation=next(cls._generations))
+        except Exception as e:
+            raise MyException(e, sys)
+
+    @staticmethod
+    def read_local_model(model_file_path: str) -> tuple:
+        """
+        Reads a model.pkl from local disk, versioned by the sha256 of its content
+        :return: (version, model)
+        """
+        try:
+            with open(model_file_path, "rb") as file_obj:
+                version = "sha256:" + hashlib.sha256(file_obj.read()).hexdigest()[:16]
+            model = load_object(model_file_path)
+            logging.info(f"Production model loaded from {model_file_path}")
+            return version, model
+        except Exception as e:
+            raise MyException(e, sys)
+
+    @classmethod
+    def swap(cls, resident: ResidentModel) -> None:
+        """
+        Atomically replaces the resident model; requests already holding the old one finish on it
+        """
+        with cls._lock:
+            cls.resident = resident
+            MODEL_INFO.set(version=resident.version)
+        logging.info(f"Resident production model is now version {resident.version}")
+
+    @classmethod
+    def load(cls, APSSensor_predictor_config: APSSensorPredictorConfig = APSSensorPredictorConfig(),
+             warm_up: bool = True) -> ResidentModel:
+        """
+        Downloads the production model from s3, warms it up and makes it the resident model
+        """
+        try:
+            with cls._lock:
+                resident = cls.fetch(APSSensor_predictor_config, warm_up=warm_up)
+                cls.swap(resident)
+                return resident
+        except Exception as e:
+            raise MyException(e, sys)
+
+    @staticmethod
+    def warm_up(model: MyModel, APSSensor_predictor_config: APSSensorPredictorConfig = APSSensorPredictorConfig()) -> None:
+        """
+        Runs one prediction on an all-missing row so the xgboost thread pool and the
+        sklearn input validation are initialised before the first real request
+        """
+        try:
+            logging.info("Starting: Warming up the production model")
+            schema = load_compiled_schema(APSSensor_predictor_config.SCHEMA_FILE_PATH)
+            warm_up_df = pd.DataFrame(np.nan, index=[0], columns=list(schema.feature_columns))
+            model.predict(warm_up_df)
+            logging.info("Completed: Warming up the production model")
+        except Exception as e:
+            raise MyException(e, sys)
+
+    @classmethod
+    def get_resident(cls) -> ResidentModel:
+        """
+        Returns the resident model and its version, loading it first if the process has not done so yet
+        """
+        try:
+            resident = cls.resident
+            if resident is None:
+                with cls._lock:
+                    if cls.resident is None:
+                        cls.load()
+                    resident = cls.resident
+            return resident
+        except Exception as e:
+            raise MyException(e, sys)
+
+    @staticmethod
+    def serving_columns(resident: ResidentModel,
+                        APSSensor_predictor_config: APSSensorPredictorConfig = APSSensorPredictorConfig()) -> tuple:
+        """
+        Feature columns the given model reads, None when it reads all of them or no model is given.
+        Callers fetch the resident model once per request and score with that same model, so a hot
+        swap between parsing and scoring cannot hand a slim payload to a model that reads other columns.
+        The prediction log records every input column, so payloads are parsed in full while it is enabled.
+        """
+        if resident is None or APSSensor_predictor_config.prediction_log_enabled:
+            return None
+        return getattr(resident.model, "serving_columns", None)
+
+    @classmethod
+    def get_model(cls) -> MyModel:
+        return cls.get_resident().model
+
+
+class APSSensorModelWatcher:
+    """
+    Background thread that polls the production model key in s3 and hot swaps a newly
+    pushed model into APSSensorModelHolder without touching the request path
+    """
+
+    def __init__(self, APSSensor_predictor_config: APSSensorPredictorConfig = APSSensorPredictorConfig(),
+                 warm_up: bool = True):
+        try:
+            self.APSSensor_predictor_config = APSSensor_predictor_config
+            self.warm_up = warm_up
+            self.estimator = Proj1Estimator(
+                bucket_name=self.APSSensor_predictor_config.bucket_name,
+                model_path=self.APSSensor_predictor_config.s3_model_key_path,
+            )
+            self._stop_event = threading.Event()
+            self._thread = None
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def check_for_new_model(self) -> bool:
+        """
+        Compares the ETag in s3 with the resident version and reloads on change
+        :return: True when a new model was swapped in
+        """
+        try:
+            latest_version = self.estimator.get_model_version()
+            resident = APSSensorModelHolder.resident
+            if resident is not None and resident.version == latest_version:
+                return False
+            logging.info(f"New production model version {latest_version} found in s3 bucket")
+            new_resident = APSSensorModelHolder.fetch(self.APSSensor_predictor_config, warm_up=self.warm_up)
+            APSSensorModelHolder.swap(new_resident)
+            return True
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.APSSensor_predictor_config.reload_poll_interval_seconds):
+            try:
+                self.check_for_new_model()
+            except Exception as e:
+                # Keep serving the resident model and retry on the next poll
+                logging.error(f"Production model hot reload failed: {e}")
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+        logging.info("Started the production model watcher")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        logging.info("Stopped the production model watcher")
+
+
 class APSSensorPredictor:
 
+    # Shared by every predictor in the process, created on first use when enabled
+    prediction_cache: PredictionCache = None
+    prediction_log: PredictionLogWriter = None
+    _cache_lock = threading.Lock()
+
     def __init__(self, APSSensor_predictor_config = APSSensorPredictorConfig()):
         try:
             self.APSSensor_predictor_config = APSSensor_predictor_config
         except Exception as e:
             raise MyException(e, sys)
-        
+
+    @classmethod
+    def get_prediction_cache(cls, APSSensor_predictor_config: APSSensorPredictorConfig) -> PredictionCache:
+        if not APSSensor_predictor_config.prediction_cache_enabled:
+            return None
+        if cls.prediction_cache is None:
+            with cls._cache_lock:
+                if cls.prediction_cache is None:
+                    cls.prediction_cache = PredictionCache(
+                        max_size=APSSensor_predictor_config.prediction_cache_max_size,
+                        ttl_seconds=APSSensor_predictor_config.prediction_cache_ttl_seconds,
+                    )
+        return cls.prediction_cache
+
+    @classmethod
+    def get_prediction_log(cls, APSSensor_predictor_config: APSSensorPredictorConfig) -> PredictionLogWriter:
+        if not APSSensor_predictor_config.prediction_log_enabled:
+            return None
+        if cls.prediction_log is None:
+            with cls._cache_lock:
+                if cls.prediction_log is None:
+                    prediction_log = PredictionLogWriter(APSSensor_predictor_config)
+                    prediction_log.start()
+                    cls.prediction_log = prediction_log
+        return cls.prediction_log
+
     def predict(self, df):
         try:
-            model = Proj1Estimator(
-                bucket_name=self.APSSensor_predictor_config.bucket_name,
-                model_path=self.APSSensor_predictor_config.s3_model_key_path,
-            )
+            model = APSSensorModelHolder.get_model()
             result =  model.predict(df)
             logging.info(f"Model results : {result}")
             
             return result
         
         except Exception as e:
-            raise MyException(e, sys)
\ No newline at end of file
+            raise MyException(e, sys)
+
+    def predict_batch(self, df, n_trees: int = None, resident: ResidentModel = None) -> dict:
+        """
+        Scores every row of df (a DataFrame or a feature matrix in schema column order)
+        with a single vectorized model call. Feature matrices are served from the prediction
+        cache when it is enabled, and only the rows it misses reach the model.
+        :param n_trees: score with only the first n_trees trees of the ensemble (degraded mode);
+                        these results bypass the prediction cache
+        :param resident: model to score with, the one df was parsed for; the resident model when None
+        :return: per-row class labels and positive class probabilities, plus the model version
+                 and the number of trees used. While the prediction log is enabled, also the per-row
+                 prediction ids the trucks' real outcomes are to be recorded against.
+        """
+        try:
+            resident = resident or APSSensorModelHolder.get_resident()
+            full_n_trees = resident.model.n_trees
+            degraded = n_trees is not None and n_trees < full_n_trees
+            prediction_cache = self.get_prediction_cache(self.APSSensor_predictor_config)
+            if prediction_cache is None or not isinstance(df, np.ndarray) or degraded:
+                labels, probabilities = self.score(resident.model, df, n_trees if degraded else None,
+                                                   nthread=self.APSSensor_predictor_config.predict_nthread)
+            else:
+                keys = prediction_cache.row_keys(df)
+                cached = prediction_cache.lookup(resident.version, keys, resident.generation)
+                missing_rows = [i for i, value in enumerate(cached) if value is None]
+                if missing_rows:
+                    missing_labels, missing_probabilities = self.score(resident.model, df[missing_rows],
+                                                                       nthread=self.APSSensor_predictor_config.predict_nthread)
+                    computed = list(zip(missing_labels, missing_probabilities))
+                    prediction_cache.store(resident.version, [keys[i] for i in missing_rows], computed,
+                                           resident.generation)
+                    for i, value in zip(missing_rows, computed):
+                        cached[i] = value
+                labels = [label for label, _ in cached]
+                probabilities = [probability for _, probability in cached]
+            logging.info(f"Batch of {len(df)} rows scored with model version {resident.version}")
+            n_trees_used = n_trees if degraded else full_n_trees
+            result = {
+                "class": labels,
+                "probability": probabilities,
+                "model_version": resident.version,
+                "n_trees": n_trees_used,
+                "degraded": degraded,
+            }
+            prediction_log = self.get_prediction_log(self.APSSensor_predictor_config)
+            if prediction_log is not None:
+                result[PREDICTION_ID_COLUMN] = self.prediction_ids(len(labels))
+                prediction_log.log(df, labels, probabilities, resident.version, n_trees_used, result[PREDICTION_ID_COLUMN])
+            return result
+        except Exception as e:
+            raise MyException(e, sys)
+
+    @staticmethod
+    def prediction_ids(n_rows: int) -> list:
+        # One random id per batch, suffixed with the row's position in it
+        batch_id = uuid.uuid4().hex
+        return [f"{batch_id}-{i}" for i in range(n_rows)]
+
+    @staticmethod
+    def score(model: MyModel, df, n_trees: int = None, nthread: int = None) -> tuple:
+        probabilities = model.predict_proba(df, n_trees=n_trees, nthread=nthread)
+        # Same 0.5 decision threshold XGBClassifier.predict applies for binary objectives
+        labels = np.where(probabilities > 0.5, "pos", "neg")
+        return labels.tolist(), probabilities.tolist()
\ No newline at end of file
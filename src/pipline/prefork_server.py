@@ -0,0 +1,305 @@
+import gc
+import os
+import sys
+import time
+import select
+import signal
+import shutil
+import socket
+import tempfile
+import uvicorn
+from src.logger import logging
+from src.exception import MyException
+from src.constants import APP_WORKER_READY_TIMEOUT_SECONDS, APP_WORKER_RESPAWN_BACKOFF_SECONDS
+from src.constants import APP_WORKER_MAX_RESPAWN_BACKOFF_SECONDS, APP_WORKER_MAX_FAILURES
+from src.constants import APP_WORKER_METRICS_SNAPSHOT_SECONDS
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.pipline.prediction_pipeline import APSSensorModelHolder, APSSensorModelWatcher
+from src.metrics import MultiprocessMetrics
+
+# How often the master checks on its workers
+MASTER_POLL_SECONDS = 0.2
+
+
+class ReadyNotifyingServer(uvicorn.Server):
+    """
+    uvicorn server that tells the master, over a pipe, once its lifespan startup (model warm-up)
+    is done and it accepts connections, and leaves a last metrics snapshot when it shuts down
+    """
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        try:
+            if self.started:
+                os.write(self.ready_fd, b"1")
+        except OSError:
+            pass
+        finally:
+            os.close(self.ready_fd)
+
+    async def shutdown(self, sockets=None) -> None:
+        await super().shutdown(sockets=sockets)
+        # uvicorn re-raises the SIGTERM that stopped it afterwards, so this is the last chance
+        PreforkServer.metrics.write_snapshot()
+
+
+class PreforkServer:
+    """
+    Multi-worker serving mode. The master process loads the production model once and then
+    forks the uvicorn workers, which share the listening socket and the model's read-only
+    booster and preprocessing arrays copy-on-write. Workers that exit (crash, or recycling
+    after max_requests) are replaced, after a delay that doubles with every failure in a row;
+    the master gives up after max_failures failures in a row. SIGHUP recycles all of them one
+    at a time, each old worker only being asked to finish once its replacement is ready.
+    With hot reload, the master alone polls for a new production model, loads it and recycles
+    the workers the same way, so the new ones inherit it. /metrics serves the sum over all the
+    workers, see MultiprocessMetrics.
+    """
+
+    # Set in the worker processes, for the app: workers start no model watcher and /metrics
+    # renders the metrics of every worker
+    in_worker = False
+    metrics: MultiprocessMetrics = None
+
+    def __init__(self, app, host: str, port: int, workers: int, max_requests: int = 0,
+                 ready_timeout: float = APP_WORKER_READY_TIMEOUT_SECONDS,
+                 respawn_backoff: float = APP_WORKER_RESPAWN_BACKOFF_SECONDS,
+                 max_respawn_backoff: float = APP_WORKER_MAX_RESPAWN_BACKOFF_SECONDS,
+                 max_failures: int = APP_WORKER_MAX_FAILURES,
+                 APSSensor_predictor_config: APSSensorPredictorConfig = APSSensorPredictorConfig()):
+        try:
+            self.app = app
+            self.host = host
+            self.port = port
+            self.workers = workers
+            self.max_requests = max_requests or None
+            self.ready_timeout = ready_timeout
+            self.respawn_backoff = respawn_backoff
+            self.max_respawn_backoff = max_respawn_backoff
+            self.max_failures = max_failures
+            self.APSSensor_predictor_config = APSSensor_predictor_config
+            # pid -> read end of the worker's readiness pipe, None once it has been read
+            self.children = {}
+            self.ready = set()
+            # Replaced workers that were asked to finish
+            self.retiring = set()
+            self.failures = 0
+            self.respawn_at = 0.0
+            self.recycle_requested = False
+            self.stopping = False
+            self.gave_up = False
+            # Workers still serving an older model after a rolling restart for a new one stopped early
+            self.stale_workers = False
+            self.next_model_check = 0.0
+            self.watcher: APSSensorModelWatcher = None
+            self.socket: socket.socket = None
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def spawn_worker(self) -> int:
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Worker: drop the master's handlers, uvicorn installs its own graceful shutdown ones
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(sig, signal.SIG_DFL)
+            # The master must see a sibling's pipe close when that sibling dies
+            os.close(ready_read)
+            for fd in self.children.values():
+                if fd is not None:
+                    os.close(fd)
+            exit_code = 0
+            try:
+                PreforkServer.in_worker = True
+                PreforkServer.metrics.forked()
+                PreforkServer.metrics.write_snapshot()
+                PreforkServer.metrics.start_snapshots(APP_WORKER_METRICS_SNAPSHOT_SECONDS)
+                config = uvicorn.Config(self.app, limit_max_requests=self.max_requests)
+                ReadyNotifyingServer(config, ready_write).run(sockets=[self.socket])
+            except BaseException as e:
+                logging.error(f"Worker {os.getpid()} failed: {e}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        os.close(ready_write)
+        self.children[pid] = ready_read
+        logging.info(f"Started worker {pid}")
+        return pid
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
+        for pid in list(self.children):
+            self._kill(pid, signal.SIGTERM)
+
+    def recycle(self, signum, frame) -> None:
+        # Runs from the master loop, which can wait for the replacement workers
+        self.recycle_requested = True
+
+    def rolling_restart(self) -> bool:
+        """
+        Replaces the workers one at a time: each old worker is asked to finish only once its
+        replacement is ready. Stops, keeping the remaining old workers, if a replacement is not.
+        :return: True when every worker was replaced
+        """
+        old_workers = [pid for pid in self.children if pid not in self.retiring]
+        logging.info(f"Starting: Rolling recycle of {len(old_workers)} workers")
+        for pid in old_workers:
+            if self.stopping:
+                return False
+            new_pid = self.spawn_worker()
+            if not self.wait_ready(new_pid):
+                logging.error(f"Replacement worker {new_pid} did not become ready, keeping the remaining workers")
+                self._kill(new_pid, signal.SIGTERM)
+                return False
+            self.retiring.add(pid)
+            self._kill(pid, signal.SIGTERM)
+        logging.info("Completed: Rolling recycle")
+        return True
+
+    def check_for_new_model(self) -> None:
+        """
+        Loads a newly pushed production model in the master and recycles the workers onto it.
+        Polled from the master loop rather than the watcher's thread, so no thread can be holding
+        a lock when a worker is forked.
+        """
+        self.next_model_check = time.monotonic() + self.APSSensor_predictor_config.reload_poll_interval_seconds
+        try:
+            if self.watcher.check_for_new_model():
+                PreforkServer.metrics.write_master_snapshot()
+                self.stale_workers = True
+        except Exception as e:
+            # Keep the workers on the resident model and retry on the next poll
+            logging.error(f"Production model hot reload failed: {e}")
+        if self.stale_workers and self.rolling_restart():
+            self.stale_workers = False
+
+    def wait_ready(self, pid: int) -> bool:
+        deadline = time.monotonic() + self.ready_timeout
+        while not self.stopping and pid in self.children and pid not in self.ready:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.poll_ready(min(remaining, MASTER_POLL_SECONDS))
+            self.reap_workers()
+        return pid in self.ready
+
+    def poll_ready(self, timeout: float) -> None:
+        """
+        Waits up to timeout, recording the workers that report ready meanwhile
+        """
+        pending = {fd: pid for pid, fd in self.children.items() if fd is not None}
+        if not pending:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select(list(pending), [], [], timeout)
+        for fd in readable:
+            self._read_ready(pending[fd])
+
+    def _read_ready(self, pid: int) -> None:
+        fd = self.children[pid]
+        # One byte once the worker serves, end of file when it died before that
+        if os.read(fd, 1):
+            self.ready.add(pid)
+            self.failures = 0
+            logging.info(f"Worker {pid} is ready")
+        os.close(fd)
+        self.children[pid] = None
+
+    def reap_workers(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid not in self.children:
+                continue
+            if self.children[pid] is not None:
+                self._read_ready(pid)
+            del self.children[pid]
+            PreforkServer.metrics.archive(pid)
+            ready = pid in self.ready
+            self.ready.discard(pid)
+            exit_code = os.waitstatus_to_exitcode(status)
+            logging.info(f"Worker {pid} exited with status {exit_code}")
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif not self.stopping and (exit_code != 0 or not ready):
+                self.worker_failed()
+
+    def worker_failed(self) -> None:
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            logging.error(f"{self.failures} worker failures in a row, shutting the prefork server down")
+            self.gave_up = True
+            self.stop(None, None)
+            return
+        delay = min(self.respawn_backoff * 2 ** (self.failures - 1), self.max_respawn_backoff)
+        self.respawn_at = time.monotonic() + delay
+        logging.info(f"{self.failures} worker failures in a row, replacing the worker in {delay:.1f}s")
+
+    def _kill(self, pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def run(self) -> None:
+        try:
+            logging.info(f"Starting: Prefork server with {self.workers} workers on {self.host}:{self.port}")
+            # Load once in the master. The warm-up prediction runs in each worker after the fork,
+            # since OpenMP thread pools started in the master do not survive fork
+            APSSensorModelHolder.load(self.APSSensor_predictor_config, warm_up=False)
+            config = self.APSSensor_predictor_config
+            # A model served from local disk (APS_LOCAL_MODEL_PATH) has no s3 key to poll
+            if config.hot_reload_enabled and not config.local_model_path:
+                self.watcher = APSSensorModelWatcher(config, warm_up=False)
+                self.next_model_check = time.monotonic() + config.reload_poll_interval_seconds
+            PreforkServer.metrics = MultiprocessMetrics(tempfile.mkdtemp(prefix="aps-metrics-"))
+            PreforkServer.metrics.write_master_snapshot()
+
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind((self.host, self.port))
+            self.socket.listen(2048)
+            self.socket.set_inheritable(True)
+
+            # Move everything allocated so far out of the garbage collector's reach, so collections
+            # in the workers do not write to (and un-share) the pages holding the model
+            gc.collect()
+            gc.freeze()
+
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGHUP, self.recycle)
+            for _ in range(self.workers):
+                self.spawn_worker()
+
+            while self.children or not self.stopping:
+                self.poll_ready(MASTER_POLL_SECONDS)
+                self.reap_workers()
+                if self.stopping:
+                    continue
+                if self.recycle_requested:
+                    self.recycle_requested = False
+                    if self.rolling_restart():
+                        self.stale_workers = False
+                elif len(self.children) - len(self.retiring) < self.workers and time.monotonic() >= self.respawn_at:
+                    self.spawn_worker()
+                elif self.watcher is not None and time.monotonic() >= self.next_model_check:
+                    self.check_for_new_model()
+
+            self.socket.close()
+            if self.gave_up:
+                raise RuntimeError(f"Workers failed {self.failures} times in a row")
+            logging.info("Completed: Prefork server shut down")
+        except Exception as e:
+            raise MyException(e, sys)
+        finally:
+            if PreforkServer.metrics is not None:
+                shutil.rmtree(PreforkServer.metrics.directory, ignore_errors=True)
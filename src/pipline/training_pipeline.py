@@ -8,7 +8,12 @@ from src.components.data_transformation import DataTransformation
 from src.components.model_trainer import ModelTrainer
 from src.components.model_evaluation import ModelEvaluation
 from src.components.model_pusher import ModelPusher
-from src.entity.config_entity import DataIngestionConfig, DataValidationConfig, DataTransformationConfig, ModelTrainerConfig, ModelEvaluationConfig, ModelPusherConfig
+from src.utils.artifact_writer import ArtifactWriter
+from src.utils.stage_cache import StageCache
+from src.data_access.proj1_data import Proj1Data
+from src.entity import schema
+from src.utils import main_utils
+from src.entity.config_entity import training_pipeline_config, DataIngestionConfig, DataValidationConfig, DataTransformationConfig, ModelTrainerConfig, ModelEvaluationConfig, ModelPusherConfig
 from src.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact, DataTransformationArtifact, ModelTrainerArtifact, ModelEvaluationArtifact, ModelPusherArtifact
 import os
 
@@ -22,8 +27,32 @@ class TrainPipeline:
             self.model_training_config = ModelTrainerConfig()
             self.model_evaluation_config = ModelEvaluationConfig()
             self.model_pusher_config = ModelPusherConfig()
+            # Stages hand their outputs to the next one in memory; the on-disk copies are written alongside
+            self.artifact_writer = ArtifactWriter(background=training_pipeline_config.background_persist)
+            # Ingestion, validation and transformation are skipped when their inputs have not changed
+            self.stage_cache = None
+            if training_pipeline_config.stage_cache_enabled:
+                self.stage_cache = StageCache(training_pipeline_config.stage_cache_dir, training_pipeline_config.artifact_dir)
+            self.stage_keys = {}
         except Exception as e:
             raise MyException(e, sys)
+
+    def run_cached_stage(self, stage: str, artifact_class, run_stage, config, code: list,
+                         input_files: list = (), upstream_stages: list = ()):
+        """
+        Reuses the cached artifact of stage when its key is in the stage cache, otherwise
+        runs run_stage() and caches the artifact it returns once its files are written
+        """
+        if self.stage_cache is None:
+            return run_stage()
+        key = self.stage_cache.key(stage, config, code, input_files,
+                                   [self.stage_keys[upstream] for upstream in upstream_stages])
+        self.stage_keys[stage] = key
+        artifact = self.stage_cache.load(stage, key, artifact_class)
+        if artifact is None:
+            artifact = run_stage()
+            self.artifact_writer.call(self.stage_cache.store, stage, key, artifact)
+        return artifact
     
     def start_data_ingestion(self) -> DataIngestionArtifact:
         """
@@ -31,8 +60,11 @@ class TrainPipeline:
         """
         try:
             logging.info("Entered the data ingestion method")
-            data_ingestion = DataIngestion(data_ingestion_config=self.data_ingestion_config)
-            data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
+            data_ingestion = DataIngestion(data_ingestion_config=self.data_ingestion_config,
+                                           artifact_writer=self.artifact_writer)
+            data_ingestion_artifact = self.run_cached_stage(
+                "data_ingestion", DataIngestionArtifact, data_ingestion.initiate_data_ingestion, self.data_ingestion_config,
+                code=[DataIngestion, Proj1Data, schema, main_utils], input_files=data_ingestion.input_files())
             logging.info("Exited the data ingestion method")
             return data_ingestion_artifact
         except Exception as e:
@@ -46,7 +78,10 @@ class TrainPipeline:
             logging.info("Entered the data validation method")
             data_validation = DataValidation(data_ingestion_artifact=data_ingestion_artifact,
                                              data_validation_config=self.data_validation_config)
-            data_validation_artifact = data_validation.initiate_data_validation()
+            data_validation_artifact = self.run_cached_stage(
+                "data_validation", DataValidationArtifact, data_validation.initiate_data_validation, self.data_validation_config,
+                code=[DataValidation, main_utils], input_files=[self.data_validation_config.SCHEMA_FILE_PATH],
+                upstream_stages=["data_ingestion"])
             logging.info("Exited the data validation method")
             return data_validation_artifact
         except Exception as e:
@@ -63,8 +98,12 @@ class TrainPipeline:
             logging.info("Entered the data transformation method")
             data_transformation = DataTransformation(data_ingestion_artifact=data_ingestion_artifact,
                                              data_validation_artifact=data_validation_artifact,
-                                             data_transformation_config=self.data_transformation_config)
-            data_transformation_artifact = data_transformation.initiate_data_transformation()
+                                             data_transformation_config=self.data_transformation_config,
+                                             artifact_writer=self.artifact_writer)
+            data_transformation_artifact = self.run_cached_stage(
+                "data_transformation", DataTransformationArtifact, data_transformation.initiate_data_transformation,
+                self.data_transformation_config, code=[DataTransformation, main_utils],
+                input_files=[self.data_transformation_config.SCHEMA_FILE_PATH], upstream_stages=["data_ingestion", "data_validation"])
             logging.info("Exited the data transformation method")
             return data_transformation_artifact
         except Exception as e:
@@ -79,7 +118,8 @@ class TrainPipeline:
         try:
             logging.info("Entered the model training method")
             model_trainer = ModelTrainer(model_trainer_config=self.model_training_config,
-                                        data_transformation_artifact=data_transformation_artifact
+                                        data_transformation_artifact=data_transformation_artifact,
+                                        artifact_writer=self.artifact_writer
                                         )
             model_trainer_artifact = model_trainer.initiate_model_trainer()
             logging.info("Exited the model training method")
@@ -134,6 +174,8 @@ class TrainPipeline:
             data_transformation_artifact = self.start_data_transformation(data_ingestion_artifact, data_validation_artifact)
             model_trainer_artifact = self.start_model_training(data_transformation_artifact)
             model_evaluation_artifact = self.start_model_evaluation(data_ingestion_artifact, model_trainer_artifact)
+            # The pusher uploads the model file, and the run's artifacts should all be on disk when it ends
+            self.artifact_writer.wait()
             if model_evaluation_artifact.is_model_accepted:
                 model_pusher_artifact = self.start_model_pusher(model_evaluation_artifact)
             logging.info("Completed the training pipeline")
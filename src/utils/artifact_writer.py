@@ -0,0 +1,47 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from src.exception import MyException
+from src.logger import logging
+
+
+class ArtifactWriter:
+    """
+    Writes stage artifacts to disk for the record while the pipeline moves on with the live objects.
+    With background=True every write runs, in submission order, on one background thread and the
+    next stage starts straight away; otherwise writes happen inline, as before.
+    Objects handed to submit must not be modified afterwards.
+    """
+
+    def __init__(self, background: bool = False):
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-writer") if background else None
+        self.pending = []
+
+    def submit(self, save, file_path: str, *args, **kwargs) -> str:
+        """
+        Runs save(file_path, *args, **kwargs), e.g. save_object or save_dataframe
+        :return: file_path
+        """
+        self.call(save, file_path, *args, **kwargs)
+        return file_path
+
+    def call(self, func, *args, **kwargs) -> None:
+        """
+        Runs func(*args, **kwargs) once every write submitted so far is done
+        """
+        if self.pool is None:
+            func(*args, **kwargs)
+        else:
+            self.pending.append(self.pool.submit(func, *args, **kwargs))
+
+    def wait(self) -> None:
+        """
+        Blocks until every submitted artifact is on disk, raising the first write error
+        """
+        try:
+            if self.pending:
+                logging.info(f"Waiting for {len(self.pending)} artifacts to be written")
+            pending, self.pending = self.pending, []
+            for future in pending:
+                future.result()
+        except Exception as e:
+            raise MyException(e, sys)
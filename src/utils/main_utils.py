@@ -1,10 +1,24 @@
 import os
+import re
 import sys
+import json
 
 import numpy as np
 import dill
 import yaml
-from pandas import DataFrame
+from pandas import DataFrame, read_csv, concat
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+except ImportError:
+    pq = None
 
 from src.exception import MyException
 from src.logger import logging
@@ -31,6 +45,29 @@ def write_yaml_file(file_path: str, content: object, replace: bool = False) -> N
         raise MyException(e, sys) from e
 
 
+_NAN_TOKEN = re.compile(rb'(?<!")\bNaN\b(?!")')
+
+
+def load_json_payload(raw: bytes) -> dict:
+    """
+    Decodes a JSON request payload held in memory.
+    Uses orjson when it is installed. Bare NaN tokens (as written by pandas/json.dump) are not valid
+    JSON, so they are rewritten to null first; anything orjson still rejects is handed to the
+    standard library decoder.
+    raw: bytes of the JSON document
+    return: decoded object
+    """
+    try:
+        if orjson is not None:
+            try:
+                return orjson.loads(_NAN_TOKEN.sub(b"null", raw))
+            except orjson.JSONDecodeError:
+                pass
+        return json.loads(raw)
+    except Exception as e:
+        raise MyException(e, sys) from e
+
+
 def load_object(file_path: str) -> object:
     """
     Returns model/object from project directory.
@@ -72,6 +109,155 @@ def load_numpy_array_data(file_path: str) -> np.array:
         raise MyException(e, sys) from e
 
 
+def dataframe_parts(dir_path: str) -> list:
+    """
+    Part files of a partitioned DataFrame artifact, in name order. Files starting with _ or . are
+    not parts, pyarrow datasets skip them too.
+    """
+    return [os.path.join(dir_path, name) for name in sorted(os.listdir(dir_path)) if not name.startswith(("_", "."))]
+
+
+def dataframe_file_format(file_path: str) -> str:
+    """
+    Artifact format of file_path, from its extension: "parquet", "feather" or "csv".
+    A directory is a partitioned artifact and has the format of its part files.
+    """
+    if os.path.isdir(file_path):
+        parts = dataframe_parts(file_path)
+        extensions = {os.path.splitext(part)[1] for part in parts}
+        if len(extensions) != 1:
+            raise ValueError(f"Partitioned data artifact {file_path} must hold part files of one format, found {extensions}")
+        file_path = parts[0]
+    file_format = os.path.splitext(file_path)[1].lstrip(".").lower()
+    if file_format not in ("parquet", "feather", "csv"):
+        raise ValueError(f"Unsupported data artifact format: {file_path}")
+    if file_format != "csv" and pq is None:
+        raise ImportError(f"pyarrow is required to read and write {file_format} artifacts")
+    return file_format
+
+
+def save_dataframe(file_path: str, df: DataFrame, dtypes: dict = None) -> None:
+    """
+    Save a DataFrame artifact in the format given by the file extension
+    file_path: str location of .parquet, .feather (Arrow IPC) or .csv file to save
+    df: DataFrame to save
+    dtypes: column -> dtype to store the columns as, e.g. the schema's float32 and category types
+    """
+    try:
+        file_format = dataframe_file_format(file_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if dtypes:
+            df = df.astype({column: dtype for column, dtype in dtypes.items() if column in df.columns})
+        if file_format == "parquet":
+            df.to_parquet(file_path, index=False)
+        elif file_format == "feather":
+            df.reset_index(drop=True).to_feather(file_path)
+        else:
+            df.to_csv(file_path, index=False, header=True)
+    except Exception as e:
+        raise MyException(e, sys) from e
+
+
+def read_dataframe(file_path: str, columns: list = None, dtypes: dict = None) -> DataFrame:
+    """
+    Read a DataFrame artifact saved by save_dataframe. Parquet and feather files are decoded
+    on all cores and only the requested columns are read from disk.
+    file_path: str location of file to load, or directory of part files of a partitioned artifact
+    columns: columns to read, all of them by default
+    dtypes: column -> dtype, only needed for csv files, the columnar formats keep their types
+    return: DataFrame loaded
+    """
+    try:
+        file_format = dataframe_file_format(file_path)
+        if file_format == "parquet":
+            # A directory is read as one dataset
+            return pq.read_table(file_path, columns=columns, use_threads=True).to_pandas()
+        if os.path.isdir(file_path):
+            return concat([read_dataframe(part, columns, dtypes) for part in dataframe_parts(file_path)], ignore_index=True)
+        if file_format == "feather":
+            return feather.read_table(file_path, columns=columns, use_threads=True).to_pandas()
+        df = read_csv(file_path, usecols=columns)
+        if dtypes:
+            df = df.astype({column: dtype for column, dtype in dtypes.items() if column in df.columns})
+        return df
+    except Exception as e:
+        raise MyException(e, sys) from e
+
+
+def iter_dataframe(file_path: str, chunk_rows: int, dtypes: dict = None):
+    """
+    Yields a DataFrame artifact a part at a time, without loading the whole file: Parquet and csv files
+    in parts of at most chunk_rows rows, feather files one stored record batch at a time.
+    The part files of a partitioned artifact are read one after the other.
+    dtypes: column -> dtype, only needed for csv files
+    """
+    try:
+        file_format = dataframe_file_format(file_path)
+        if os.path.isdir(file_path):
+            for part in dataframe_parts(file_path):
+                yield from iter_dataframe(part, chunk_rows, dtypes)
+        elif file_format == "parquet":
+            for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_rows):
+                yield batch.to_pandas()
+        elif file_format == "feather":
+            with pa.memory_map(file_path) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i).to_pandas()
+        else:
+            with read_csv(file_path, chunksize=chunk_rows) as reader:
+                for df in reader:
+                    yield df.astype({column: dtype for column, dtype in (dtypes or {}).items() if column in df.columns})
+    except Exception as e:
+        raise MyException(e, sys) from e
+
+
+class DataFrameFileWriter:
+    """
+    Writes a DataFrame artifact chunk by chunk, in the format given by the file extension.
+    Every chunk must have the columns and dtypes of the first one. Use as a context manager.
+    """
+
+    def __init__(self, file_path: str):
+        try:
+            self.file_path = file_path
+            self.file_format = dataframe_file_format(file_path)
+            self.writer = None
+            self.schema = None
+            self.n_rows = 0
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def write(self, df: DataFrame) -> None:
+        try:
+            if self.file_format == "csv":
+                df.to_csv(self.file_path, mode="a" if self.n_rows else "w", index=False, header=not self.n_rows)
+            else:
+                table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+                if self.writer is None:
+                    self.schema = table.schema
+                    if self.file_format == "parquet":
+                        self.writer = pq.ParquetWriter(self.file_path, self.schema)
+                    else:
+                        self.writer = pa.ipc.new_file(self.file_path, self.schema)
+                self.writer.write_table(table)
+            self.n_rows += len(df)
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 def save_object(file_path: str, obj: object) -> None:
     logging.info("Entered the save_object method of utils")
 
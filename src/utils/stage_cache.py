@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import shutil
+import inspect
+import hashlib
+from dataclasses import asdict, fields
+from src.exception import MyException
+from src.logger import logging
+
+MANIFEST_FILE_NAME = "artifact.json"
+
+
+def file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for chunk in iter(lambda: file_obj.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(source: str, destination: str) -> None:
+    if os.path.isdir(source):
+        # Partitioned artifacts: link every file of the directory
+        for name in os.listdir(source):
+            link_or_copy(os.path.join(source, name), os.path.join(destination, name))
+        return
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Different filesystem, or one without hard links
+        shutil.copy2(source, destination)
+
+
+class StageCache:
+    """
+    Content-addressed cache of pipeline stage artifacts. A stage's key hashes everything its output
+    depends on: the content of its input files, the keys of the stages it reads from, its config
+    dataclass and the source of the code that runs it. On a hit the cached files are hard linked
+    into the current run's artifact directory and the stage does not run.
+    """
+
+    def __init__(self, cache_dir: str, run_artifact_dir: str):
+        """
+        :param run_artifact_dir: artifact directory of the current run; config values under it are
+                                 per-run paths and are left out of the keys
+        """
+        self.cache_dir = cache_dir
+        self.run_artifact_dir = run_artifact_dir
+
+    def key(self, stage: str, config, code: list, input_files: list = (), upstream_keys: list = ()) -> str:
+        """
+        :param code: classes or modules whose source files make up the stage's code version
+        :param input_files: files the stage reads that no earlier stage produced
+        :param upstream_keys: keys of the stages whose artifacts this stage reads
+        """
+        try:
+            config_values = {
+                name: value for name, value in asdict(config).items()
+                if not (isinstance(value, str) and value.startswith(self.run_artifact_dir))
+            }
+            source_files = sorted({inspect.getsourcefile(obj) for obj in code})
+            parts = {
+                "stage": stage,
+                "config": config_values,
+                "code": {os.path.basename(path): file_digest(path) for path in source_files},
+                "inputs": [[os.path.basename(path), file_digest(path)] for path in input_files],
+                "upstream": list(upstream_keys),
+            }
+            return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def entry_dir(self, stage: str, key: str) -> str:
+        return os.path.join(self.cache_dir, stage, key)
+
+    def load(self, stage: str, key: str, artifact_class):
+        """
+        :return: the cached artifact with its files linked into the current run, None on a miss
+        """
+        try:
+            entry_dir = self.entry_dir(stage, key)
+            manifest_path = os.path.join(entry_dir, MANIFEST_FILE_NAME)
+            if not os.path.exists(manifest_path):
+                return None
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            values = dict(manifest["values"])
+            for name, relative_path in manifest["files"].items():
+                destination = os.path.join(self.run_artifact_dir, relative_path)
+                link_or_copy(os.path.join(entry_dir, relative_path), destination)
+                values[name] = destination
+            logging.info(f"Stage cache hit for {stage} ({key[:12]}), reusing its artifacts")
+            return artifact_class(**values)
+        except Exception as e:
+            raise MyException(e, sys)
+
+    def store(self, stage: str, key: str, artifact) -> None:
+        """
+        Adds a completed stage's artifact to the cache. Its files must already be on disk.
+        Artifacts with a field that is neither a file or directory of this run nor plain data are not cached.
+        """
+        try:
+            entry_dir = self.entry_dir(stage, key)
+            if os.path.exists(entry_dir):
+                return
+            manifest = {"files": {}, "values": {}}
+            for field in fields(artifact):
+                # Live objects handed to the next stage in memory are not part of the record
+                if not field.compare:
+                    continue
+                value = getattr(artifact, field.name)
+                if isinstance(value, str) and value.startswith(self.run_artifact_dir) and os.path.exists(value):
+                    manifest["files"][field.name] = os.path.relpath(value, self.run_artifact_dir)
+                elif isinstance(value, (bool, int, float, str)):
+                    manifest["values"][field.name] = value
+                else:
+                    # None is an artifact the stage was configured not to persist
+                    logging.info(f"Not caching {stage}: field {field.name} is not a stored file, directory or plain value")
+                    return
+            staging_dir = f"{entry_dir}.tmp-{os.getpid()}"
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            for relative_path in manifest["files"].values():
+                link_or_copy(os.path.join(self.run_artifact_dir, relative_path), os.path.join(staging_dir, relative_path))
+            os.makedirs(staging_dir, exist_ok=True)
+            with open(os.path.join(staging_dir, MANIFEST_FILE_NAME), "w") as manifest_file:
+                json.dump(manifest, manifest_file, indent=4)
+            try:
+                os.rename(staging_dir, entry_dir)
+            except OSError:
+                # Another run stored the same key first
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            logging.info(f"Stored the {stage} artifacts in the stage cache ({key[:12]})")
+        except Exception as e:
+            raise MyException(e, sys)
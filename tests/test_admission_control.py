@@ -0,0 +1,74 @@
+import time
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+from src.constants import APP_REQUEST_TIMEOUT_HEADER
+from src.metrics import DEADLINE_EXCEEDED, SHED_REQUESTS
+from src.pipline.admission_control import AdmissionController, RequestDeadline, ServiceOverloaded
+
+PAYLOAD = b'{"aa_000": [1.0]}'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Without the lifespan, so no model is loaded: these requests never get past admission
+    for name in ("inference_executor", "micro_batcher", "depth_controller"):
+        monkeypatch.setattr(app.state, name, None, raising=False)
+    return TestClient(app)
+
+
+def test_requests_over_capacity_are_shed_with_503(client, monkeypatch):
+    monkeypatch.setattr(app.state, "admission", AdmissionController(max_in_flight=0, retry_after_seconds=3), raising=False)
+    shed = SHED_REQUESTS.value
+
+    batch = client.post("/api/v1/predict/batch", content=PAYLOAD, headers={"Content-Type": "application/json"})
+    api = client.post("/predict?format=json", files={"file": ("trucks.json", PAYLOAD, "application/json")})
+    form = client.post("/predict", files={"file": ("trucks.json", PAYLOAD, "application/json")})
+
+    for response in (batch, api, form):
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+    assert "at capacity" in batch.json()["error"] and "at capacity" in api.json()["error"]
+    assert form.headers["content-type"].startswith("text/html")
+    assert SHED_REQUESTS.value == shed + 3
+
+
+def test_requests_past_their_deadline_get_504(client, monkeypatch):
+    admission = AdmissionController()
+    expired = RequestDeadline(0.001)
+    time.sleep(0.01)
+    monkeypatch.setattr(admission, "deadline_for", lambda headers: expired)
+    monkeypatch.setattr(app.state, "admission", admission, raising=False)
+    dropped = DEADLINE_EXCEEDED["upload_read"].value
+
+    batch = client.post("/api/v1/predict/batch", content=PAYLOAD, headers={"Content-Type": "application/json"})
+    api = client.post("/predict?format=json", files={"file": ("trucks.json", PAYLOAD, "application/json")})
+
+    for response in (batch, api):
+        assert response.status_code == 504
+        assert "deadline exceeded" in response.json()["error"]
+    assert DEADLINE_EXCEEDED["upload_read"].value == dropped + 2
+    # Rejected requests give their in-flight slot back
+    assert admission.in_flight == 0
+
+
+def test_the_deadline_comes_from_the_timeout_header():
+    admission = AdmissionController(default_timeout_seconds=30)
+    before = time.monotonic()
+    assert admission.deadline_for({APP_REQUEST_TIMEOUT_HEADER: "250"}).expires_at - before == pytest.approx(0.25, abs=0.05)
+    assert admission.deadline_for({APP_REQUEST_TIMEOUT_HEADER: "soon"}).expires_at - before == pytest.approx(30, abs=0.05)
+    assert AdmissionController(default_timeout_seconds=0).deadline_for({}).expires_at is None
+
+
+def test_admission_holds_a_slot_until_the_request_is_done():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1)
+        async with admission.admit({}):
+            with pytest.raises(ServiceOverloaded):
+                async with admission.admit({}):
+                    pass
+        async with admission.admit({}):
+            return admission.in_flight
+
+    assert asyncio.run(scenario()) == 1
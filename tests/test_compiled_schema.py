@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.exception import MyException
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.entity.schema import load_compiled_schema
+from src.pipline.prediction_pipeline import APSSensorDataFrame
+
+
+@pytest.fixture
+def schema():
+    return load_compiled_schema(APSSensorPredictorConfig().SCHEMA_FILE_PATH)
+
+
+@pytest.fixture
+def payload(schema) -> dict:
+    """
+    A dict-of-lists payload with missing values, the output column, the dropped columns and an unknown column
+    """
+    rng = np.random.default_rng(0)
+    payload = {}
+    for column in schema.feature_columns:
+        values = rng.lognormal(3, 2, size=20).tolist()
+        values[int(rng.integers(20))] = None
+        payload[column] = values
+    payload[schema.output_column] = ["neg"] * 20
+    for column in schema.drop_columns:
+        payload[column] = [0.0] * 20
+    payload["zz_999"] = [0.0] * 20
+    return payload
+
+
+def test_the_schema_is_compiled_once_per_file(schema):
+    assert load_compiled_schema(APSSensorPredictorConfig().SCHEMA_FILE_PATH) is schema
+    assert schema.output_column not in schema.feature_columns
+    assert not schema.drop_columns & set(schema.feature_columns)
+    assert [schema.feature_index[column] for column in schema.feature_columns] == list(range(len(schema.feature_columns)))
+
+
+def test_the_feature_matrix_matches_the_dataframe_path(schema, payload):
+    dataframe = APSSensorDataFrame(dictionary=payload)
+    expected = dataframe.final_input_data()[list(schema.feature_columns)].to_numpy(dtype=np.float64)
+
+    matrix = dataframe.final_input_matrix(dtype=np.float64)
+
+    assert matrix.shape == (20, len(schema.feature_columns))
+    np.testing.assert_array_equal(matrix, expected)
+    np.testing.assert_array_equal(dataframe.final_input_matrix(), expected.astype(np.float32))
+
+
+def test_only_the_requested_columns_are_parsed(schema, payload):
+    columns = schema.feature_columns[:3]
+    slim = {column: payload[column] for column in columns}
+
+    matrix = schema.to_feature_matrix(slim, dtype=np.float64, columns=columns)
+
+    np.testing.assert_array_equal(matrix[:, :3], pd.DataFrame(slim).to_numpy(dtype=np.float64))
+    assert np.isnan(matrix[:, 3:]).all()
+
+
+def test_missing_and_unexpected_columns_are_reported(schema, payload):
+    missing_column = schema.feature_columns[0]
+    del payload[missing_column]
+
+    assert schema.check_columns(payload) == ([missing_column], ["zz_999"])
+    assert schema.check_columns(payload, schema.feature_columns[1:]) == ([], ["zz_999"])
+    with pytest.raises(MyException):
+        APSSensorDataFrame(dictionary=payload).final_input_matrix()
+
+
+def test_ragged_columns_are_rejected(schema, payload):
+    payload[schema.feature_columns[-1]] = payload[schema.feature_columns[-1]][:-1]
+    with pytest.raises(MyException):
+        schema.to_feature_matrix(payload)
@@ -0,0 +1,63 @@
+import glob
+import numpy as np
+import pandas as pd
+import pytest
+from imblearn.pipeline import Pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import RobustScaler
+from xgboost import XGBClassifier
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.entity.schema import load_compiled_schema
+from src.entity.estimator import MyModel
+from src.utils.main_utils import load_json_payload
+from src.pipline.prediction_pipeline import ResidentModel
+from src.pipline.inference_executor import parse_payload
+
+TEST_PAYLOADS = sorted(glob.glob("Application test data/Input data/*.json"))
+
+
+def payload_frame(raw: bytes, columns: list) -> pd.DataFrame:
+    return pd.DataFrame(load_json_payload(raw))[columns].astype(np.float64)
+
+
+@pytest.fixture(scope="module")
+def resident():
+    """
+    Full-width model fitted on rows with the magnitudes of the real sensor payloads,
+    counters of up to 1e8 included
+    """
+    columns = list(load_compiled_schema(APSSensorPredictorConfig().SCHEMA_FILE_PATH).feature_columns)
+    payloads = []
+    for payload_path in TEST_PAYLOADS:
+        with open(payload_path, "rb") as payload_file:
+            payloads.append(payload_frame(payload_file.read(), columns))
+    rng = np.random.default_rng(0)
+    base = pd.concat(payloads, ignore_index=True).sample(2000, replace=True, random_state=0)
+    X = (base * rng.lognormal(0, 0.5, size=base.shape)).round().reset_index(drop=True)
+    y = (X[columns[0]].fillna(0) > X[columns[0]].median()).astype(int)
+    preprocessor = Pipeline([("imputer", SimpleImputer(strategy="median")), ("scaler", RobustScaler())])
+    model = XGBClassifier(n_estimators=20, max_depth=3, random_state=42).fit(preprocessor.fit_transform(X), y)
+    my_model = MyModel(model, preprocessor)
+    my_model.compile(input_columns=columns, prune=False)
+    return ResidentModel(model=my_model, version="test"), X, columns
+
+
+def test_compiled_transform_matches_the_pipeline(resident):
+    resident, X, _ = resident
+    model = resident.model
+
+    np.testing.assert_array_equal(model.transform(X), model.preprocessor.transform(X))
+
+
+@pytest.mark.parametrize("payload_path", TEST_PAYLOADS)
+def test_served_payload_matches_the_pipeline(resident, payload_path):
+    resident, _, columns = resident
+    model = resident.model
+    with open(payload_path, "rb") as payload_file:
+        raw = payload_file.read()
+
+    features = parse_payload(raw, "application/json", resident)
+    expected = model.preprocessor.transform(payload_frame(raw, columns)).astype(np.float32)
+
+    assert features.dtype == np.float64
+    np.testing.assert_array_equal(model.transform_used(features), expected)
@@ -0,0 +1,125 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src.components.data_ingestion import DataIngestion
+from src.constants import train_data_artifact_file, test_data_artifact_file, PREDICTION_ID_COLUMN
+from src.data_access import proj1_data
+from src.entity.config_entity import DataIngestionConfig, APSSensorPredictorConfig
+from src.entity.schema import load_compiled_schema
+from src.pipline.prediction_log import PredictionLogWriter
+from src.utils.main_utils import read_dataframe
+
+
+@pytest.fixture(scope="module")
+def raw_data() -> pd.DataFrame:
+    """
+    Raw sensor data in the layout of the original csv, with some rows repeated exactly
+    """
+    schema = load_compiled_schema(DataIngestionConfig().SCHEMA_FILE_PATH)
+    rng = np.random.default_rng(0)
+    columns = list(schema.feature_columns)
+    data = pd.DataFrame(rng.integers(0, 10 ** 6, size=(3000, len(columns))).astype(float), columns=columns)
+    data = data.mask(rng.random(data.shape) < 0.1)
+    data.insert(0, "class", np.where(rng.random(len(data)) < 0.1, "pos", "neg"))
+    duplicates = data.sample(100, random_state=0)
+    return pd.concat([data, duplicates], ignore_index=True).sample(frac=1, random_state=1).reset_index(drop=True)
+
+
+def ingest(tmp_path, monkeypatch, raw: pd.DataFrame, run: str, **config):
+    """
+    Ingests raw as the raw data, with a hash split unless config says otherwise, into an artifact
+    directory named after run
+    :return: (artifact, ingestion)
+    """
+    raw_dir = tmp_path / run / "source"
+    os.makedirs(raw_dir)
+    raw.to_csv(raw_dir / "aps_data.csv", index=False, na_rep="na")
+    monkeypatch.setattr(proj1_data, "raw_data_dir", str(raw_dir))
+    processed_dir = tmp_path / run / "processed_data"
+    ingestion = DataIngestion(DataIngestionConfig(
+        RAW_DATA_ARTIFACT_FILE=str(tmp_path / run / "raw_data" / "raw_data.parquet"),
+        TRAIN_DATA_ARTIFACT_FILE=str(processed_dir / train_data_artifact_file.replace("csv", "parquet")),
+        TEST_DATA_ARTIFACT_FILE=str(processed_dir / test_data_artifact_file.replace("csv", "parquet")),
+        **{"split_mode": "hash", "include_prediction_log": False, "persist_artifacts": True, **config}))
+    return ingestion.initiate_data_ingestion(), ingestion
+
+
+def partitions(artifact, ingestion: DataIngestion) -> tuple:
+    """
+    Train and test rows, read back from disk and ordered by row key so runs can be compared
+    """
+    frames = []
+    for path in (artifact.trained_file_path, artifact.test_file_path):
+        frame = read_dataframe(path).astype({"class": str})
+        keys = ingestion.row_keys(frame)
+        frames.append(frame.iloc[np.argsort(keys, kind="stable")].reset_index(drop=True))
+    return tuple(frames)
+
+
+def test_exact_duplicate_rows_are_ingested_once(tmp_path, monkeypatch, raw_data):
+    artifact, ingestion = ingest(tmp_path, monkeypatch, raw_data, "full")
+    train, test = partitions(artifact, ingestion)
+    assert len(train) + len(test) == len(raw_data.drop_duplicates())
+
+
+def test_appending_then_reingesting_gives_identical_partitions(tmp_path, monkeypatch, raw_data):
+    first_day, _ = ingest(tmp_path, monkeypatch, raw_data[:1500], "day1")
+    appended, ingestion = ingest(tmp_path, monkeypatch, raw_data, "day2",
+                                 append_to=os.path.dirname(first_day.trained_file_path))
+    reingested, _ = ingest(tmp_path, monkeypatch, raw_data, "reingest")
+
+    for appended_rows, reingested_rows in zip(partitions(appended, ingestion), partitions(reingested, ingestion)):
+        pd.testing.assert_frame_equal(appended_rows, reingested_rows)
+    # The first day's rows are linked, not copied, and the rows appended are a new part file
+    train_parts = sorted(name for name in os.listdir(appended.trained_file_path) if name.startswith("part-"))
+    assert len(train_parts) == 2
+    assert os.stat(os.path.join(appended.trained_file_path, train_parts[0])).st_nlink == 2
+
+
+def test_appending_the_same_raw_data_again_adds_no_rows(tmp_path, monkeypatch, raw_data):
+    first, ingestion = ingest(tmp_path, monkeypatch, raw_data, "day1")
+    again, _ = ingest(tmp_path, monkeypatch, raw_data, "day2", append_to=os.path.dirname(first.trained_file_path))
+    for first_rows, again_rows in zip(partitions(first, ingestion), partitions(again, ingestion)):
+        pd.testing.assert_frame_equal(first_rows, again_rows)
+
+
+def test_chunked_and_whole_ingestion_give_the_same_hash_split(tmp_path, monkeypatch, raw_data):
+    whole, ingestion = ingest(tmp_path, monkeypatch, raw_data, "whole")
+    chunked, _ = ingest(tmp_path, monkeypatch, raw_data, "chunked", chunk_rows=700)
+    for whole_rows, chunked_rows in zip(partitions(whole, ingestion), partitions(chunked, ingestion)):
+        pd.testing.assert_frame_equal(whole_rows, chunked_rows)
+
+
+def test_chunked_random_split_keeps_every_class_share(tmp_path, monkeypatch, raw_data):
+    artifact, _ = ingest(tmp_path, monkeypatch, raw_data, "chunked", chunk_rows=700, split_mode="random")
+    train = read_dataframe(artifact.trained_file_path)
+    test = read_dataframe(artifact.test_file_path)
+    assert len(train) + len(test) == len(raw_data)
+    ratio = DataIngestionConfig().train_test_split_ratio
+    for label, n_rows in raw_data["class"].value_counts().items():
+        assert abs((test["class"] == label).sum() - n_rows * ratio) <= 1
+
+
+def test_chunked_and_whole_ingestion_add_the_same_labelled_prediction_log_rows(tmp_path, monkeypatch, raw_data):
+    log_dir, outcome_dir = str(tmp_path / "prediction_log"), str(tmp_path / "prediction_outcomes")
+    writer = PredictionLogWriter(APSSensorPredictorConfig(prediction_log_dir=log_dir, prediction_log_rotate_rows=100))
+    os.makedirs(log_dir)
+    features = raw_data[list(writer.schema.feature_columns)][-300:].to_numpy(dtype=np.float32) + 0.5
+    prediction_ids = [f"p{i}" for i in range(len(features))]
+    for start in range(0, len(features), 60):
+        writer.log(features[start:start + 60], ["neg"] * 60, [0.1] * 60, "v1", 100, prediction_ids[start:start + 60])
+        writer.flush()
+    writer.start()
+    writer.close()
+    os.makedirs(outcome_dir)
+    pd.DataFrame({PREDICTION_ID_COLUMN: prediction_ids[::3], "class": "pos"}).to_csv(
+        os.path.join(outcome_dir, "outcomes.csv"), index=False)
+
+    log_config = {"include_prediction_log": True, "prediction_log_dir": log_dir, "prediction_outcome_dir": outcome_dir}
+    whole, ingestion = ingest(tmp_path, monkeypatch, raw_data, "whole", **log_config)
+    chunked, _ = ingest(tmp_path, monkeypatch, raw_data, "chunked", chunk_rows=70, **log_config)
+    whole_rows, chunked_rows = partitions(whole, ingestion), partitions(chunked, ingestion)
+    for whole_partition, chunked_partition in zip(whole_rows, chunked_rows):
+        pd.testing.assert_frame_equal(whole_partition, chunked_partition)
+    assert sum(len(partition) for partition in whole_rows) == len(raw_data.drop_duplicates()) + 100
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src.exception import MyException
+from src.utils.main_utils import save_dataframe, read_dataframe, iter_dataframe, dataframe_file_format, DataFrameFileWriter
+
+DTYPES = {"aa_000": "float32", "ab_000": "float32", "class": pd.CategoricalDtype(["neg", "pos"])}
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "class": rng.choice(["neg", "pos"], size=250),
+        "aa_000": rng.integers(0, 10 ** 6, size=250).astype(float),
+        "ab_000": np.where(rng.random(250) < 0.2, np.nan, rng.random(250)),
+    })
+
+
+@pytest.mark.parametrize("extension", ["parquet", "feather", "csv"])
+def test_artifacts_keep_the_schema_types(tmp_path, frame, extension):
+    path = str(tmp_path / f"train.{extension}")
+    save_dataframe(path, frame, dtypes=DTYPES)
+    # Only csv needs the types again, the columnar formats store them
+    loaded = read_dataframe(path, dtypes=DTYPES if extension == "csv" else None)
+    pd.testing.assert_frame_equal(loaded, frame.astype(DTYPES))
+    assert read_dataframe(path, columns=["aa_000"], dtypes=DTYPES).columns.tolist() == ["aa_000"]
+
+
+@pytest.mark.parametrize("extension", ["parquet", "feather", "csv"])
+def test_chunked_writes_and_reads_give_back_the_whole_frame(tmp_path, frame, extension):
+    path = str(tmp_path / f"train.{extension}")
+    typed = frame.astype(DTYPES)
+    with DataFrameFileWriter(path) as writer:
+        for start in range(0, len(typed), 100):
+            writer.write(typed[start:start + 100])
+
+    chunks = list(iter_dataframe(path, chunk_rows=60, dtypes=DTYPES))
+    if extension != "feather":
+        assert max(len(chunk) for chunk in chunks) <= 60
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), typed)
+    pd.testing.assert_frame_equal(read_dataframe(path, dtypes=DTYPES), typed)
+
+
+def test_a_directory_of_parts_is_read_as_one_artifact(tmp_path, frame):
+    partition_dir = tmp_path / "train"
+    typed = frame.astype(DTYPES)
+    save_dataframe(str(partition_dir / "part-1.parquet"), typed[:150])
+    save_dataframe(str(partition_dir / "part-2.parquet"), typed[150:])
+    # Files starting with _ are not parts
+    np.save(partition_dir / "_keys-1.npy", np.arange(150, dtype=np.uint64))
+
+    assert dataframe_file_format(str(partition_dir)) == "parquet"
+    pd.testing.assert_frame_equal(read_dataframe(str(partition_dir)), typed)
+    pd.testing.assert_frame_equal(pd.concat(iter_dataframe(str(partition_dir), chunk_rows=1000), ignore_index=True), typed)
+
+    save_dataframe(str(partition_dir / "part-3.csv"), typed[:1])
+    with pytest.raises(ValueError):
+        dataframe_file_format(str(partition_dir))
+
+
+def test_unknown_formats_are_rejected(tmp_path, frame):
+    with pytest.raises(MyException):
+        save_dataframe(str(tmp_path / "train.xlsx"), frame)
+    assert not os.path.exists(tmp_path / "train.xlsx")
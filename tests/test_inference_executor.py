@@ -0,0 +1,41 @@
+import time
+import asyncio
+import threading
+import pytest
+from src.pipline.inference_executor import BoundedInferenceExecutor
+from src.pipline.admission_control import RequestDeadline, DeadlineExceeded
+
+
+def test_at_most_capacity_jobs_are_admitted_and_the_rest_wait():
+    release = threading.Event()
+
+    async def scenario():
+        executor = BoundedInferenceExecutor(max_workers=1, max_queue_size=1)
+        jobs = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(4)]
+        await asyncio.sleep(0.1)
+        # One job runs, one is queued on the pool and two wait on the event loop
+        admitted, depth = executor.admitted, executor.queue_depth
+        release.set()
+        await asyncio.gather(*jobs)
+        executor.shutdown()
+        return admitted, depth, executor.queue_depth
+
+    assert asyncio.run(scenario()) == (2, 3, 0)
+
+
+def test_a_job_whose_deadline_passed_while_waiting_is_dropped():
+    ran = []
+
+    async def scenario():
+        executor = BoundedInferenceExecutor(max_workers=1, max_queue_size=0)
+        busy = asyncio.ensure_future(executor.run(time.sleep, 0.2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(DeadlineExceeded) as dropped:
+            await executor.run(ran.append, "scored", deadline=RequestDeadline(0.05))
+        await busy
+        executor.shutdown()
+        return dropped.value
+
+    dropped = asyncio.run(scenario())
+    assert dropped.stage == "inference_queue"
+    assert ran == []
@@ -0,0 +1,98 @@
+import time
+import asyncio
+import numpy as np
+import pytest
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.pipline.micro_batching import APSSensorMicroBatcher
+from src.pipline.admission_control import RequestDeadline, DeadlineExceeded, ServiceOverloaded
+
+
+class RecordingExecutor:
+    """
+    Stands in for BoundedInferenceExecutor: records every batch instead of scoring it, and
+    labels each row with its first feature so callers can check they got their own rows back
+    """
+
+    max_workers = 2
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches = []
+
+    async def run(self, func, features, n_trees, resident, deadline=None):
+        self.batches.append(len(features))
+        await asyncio.sleep(self.delay)
+        return {"class": [f"row{int(row[0])}" for row in features],
+                "probability": [float(row[0]) for row in features], "model_version": "test"}
+
+
+def rows(*ids) -> np.ndarray:
+    return np.array([[row_id, 0.0] for row_id in ids], dtype=np.float32)
+
+
+async def batcher_for(executor, max_size: int = 64, max_wait_ms: float = 50) -> APSSensorMicroBatcher:
+    config = APSSensorPredictorConfig(micro_batch_max_size=max_size, micro_batch_max_wait_ms=max_wait_ms)
+    batcher = APSSensorMicroBatcher(executor, config)
+    await batcher.start()
+    return batcher
+
+
+def test_concurrent_requests_are_coalesced_into_one_batch():
+    async def scenario():
+        executor = RecordingExecutor()
+        batcher = await batcher_for(executor)
+        results = await asyncio.gather(batcher.predict(rows(1)), batcher.predict(rows(2, 3)), batcher.predict(rows(4)))
+        await batcher.stop()
+        return executor, results
+
+    executor, results = asyncio.run(scenario())
+    assert executor.batches == [4]
+    assert [result["class"] for result in results] == [["row1"], ["row2", "row3"], ["row4"]]
+    assert all(result["model_version"] == "test" for result in results)
+
+
+def test_a_full_batch_is_flushed_without_waiting():
+    async def scenario():
+        executor = RecordingExecutor()
+        batcher = await batcher_for(executor, max_size=2, max_wait_ms=10000)
+        started = time.perf_counter()
+        results = await asyncio.gather(batcher.predict(rows(1)), batcher.predict(rows(2)))
+        elapsed = time.perf_counter() - started
+        await batcher.stop()
+        return executor, results, elapsed
+
+    executor, results, elapsed = asyncio.run(scenario())
+    assert executor.batches == [2]
+    assert [result["class"] for result in results] == [["row1"], ["row2"]]
+    assert elapsed < 5
+
+
+def test_requests_past_their_deadline_are_dropped_before_scoring():
+    async def scenario():
+        executor = RecordingExecutor()
+        batcher = await batcher_for(executor, max_wait_ms=50)
+        expired = RequestDeadline(0.001)
+        results = await asyncio.gather(batcher.predict(rows(1), deadline=expired),
+                                       batcher.predict(rows(2), deadline=RequestDeadline(30)),
+                                       return_exceptions=True)
+        await batcher.stop()
+        return executor, results
+
+    executor, (dropped, scored) = asyncio.run(scenario())
+    assert isinstance(dropped, DeadlineExceeded) and dropped.stage == "micro_batch"
+    assert scored["class"] == ["row2"]
+    assert executor.batches == [1]
+
+
+def test_stopping_rejects_the_requests_still_waiting():
+    async def scenario():
+        executor = RecordingExecutor()
+        batcher = await batcher_for(executor, max_wait_ms=10000)
+        waiting = asyncio.ensure_future(batcher.predict(rows(1)))
+        await asyncio.sleep(0.05)
+        await batcher.stop()
+        with pytest.raises(ServiceOverloaded):
+            await waiting
+        return executor
+
+    assert asyncio.run(scenario()).batches == []
@@ -0,0 +1,53 @@
+import os
+from src.cloud_storage.model_cache import LocalModelCache
+
+BUCKET, KEY = "models", "model.pkl"
+
+
+def test_a_cached_model_is_served_for_its_etag_only(tmp_path):
+    cache = LocalModelCache(cache_dir=str(tmp_path), max_bytes=1024)
+    cache.put(BUCKET, KEY, '"etag-1"', b"model one")
+    assert cache.get(BUCKET, KEY, '"etag-1"') == b"model one"
+    # A newly pushed model has another ETag, so it is never served from the old entry
+    assert cache.get(BUCKET, KEY, '"etag-2"') is None
+
+
+def test_a_corrupt_entry_is_discarded(tmp_path):
+    cache = LocalModelCache(cache_dir=str(tmp_path), max_bytes=1024)
+    cache.put(BUCKET, KEY, '"etag-1"', b"model one")
+    path = cache.cache_path(BUCKET, KEY, '"etag-1"')
+    with open(path, "wb") as model_file:
+        model_file.write(b"model on")
+
+    assert cache.get(BUCKET, KEY, '"etag-1"') is None
+    assert not os.path.exists(path) and not os.path.exists(path + ".sha256")
+
+
+def test_an_entry_without_its_checksum_is_a_miss(tmp_path):
+    cache = LocalModelCache(cache_dir=str(tmp_path), max_bytes=1024)
+    cache.put(BUCKET, KEY, '"etag-1"', b"model one")
+    os.remove(cache.cache_path(BUCKET, KEY, '"etag-1"') + ".sha256")
+    assert cache.get(BUCKET, KEY, '"etag-1"') is None
+
+
+def test_the_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LocalModelCache(cache_dir=str(tmp_path), max_bytes=25)
+    for i, etag in enumerate(('"etag-1"', '"etag-2"')):
+        cache.put(BUCKET, KEY, etag, b"0123456789")
+        # Entries age by modification time; spell it out so the order does not depend on the clock
+        os.utime(cache.cache_path(BUCKET, KEY, etag), (1000 + i, 1000 + i))
+    # Reading the first entry makes the second one the least recently used
+    assert cache.get(BUCKET, KEY, '"etag-1"') == b"0123456789"
+
+    cache.put(BUCKET, KEY, '"etag-3"', b"0123456789")
+
+    assert cache.get(BUCKET, KEY, '"etag-2"') is None
+    assert cache.get(BUCKET, KEY, '"etag-1"') == b"0123456789"
+    assert cache.get(BUCKET, KEY, '"etag-3"') == b"0123456789"
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".model")]) == 2
+
+
+def test_the_entry_just_written_is_kept_even_when_larger_than_the_cache(tmp_path):
+    cache = LocalModelCache(cache_dir=str(tmp_path), max_bytes=4)
+    cache.put(BUCKET, KEY, '"etag-1"', b"0123456789")
+    assert cache.get(BUCKET, KEY, '"etag-1"') == b"0123456789"
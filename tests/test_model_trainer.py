@@ -0,0 +1,45 @@
+import numpy as np
+from sklearn.model_selection import train_test_split
+from xgboost import XGBClassifier
+from src.entity.config_entity import ModelTrainerConfig
+from src.components.model_trainer import ModelTrainer
+
+
+def make_data(n_rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, 20)).astype(np.float32)
+    y = (X[:, 0] + X[:, 1] + 0.3 * rng.normal(size=n_rows) > 2.5).astype(int)
+    return X, y
+
+
+def test_first_stage_threshold_is_below_every_positive():
+    rng = np.random.default_rng(0)
+    y = (rng.random(5000) < 0.05).astype(int)
+    p_first = np.clip(rng.normal(0.1 + 0.5 * y, 0.15), 0, 1)
+    threshold = ModelTrainer(ModelTrainerConfig(), None).first_stage_threshold(p_first, y)
+
+    assert not (p_first[y == 1] < threshold).any()
+    assert (p_first[y == 0] < threshold).any()
+
+
+def test_cascade_clears_no_calibration_or_test_positive():
+    config = ModelTrainerConfig(model_n_estimators=100)
+    trainer = ModelTrainer(config, None)
+    X_train, y_train = make_data(8000, seed=1)
+    X_test, y_test = make_data(3000, seed=2)
+    model = XGBClassifier(random_state=42, n_estimators=100, max_depth=3).fit(X_train, y_train)
+    full_cost = trainer.custom_metric(y_test, model.predict(X_test))
+
+    first_stage = trainer.build_first_stage(model, X_train, y_train, X_test, y_test, full_cost)
+
+    assert first_stage is not None
+    first_stage_model, features, threshold, summary = first_stage
+    # Same held-out split build_first_stage tuned the threshold on
+    _, X_calibration, _, y_calibration = train_test_split(
+        X_train, y_train, test_size=config.cascade_calibration_size, stratify=y_train, random_state=42)
+    for X, y in ((X_calibration, y_calibration), (X_test, y_test)):
+        early_exit = first_stage_model.predict_proba(X[:, features])[:, 1] < threshold
+        assert early_exit.any()
+        assert not (early_exit & (y == 1)).any()
+    assert summary["cleared_positives"] == 0
+    assert summary["total_cost"] <= full_cost
@@ -0,0 +1,73 @@
+import io
+import json
+import numpy as np
+import pyarrow as pa
+import pytest
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.entity.schema import load_compiled_schema
+from src.pipline.inference_executor import parse_payload, NPY_CONTENT_TYPE, ARROW_STREAM_CONTENT_TYPE
+
+SCHEMA = load_compiled_schema(APSSensorPredictorConfig().SCHEMA_FILE_PATH)
+
+
+@pytest.fixture
+def features() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    features = rng.lognormal(3, 2, size=(30, len(SCHEMA.feature_columns)))
+    features[rng.random(features.shape) < 0.1] = np.nan
+    return features
+
+
+def json_payload(features: np.ndarray) -> bytes:
+    return json.dumps({
+        column: [None if np.isnan(value) else value for value in features[:, i].tolist()]
+        for i, column in enumerate(SCHEMA.feature_columns)
+    }).encode()
+
+
+def npy_payload(features: np.ndarray, fortran_order: bool = False) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, np.asfortranarray(features) if fortran_order else features)
+    return buffer.getvalue()
+
+
+def arrow_payload(features: np.ndarray, columns=SCHEMA.feature_columns, extra: dict = None) -> bytes:
+    table = pa.table({**{column: features[:, SCHEMA.feature_index[column]] for column in columns}, **(extra or {})})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def test_npy_and_arrow_payloads_decode_like_json(features):
+    expected = parse_payload(json_payload(features), "application/json")
+    np.testing.assert_array_equal(expected, features)
+
+    for raw, content_type in (
+        (npy_payload(features), NPY_CONTENT_TYPE),
+        (npy_payload(features, fortran_order=True), NPY_CONTENT_TYPE),
+        (arrow_payload(features), f"{ARROW_STREAM_CONTENT_TYPE}; charset=binary"),
+    ):
+        matrix = parse_payload(raw, content_type)
+        assert matrix.dtype == expected.dtype
+        np.testing.assert_array_equal(matrix, expected)
+
+
+def test_a_npy_payload_is_not_copied():
+    features = np.ones((4, len(SCHEMA.feature_columns)))
+    matrix = parse_payload(npy_payload(features), NPY_CONTENT_TYPE)
+    assert not matrix.flags.owndata and not matrix.flags.writeable
+
+
+def test_arrow_columns_are_matched_by_name(features):
+    raw = arrow_payload(features, SCHEMA.feature_columns[::-1], extra={"zz_999": np.zeros(len(features))})
+    np.testing.assert_array_equal(parse_payload(raw, ARROW_STREAM_CONTENT_TYPE), features)
+
+
+def test_malformed_binary_payloads_are_rejected(features):
+    with pytest.raises(ValueError):
+        parse_payload(npy_payload(features[:, :-1]), NPY_CONTENT_TYPE)
+    with pytest.raises(ValueError):
+        parse_payload(npy_payload(np.array([[None] * len(SCHEMA.feature_columns)], dtype=object)), NPY_CONTENT_TYPE)
+    with pytest.raises(ValueError):
+        parse_payload(arrow_payload(features, SCHEMA.feature_columns[1:]), ARROW_STREAM_CONTENT_TYPE)
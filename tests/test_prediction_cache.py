@@ -0,0 +1,74 @@
+import types
+import numpy as np
+import pytest
+from src.pipline import prediction_cache as prediction_cache_module
+from src.pipline.prediction_cache import PredictionCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Replaces the cache's monotonic clock with one the test moves forward by hand
+    """
+    now = [100.0]
+    monkeypatch.setattr(prediction_cache_module, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def keys(n: int) -> list:
+    return PredictionCache.row_keys(np.arange(n * 3, dtype=np.float32).reshape(n, 3))
+
+
+def test_equal_rows_share_a_key():
+    features = np.array([[np.nan, -0.0, 1.5], [np.nan, 0.0, 1.5]], dtype=np.float64)
+    first, second = PredictionCache.row_keys(features)
+    assert first == second
+    assert PredictionCache.row_keys(features.astype(np.float32))[0] != first
+
+
+def test_a_newer_model_empties_the_cache():
+    cache = PredictionCache(max_size=10, ttl_seconds=60)
+    cache.store("v1", keys(2), [("neg", 0.1), ("pos", 0.9)], generation=1)
+    assert cache.lookup("v1", keys(2), generation=1) == [("neg", 0.1), ("pos", 0.9)]
+
+    assert cache.lookup("v2", keys(2), generation=2) == [None, None]
+    assert cache.stats()["model_version"] == "v2"
+    assert cache.stats()["size"] == 0
+
+
+def test_an_older_model_bypasses_the_cache_without_emptying_it():
+    cache = PredictionCache(max_size=10, ttl_seconds=60)
+    cache.store("v2", keys(2), [("neg", 0.2), ("pos", 0.8)], generation=2)
+
+    # A request that was parsed before the swap finishes on the old model
+    assert cache.lookup("v1", keys(2), generation=1) == [None, None]
+    cache.store("v1", keys(2), [("neg", 0.1), ("pos", 0.9)], generation=1)
+
+    assert cache.stats()["model_version"] == "v2"
+    assert cache.lookup("v2", keys(2), generation=2) == [("neg", 0.2), ("pos", 0.8)]
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = PredictionCache(max_size=10, ttl_seconds=30)
+    cache.store("v1", keys(1), [("pos", 0.9)])
+    clock[0] += 29
+    assert cache.lookup("v1", keys(1)) == [("pos", 0.9)]
+    clock[0] += 2
+    assert cache.lookup("v1", keys(1)) == [None]
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = PredictionCache(max_size=2, ttl_seconds=60)
+    first, second, third = keys(3)
+    cache.store("v1", [first, second], [("neg", 0.1), ("neg", 0.2)])
+    # Reading the first entry makes the second one the least recently used
+    cache.lookup("v1", [first])
+    cache.store("v1", [third], [("pos", 0.9)])
+
+    assert cache.lookup("v1", [first, second, third]) == [("neg", 0.1), None, ("pos", 0.9)]
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
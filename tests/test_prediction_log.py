@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src.constants import PREDICTION_ID_COLUMN
+from src.data_access.proj1_data import Proj1Data
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.pipline.prediction_log import PredictionLogWriter
+
+
+@pytest.fixture(params=["parquet", "arrow"])
+def prediction_log(request, tmp_path):
+    """
+    A prediction log of 4 batches of 3 rows, rotated every 5 rows, and the outcomes recorded for
+    some of its predictions
+    :return: (log dir, outcome dir, every logged row as a DataFrame)
+    """
+    log_dir, outcome_dir = str(tmp_path / "log"), str(tmp_path / "outcomes")
+    config = APSSensorPredictorConfig(prediction_log_dir=log_dir, prediction_log_format=request.param,
+                                      prediction_log_rotate_rows=5)
+    writer = PredictionLogWriter(config)
+    os.makedirs(log_dir)
+    rng = np.random.default_rng(0)
+    n_features = len(writer.schema.feature_columns)
+    logged = []
+    for batch in range(4):
+        features = rng.lognormal(3, 2, size=(3, n_features)).astype(np.float32)
+        features[rng.random(features.shape) < 0.1] = np.nan
+        prediction_ids = [f"batch{batch}-{i}" for i in range(3)]
+        writer.log(features, ["neg", "pos", "neg"], [0.1, 0.9, 0.2], "v1", 100, prediction_ids)
+        # Flushed one batch at a time, so the log rotates between batches
+        writer.flush()
+        logged.append(pd.DataFrame(features, columns=list(writer.schema.feature_columns)).assign(
+            **{PREDICTION_ID_COLUMN: prediction_ids}))
+    # The writer thread completes the last file when it stops
+    writer.start()
+    writer.close()
+
+    os.makedirs(outcome_dir)
+    pd.DataFrame({PREDICTION_ID_COLUMN: ["batch0-1", "batch1-0", "batch3-2"], "class": ["pos", "neg", "neg"]}).to_csv(
+        os.path.join(outcome_dir, "outcomes_1.csv"), index=False)
+    # Recorded again later, the later outcome wins
+    pd.DataFrame({PREDICTION_ID_COLUMN: ["batch3-2"], "class": ["pos"]}).to_parquet(
+        os.path.join(outcome_dir, "outcomes_2.parquet"))
+    return log_dir, outcome_dir, pd.concat(logged, ignore_index=True)
+
+
+def test_the_log_is_read_in_batches_of_at_most_chunk_rows(prediction_log):
+    log_dir, outcome_dir, _ = prediction_log
+    batches = list(Proj1Data.iter_prediction_log(log_dir, chunk_rows=2))
+    assert all(len(batch) <= 2 for batch in batches)
+    assert sum(len(batch) for batch in batches) == 12
+
+    chunks = list(Proj1Data().iter_prediction_log_data(log_dir, outcome_dir, chunk_rows=2))
+    assert len(chunks) > 1
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True),
+                                  Proj1Data().get_prediction_log_data(log_dir, outcome_dir))
+
+
+def test_rotated_log_files_are_labelled_with_the_recorded_outcomes(prediction_log):
+    log_dir, outcome_dir, logged = prediction_log
+    # 3 rows per flush and a new file once 5 rows are written: files of 6, 6 rows
+    assert len(os.listdir(log_dir)) == 2
+    assert not [name for name in os.listdir(log_dir) if name.endswith(".inprogress")]
+
+    labelled = Proj1Data().get_prediction_log_data(log_dir, outcome_dir)
+
+    assert list(labelled[PREDICTION_ID_COLUMN]) == ["batch0-1", "batch1-0", "batch3-2"]
+    assert list(labelled["class"]) == ["pos", "neg", "pos"]
+    assert list(labelled["predicted_class"]) == ["pos", "neg", "neg"]
+    expected = logged.set_index(PREDICTION_ID_COLUMN).loc[labelled[PREDICTION_ID_COLUMN]].reset_index()
+    pd.testing.assert_frame_equal(labelled[expected.columns].reset_index(drop=True), expected, check_dtype=False)
+
+
+def test_unlabelled_predictions_are_left_out(prediction_log, tmp_path):
+    log_dir, _, _ = prediction_log
+    assert Proj1Data().get_prediction_log_data(log_dir, str(tmp_path / "no_outcomes")).empty
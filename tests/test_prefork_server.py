@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import signal
+import socket
+import subprocess
+import textwrap
+from src.metrics import MetricsRegistry, MultiprocessMetrics
+
+# Serves an app without a model, whose workers record when their startup begins and ends and
+# when they are asked to shut down
+SERVER_SCRIPT = textwrap.dedent("""
+    import os
+    import sys
+    import time
+    from src.entity.config_entity import APSSensorPredictorConfig
+    from src.pipline.prediction_pipeline import APSSensorModelHolder
+    from src.pipline.prefork_server import PreforkServer
+
+    events_path, port = sys.argv[1], int(sys.argv[2])
+
+    def record(event):
+        with open(events_path, "a") as events:
+            events.write(f"{event} {os.getpid()}\\n")
+
+    async def app(scope, receive, send):
+        while scope["type"] == "lifespan":
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                record("starting")
+                time.sleep(0.5)
+                record("ready")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                record("stopping")
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    APSSensorModelHolder.load = classmethod(lambda cls, *args, **kwargs: None)
+    PreforkServer(app, host="127.0.0.1", port=port, workers=2,
+                  APSSensor_predictor_config=APSSensorPredictorConfig(hot_reload_enabled=False)).run()
+""")
+
+
+def read_events(events_path) -> list:
+    if not os.path.exists(events_path):
+        return []
+    with open(events_path) as events:
+        return [tuple(line.split()) for line in events.read().splitlines()]
+
+
+def wait_for(condition, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_sighup_replaces_the_workers_one_at_a_time(tmp_path):
+    events_path = str(tmp_path / "events")
+    script_path = tmp_path / "server.py"
+    script_path.write_text(SERVER_SCRIPT)
+    server = subprocess.Popen([sys.executable, str(script_path), events_path, str(free_port())],
+                              env={**os.environ, "PYTHONPATH": os.getcwd()})
+    try:
+        wait_for(lambda: sum(event == "ready" for event, _ in read_events(events_path)) == 2)
+        old_workers = {pid for _, pid in read_events(events_path)}
+        server.send_signal(signal.SIGHUP)
+        wait_for(lambda: sum(event == "stopping" for event, _ in read_events(events_path)) == 2)
+        time.sleep(0.5)
+        events = read_events(events_path)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    assert server.returncode == 0
+
+    recycle = events[4:]
+    new_workers = [pid for event, pid in recycle if event == "starting"]
+    assert len(new_workers) == 2 and not old_workers & set(new_workers)
+    assert {pid for event, pid in recycle if event == "stopping"} == old_workers
+    # Only one replacement starts at a time, and an old worker is only stopped once its
+    # replacement is ready, so two workers are serving throughout
+    assert recycle.index(("starting", new_workers[1])) > recycle.index(("ready", new_workers[0]))
+    serving = 2
+    for event, pid in recycle:
+        serving += {"ready": 1, "stopping": -1}.get(event, 0)
+        assert serving >= 2
+
+
+def test_metrics_are_summed_over_the_workers(tmp_path):
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests")
+    queue_depth = registry.gauge("queue_depth", "Queue depth")
+    requests.inc(5)
+    metrics = MultiprocessMetrics(str(tmp_path), registry)
+    metrics.write_master_snapshot()
+
+    # Two workers forked from the master, which already counted 5
+    for pid, handled, depth in ((101, 3, 1), (102, 4, 2)):
+        metrics.forked()
+        requests.inc(handled)
+        queue_depth.set(depth)
+        metrics.write_snapshot(pid)
+        requests.inc(-handled)
+    rendered = MultiprocessMetrics(str(tmp_path), MetricsRegistry()).render()
+    assert "requests_total 12" in rendered
+    assert "queue_depth 3" in rendered
+
+    # An exited worker's requests stay counted, its gauges do not
+    metrics.archive(101)
+    rendered = MultiprocessMetrics(str(tmp_path), MetricsRegistry()).render()
+    assert "requests_total 12" in rendered
+    assert "queue_depth 2" in rendered
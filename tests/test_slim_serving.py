@@ -0,0 +1,57 @@
+import copy
+import glob
+import numpy as np
+import pandas as pd
+import pytest
+from imblearn.pipeline import Pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import RobustScaler
+from xgboost import XGBClassifier
+from src.entity.config_entity import APSSensorPredictorConfig
+from src.entity.schema import load_compiled_schema
+from src.entity.estimator import MyModel
+from src.pipline.prediction_pipeline import APSSensorPredictor, ResidentModel
+from src.pipline.inference_executor import parse_payload
+
+TEST_PAYLOADS = sorted(glob.glob("Application test data/Input data/*.json"))
+
+
+@pytest.fixture(scope="module")
+def residents():
+    """
+    The same small model compiled once for slim serving and once reading every column
+    """
+    schema = load_compiled_schema(APSSensorPredictorConfig().SCHEMA_FILE_PATH)
+    columns = list(schema.feature_columns)
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.lognormal(3, 2, size=(3000, len(columns))), columns=columns)
+    X = X.mask(rng.random(X.shape) < 0.1)
+    y = (X[columns[0]].fillna(0) + X[columns[5]].fillna(0) > 80).astype(int)
+    preprocessor = Pipeline([("imputer", SimpleImputer(strategy="median")), ("scaler", RobustScaler())])
+    model = XGBClassifier(n_estimators=30, max_depth=3, random_state=42).fit(preprocessor.fit_transform(X), y)
+    my_model = MyModel(model, preprocessor)
+    my_model.prune_features()
+
+    slim, full = my_model, copy.deepcopy(my_model)
+    slim.compile(input_columns=columns, prune=True)
+    full.compile(input_columns=columns, prune=False)
+    assert len(slim.serving_columns) < len(full.serving_columns)
+    return ResidentModel(model=slim, version="slim"), ResidentModel(model=full, version="full")
+
+
+@pytest.mark.parametrize("payload_path", TEST_PAYLOADS)
+def test_slim_and_full_predictions_are_identical(residents, payload_path):
+    slim, full = residents
+    with open(payload_path, "rb") as payload_file:
+        raw = payload_file.read()
+    predictor = APSSensorPredictor()
+
+    slim_features = parse_payload(raw, "application/json", slim)
+    full_features = parse_payload(raw, "application/json", full)
+    slim_result = predictor.predict_batch(slim_features, resident=slim)
+    full_result = predictor.predict_batch(full_features, resident=full)
+
+    # Columns the slim model does not read are never parsed
+    assert np.isnan(slim_features).sum() > np.isnan(full_features).sum()
+    assert slim_result["class"] == full_result["class"]
+    np.testing.assert_allclose(slim_result["probability"], full_result["probability"], rtol=1e-6)
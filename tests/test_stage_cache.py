@@ -0,0 +1,97 @@
+import os
+import importlib.util
+from dataclasses import dataclass, field
+import pytest
+from src.utils.stage_cache import StageCache
+
+
+@dataclass
+class ExampleConfig:
+    output_file_path: str
+    ratio: float = 0.2
+
+
+@dataclass
+class ExampleArtifact:
+    output_file_path: str
+    n_rows: int
+    # Handed to the next stage in memory, not part of the record
+    frame: object = field(default=None, compare=False)
+
+
+@pytest.fixture
+def stage(tmp_path):
+    """
+    A stage's code module and input file, and a cache shared by the runs of this test
+    :return: (cache dir, code module, input file)
+    """
+    code_path = tmp_path / "example_stage.py"
+    code_path.write_text("def run():\n    return 1\n")
+    spec = importlib.util.spec_from_file_location("example_stage", code_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    input_path = tmp_path / "input.csv"
+    input_path.write_text("a,b\n1,2\n")
+    return str(tmp_path / "cache"), module, str(input_path)
+
+
+def run_dir(tmp_path, run: str) -> str:
+    return str(tmp_path / "artifact" / run)
+
+
+def key_for(cache: StageCache, run_artifact_dir: str, stage, ratio: float = 0.2, upstream: tuple = ()) -> str:
+    _, module, input_path = stage
+    config = ExampleConfig(output_file_path=os.path.join(run_artifact_dir, "example", "output.csv"), ratio=ratio)
+    return cache.key("example", config, [module], [input_path], upstream)
+
+
+def test_a_stored_stage_is_reused_by_a_later_run(tmp_path, stage):
+    cache_dir = stage[0]
+    first_run = run_dir(tmp_path, "run1")
+    first = StageCache(cache_dir, first_run)
+    key = key_for(first, first_run, stage)
+    assert first.load("example", key, ExampleArtifact) is None
+
+    output_path = os.path.join(first_run, "example", "output.csv")
+    os.makedirs(os.path.dirname(output_path))
+    with open(output_path, "w") as output_file:
+        output_file.write("a,b\n1,2\n")
+    first.store("example", key, ExampleArtifact(output_file_path=output_path, n_rows=1, frame=object()))
+
+    second_run = run_dir(tmp_path, "run2")
+    second = StageCache(cache_dir, second_run)
+    # The config's per-run paths do not count, so the second run has the same key
+    assert key_for(second, second_run, stage) == key
+    artifact = second.load("example", key, ExampleArtifact)
+    assert artifact == ExampleArtifact(output_file_path=os.path.join(second_run, "example", "output.csv"), n_rows=1)
+    with open(artifact.output_file_path) as output_file:
+        assert output_file.read() == "a,b\n1,2\n"
+    assert os.stat(artifact.output_file_path).st_ino == os.stat(output_path).st_ino
+
+
+def test_the_key_changes_with_the_config_code_inputs_and_upstream_stages(tmp_path, stage):
+    run = run_dir(tmp_path, "run1")
+    cache = StageCache(stage[0], run)
+    key = key_for(cache, run, stage)
+    assert key_for(cache, run, stage) == key
+
+    assert key_for(cache, run, stage, ratio=0.3) != key
+    assert key_for(cache, run, stage, upstream=("0" * 64,)) != key
+
+    _, module, input_path = stage
+    with open(input_path, "a") as input_file:
+        input_file.write("3,4\n")
+    changed_input_key = key_for(cache, run, stage)
+    assert changed_input_key != key
+
+    with open(module.__file__, "a") as code_file:
+        code_file.write("\n\ndef helper():\n    return 2\n")
+    assert key_for(cache, run, stage) not in (key, changed_input_key)
+
+
+def test_an_artifact_that_was_not_persisted_is_not_cached(tmp_path, stage):
+    run = run_dir(tmp_path, "run1")
+    cache = StageCache(stage[0], run)
+    key = key_for(cache, run, stage)
+    cache.store("example", key, ExampleArtifact(output_file_path=None, n_rows=1))
+    assert cache.load("example", key, ExampleArtifact) is None